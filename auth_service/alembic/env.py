@@ -9,6 +9,9 @@ config = context.config
 fileConfig(config.config_file_name)
 target_metadata = Base.metadata  # Используем Base.metadata
 
+# Отдельная таблица версий: alembic_version в общей базе занята миграциями profile_service
+VERSION_TABLE = "alembic_version_auth"
+
 def run_migrations_offline():
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
@@ -16,6 +19,7 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        version_table=VERSION_TABLE,
     )
     with context.begin_transaction():
         context.run_migrations()
@@ -28,7 +32,8 @@ def run_migrations_online():
     )
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            version_table=VERSION_TABLE,
         )
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,30 @@
+"""Add case-insensitive indexes on users.login and users.mail
+
+Revision ID: e59a6fefbeb3
+Revises: ae05d10b95ff
+Create Date: 2026-10-18 12:14:37.502116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e59a6fefbeb3'
+down_revision: Union[str, None] = 'ae05d10b95ff'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_users_login_lower', 'users', [sa.text('lower(login)')], unique=True)
+    op.create_index('ix_users_mail_lower', 'users', [sa.text('lower(mail)')], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_mail_lower', table_name='users')
+    op.drop_index('ix_users_login_lower', table_name='users')
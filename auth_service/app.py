@@ -1,50 +1,56 @@
 #app.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, current_app
 from flask_restx import Api, Resource, fields
-from flask_jwt_extended import JWTManager, create_access_token
+from flask_jwt_extended import (
+    JWTManager, create_access_token, create_refresh_token, jwt_required, get_jwt, get_jwt_identity
+)
 from flask_caching import Cache
-from database import create_db_engine, create_session
-from models import User
-from schemas import UserSchema
-from prometheus_client import start_http_server, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from database import check_upsert_support, create_db_engine, create_replica_set, create_session, init_db
+from models import User, OutboxEvent, user_registered_event
+from hashing import HashingPoolBusy, hash_password, check_dummy_password
+from throttling import LoginThrottle
+from token_store import RefreshTokenStore
+from schemas import validate_user
+from migrate import run_migrations
+from bulk_import import import_users
+from export import ExportError, FORMATS, export_users, parse_since
+from sqlalchemy import insert, select, func
+from sqlalchemy.exc import IntegrityError
+from metrics import init_metrics, finish_request, metrics_view, request_db_stats
+from profiling import init_profiling
+from logs import configure_logging, bind_request_id, set_request_id_header
+from serialization import init_serialization, output_json
+from datetime import timedelta
+import redis
 import structlog
-import time
 import os
-from alembic import command
-from alembic.config import Config
-
-# Применение миграций
-alembic_cfg = Config("alembic.ini")
-command.upgrade(alembic_cfg, "head")
-
-# Настройка structlog для логирования
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.JSONRenderer()
-    ],
-    context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),
-    wrapper_class=structlog.BoundLogger,
-    cache_logger_on_first_use=True,
-)
+import io
+import hmac
+import uuid
 
-logger = structlog.get_logger()
+# Настройка structlog: запись через очередь в фоновом потоке, выборка успешных запросов
+configure_logging()
 
-app = Flask(__name__)
-api = Api(app)
+logger = structlog.get_logger()
 
-# Конфигурация JWT
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'fallback_secret_key')
-jwt = JWTManager(app)
+# Расширения создаются без приложения и подключаются в create_app()
+api = Api()
+# Ответы flask_restx кодируются orjson, а не json.dumps
+api.representations['application/json'] = output_json
+jwt = JWTManager()
+cache = Cache()
 
-# Конфигурация кэширования Redis
-app.config['CACHE_TYPE'] = 'RedisCache'
-app.config['CACHE_REDIS_URL'] = os.getenv('REDIS_URL', 'redis://redis:6379/0')
-cache = Cache(app)
+@jwt.additional_headers_loader
+def add_key_id(identity):
+    key_id = os.getenv('JWT_KEY_ID')
+    return {"kid": key_id} if key_id else {}
 
-# Создаем engine для подключения к базе данных
-engine = create_db_engine()
+@jwt.token_in_blocklist_loader
+def is_token_revoked(jwt_header, jwt_payload):
+    # Refresh-токены проверяет RefreshTokenStore.rotate; здесь только denylist access-токенов
+    if jwt_payload.get('type') != 'access':
+        return False
+    return current_app.extensions['refresh_token_store'].is_revoked(jwt_payload['jti'])
 
 # Модели для Swagger
 signup_model = api.model('SignUpModel', {
@@ -61,55 +67,111 @@ login_model = api.model('LoginModel', {
     "password": fields.String(required=True)
 })
 
-# Prometheus метрики
-REQUEST_COUNT = Counter('http_requests_total', 'Total number of HTTP requests')
-REQUEST_LATENCY = Histogram('http_request_latency_seconds', 'HTTP request latency in seconds')
-
-@app.before_request
 def before_request():
-    request.start_time = time.time()
-    logger.info("Request started", path=request.path)
+    bind_request_id()
 
-@app.after_request
 def after_request(response):
-    latency = time.time() - request.start_time
-    REQUEST_LATENCY.observe(latency)
-    logger.info("Request completed", path=request.path, latency=latency)
-    return response
+    latency = finish_request(response)
+    # sample=True: успешные быстрые запросы логируются с долей LOG_SAMPLE_RATE
+    logger.info("Request completed", path=request.path, method=request.method,
+                status=response.status_code, latency=latency, sample=True, **request_db_stats())
+    return set_request_id_header(response)
+
+def duplicate_user_message(error):
+    # Определяем нарушенное ограничение: имя из psycopg2 diag или текст ошибки драйвера
+    diag = getattr(error.orig, 'diag', None)
+    constraint = (getattr(diag, 'constraint_name', None) or str(error.orig)).lower()
+    if 'login' in constraint:
+        return "Пользователь с таким логином уже существует"
+    if 'mail' in constraint:
+        return "Пользователь с таким email уже существует"
+    return "Пользователь с таким логином или email уже существует"
+
+def existing_user_statement(login, mail):
+    """Занятый логин или email по индексам lower(): дешевле, чем bcrypt перед заведомо неудачным INSERT."""
+    return select(User.login).where(
+        (func.lower(User.login) == login.lower()) | (func.lower(User.mail) == mail.lower())
+    ).limit(1)
+
+def existing_user_message(existing_login, login):
+    if existing_login.lower() == login.lower():
+        return "Пользователь с таким логином уже существует"
+    return "Пользователь с таким email уже существует"
+
+def is_admin_request():
+    admin_token = current_app.config.get('ADMIN_TOKEN')
+    return bool(admin_token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token)
+
+def busy_response():
+    return {"success": False, "msg": "Сервис перегружен, повторите попытку позже"}, 503, {"Retry-After": "1"}
+
+def credentials_error(req_data):
+    """Текст ошибки, если в теле /login нет непустых строк login и password; иначе None."""
+    if not isinstance(req_data, dict):
+        return "Тело запроса должно быть JSON-объектом"
+    for field in ("login", "password"):
+        value = req_data.get(field)
+        if not isinstance(value, str) or not value:
+            return f"Поле '{field}' обязательно"
+    return None
+
+def issue_tokens(identity, family=None):
+    """Выдает access- и refresh-токен одного семейства; refresh-токен запоминается в Redis.
 
-@app.route('/metrics')
-def metrics():
-    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+    Если Redis недоступен, выдается только access-токен (refresh_token = None).
+    """
+    family = family or uuid.uuid4().hex
+    refresh_jti = str(uuid.uuid4())
+    access_token = create_access_token(identity=identity, additional_claims={"fam": family})
+    refresh_token = create_refresh_token(identity=identity, additional_claims={"fam": family, "jti": refresh_jti})
+    try:
+        current_app.extensions['refresh_token_store'].remember(refresh_jti, family, identity)
+    except Exception as e:
+        logger.warning("Refresh token store unavailable", error=str(e))
+        refresh_token = None
+    return access_token, refresh_token
 
 @api.route('/register')
 class Register(Resource):
     @api.expect(signup_model)
     def post(self):
         req_data = request.get_json()
-        schema = UserSchema()
-        errors = schema.validate(req_data)
+        errors = validate_user(req_data)
         if errors:
             return {"success": False, "msg": "Invalid data", "errors": errors}, 400
 
-        session = create_session(engine)
+        session = create_session()
         try:
-            existing_user = session.query(User).filter(
-                (User.login == req_data["login"]) | (User.mail == req_data["mail"])
-            ).first()
-            if existing_user:
-                return {"success": False, "msg": "Пользователь с таким логином или email уже существует"}, 400
-
-            new_user = User(
-                first_name=req_data["first_name"],
-                last_name=req_data["last_name"],
-                login=req_data["login"],
-                mail=req_data["mail"]
-            )
-            new_user.set_password(req_data["password"])
-            session.add(new_user)
+            # Повторная регистрация отсекается до bcrypt и не занимает пул хеширования
+            existing_login = session.execute(existing_user_statement(req_data["login"], req_data["mail"])).scalar()
+            if existing_login is not None:
+                return {"success": False, "msg": existing_user_message(existing_login, req_data["login"])}, 400
+            # Соединение не держим, пока считается хеш
+            session.rollback()
+            password_hash = hash_password(req_data["password"])
+            # Один INSERT ... RETURNING: одновременную регистрацию отсекают уникальные индексы БД
+            user_id = session.execute(
+                insert(User).values(
+                    first_name=req_data["first_name"],
+                    last_name=req_data["last_name"],
+                    login=req_data["login"],
+                    mail=req_data["mail"],
+                    password_hash=password_hash
+                ).returning(User.id)
+            ).scalar_one()
+            # Профиль создаст profile_service по этому событию (outbox.py -> consumer.py)
+            session.execute(insert(OutboxEvent).values(
+                **user_registered_event(user_id, req_data["first_name"], req_data["last_name"])
+            ))
             session.commit()
-            session.refresh(new_user)
-            return {"success": True, "userID": new_user.id, "msg": "Пользователь успешно зарегистрирован"}, 201
+            current_app.extensions['login_throttle'].forget_unknown(req_data["login"], req_data["mail"])
+            return {"success": True, "userID": user_id, "msg": "Пользователь успешно зарегистрирован"}, 201
+        except IntegrityError as e:
+            session.rollback()
+            return {"success": False, "msg": duplicate_user_message(e)}, 400
+        except HashingPoolBusy:
+            session.rollback()
+            return busy_response()
         except Exception as e:
             session.rollback()
             logger.error("Error during registration", error=str(e))
@@ -122,18 +184,221 @@ class Login(Resource):
     @api.expect(login_model)
     def post(self):
         req_data = request.get_json()
-        session = create_session(engine)
+        error = credentials_error(req_data)
+        if error:
+            return {"success": False, "msg": error}, 400
+        throttle = current_app.extensions['login_throttle']
+        # Лимиты проверяются до обращения к Postgres и bcrypt
+        allowed, retry_after = throttle.check(req_data["login"], request.remote_addr)
+        if not allowed:
+            return {"success": False, "msg": "Слишком много попыток входа, повторите позже"}, 429, {"Retry-After": str(retry_after)}
+
+        session = create_session()
         try:
-            user = session.query(User).filter(User.login == req_data["login"]).first()
-            if not user or not user.check_password(req_data["password"]):
+            if throttle.is_unknown(req_data["login"]):
+                check_dummy_password(req_data["password"])
+                return {"success": False, "msg": "Неверный логин или пароль"}, 401
+
+            # Вход по логину или почте без учета регистра (функциональные индексы lower())
+            login = req_data["login"].lower()
+            query = session.query(User).filter((func.lower(User.login) == login) | (func.lower(User.mail) == login))
+            # Сначала реплика; только что зарегистрированного пользователя там может еще не быть
+            user = query.execution_options(replica=True).first() or query.first()
+            if not user:
+                throttle.remember_unknown(req_data["login"])
+                check_dummy_password(req_data["password"])
                 return {"success": False, "msg": "Неверный логин или пароль"}, 401
-            access_token = create_access_token(identity=str(user.id))  # Преобразуем user.id в строку
-            return {"success": True, "msg": "Пользователь успешно авторизован", "access_token": access_token}, 200
+            if not user.check_password(req_data["password"]):
+                throttle.register_failure(req_data["login"])
+                return {"success": False, "msg": "Неверный логин или пароль"}, 401
+            throttle.register_success(req_data["login"])
+            if user.needs_rehash():
+                # Пересчитываем хеш под текущий BCRYPT_ROUNDS, пока известен пароль
+                try:
+                    user.set_password(req_data["password"])
+                    session.commit()
+                except HashingPoolBusy:
+                    session.rollback()
+            access_token, refresh_token = issue_tokens(str(user.id))  # Преобразуем user.id в строку
+            return {"success": True, "msg": "Пользователь успешно авторизован",
+                    "access_token": access_token, "refresh_token": refresh_token}, 200
+        except HashingPoolBusy:
+            return busy_response()
         except Exception as e:
             logger.error("Error during login", error=str(e))
             return {"success": False, "msg": str(e)}, 500
         finally:
             session.close()
 
+@api.route('/refresh')
+class Refresh(Resource):
+    @jwt_required(refresh=True)
+    def post(self):
+        # Без bcrypt и без Postgres: только проверка подписи и одна команда Redis
+        claims = get_jwt()
+        try:
+            rotated = current_app.extensions['refresh_token_store'].rotate(claims['jti'], claims.get('fam'))
+        except Exception as e:
+            logger.error("Refresh token store unavailable", error=str(e))
+            return busy_response()
+        if not rotated:
+            return {"success": False, "msg": "Refresh-токен уже использован или отозван"}, 401
+        access_token, refresh_token = issue_tokens(get_jwt_identity(), claims.get('fam'))
+        return {"success": True, "access_token": access_token, "refresh_token": refresh_token}, 200
+
+@api.route('/logout')
+class Logout(Resource):
+    @jwt_required(verify_type=False)
+    def post(self):
+        # Отзывает предъявленный токен и всю цепочку refresh-токенов сеанса
+        claims = get_jwt()
+        store = current_app.extensions['refresh_token_store']
+        try:
+            if claims['type'] == 'access':
+                store.revoke_access(claims['jti'], claims['exp'])
+            store.revoke_family(claims.get('fam'))
+        except Exception as e:
+            logger.error("Refresh token store unavailable", error=str(e))
+            return busy_response()
+        return {"success": True, "msg": "Сеанс завершен"}, 200
+
+@api.route('/admin/users/import')
+class UserImport(Resource):
+    @api.doc(params={'format': 'ndjson или csv', 'batch_size': 'Размер пачки (по умолчанию 1000)'})
+    def post(self):
+        if not is_admin_request():
+            return {"success": False, "msg": "Доступ запрещен"}, 403
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            return {"success": False, "msg": "Поддерживаются форматы ndjson и csv"}, 400
+        batch_size = request.args.get('batch_size', 1000, type=int)
+        if batch_size < 1:
+            return {"success": False, "msg": "batch_size должен быть положительным"}, 400
+
+        # Тело читается потоково, в памяти держится только текущая пачка
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        try:
+            report = import_users(current_app.extensions['db_engine'], stream, fmt, batch_size)
+        except Exception as e:
+            logger.error("Error during bulk import", error=str(e))
+            return {"success": False, "msg": str(e)}, 500
+        logger.info("Bulk import finished", imported=report["imported"], failed=report["failed"])
+        return {"success": True, **report}, 200
+
+@api.route('/admin/users/export')
+class UserExport(Resource):
+    @api.doc(params={'format': 'ndjson или csv', 'since': 'Только зарегистрированные с этой даты (ISO 8601)'})
+    def get(self):
+        """Потоковая выгрузка; при Accept-Encoding: gzip сжимается на лету."""
+        if not is_admin_request():
+            return {"success": False, "msg": "Доступ запрещен"}, 403
+        fmt = request.args.get('format', 'ndjson')
+        try:
+            since = parse_since(request.args.get('since'))
+            # Реплика, если есть: выгрузка не занимает соединения primary
+            engine = current_app.extensions['db_replicas'].choose() or current_app.extensions['db_engine']
+            compress = bool(request.accept_encodings['gzip'])
+            chunks = export_users(engine, fmt, since, compress)
+        except ExportError as e:
+            return {"success": False, "msg": str(e)}, 400
+        headers = {"Content-Disposition": f"attachment; filename=users.{fmt}", "Vary": "Accept-Encoding"}
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        return current_app.response_class(chunks, mimetype=FORMATS[fmt], headers=headers)
+
+def create_app(config=None):
+    """Создает приложение без обращений к БД и Redis: соединения открываются при первом запросе.
+
+    Миграции применяются отдельно: `python migrate.py` или `flask migrate`.
+    """
+    app = Flask(__name__)
+    # Ошибки JWT должны доходить до обработчиков flask_jwt_extended (401/422), а не превращаться в 500
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+
+    # Конфигурация JWT
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'fallback_secret_key')
+    # Для RS256/EdDSA токены подписываются закрытым ключом, сервисы проверяют их открытым
+    app.config['JWT_ALGORITHM'] = os.getenv('JWT_ALGORITHM', 'HS256')
+    if os.getenv('JWT_PRIVATE_KEY_FILE'):
+        with open(os.getenv('JWT_PRIVATE_KEY_FILE')) as f:
+            app.config['JWT_PRIVATE_KEY'] = f.read()
+    # Короткий access-токен продлевается через /refresh, а не повторным /login с bcrypt
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', 15)))
+    app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=int(os.getenv('JWT_REFRESH_TOKEN_DAYS', 30)))
+
+    # Конфигурация кэширования Redis
+    app.config['CACHE_TYPE'] = os.getenv('CACHE_TYPE', 'RedisCache')
+    app.config['CACHE_REDIS_URL'] = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+
+    # Токен для административных эндпоинтов (/admin/...); без него они недоступны
+    app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN')
+    # Профилирование медленных запросов: доля запросов под профайлером (0 — выключено), порог и куда писать
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_SLOW_MS'] = float(os.getenv('PROFILE_SLOW_MS', 500))
+    app.config['PROFILE_MODE'] = os.getenv('PROFILE_MODE', 'stack')
+    app.config['PROFILE_INTERVAL_MS'] = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', '/tmp/profiles')
+    # Ответы меньше порога не сжимаются: выигрыш в байтах меньше затрат на сжатие
+    app.config['COMPRESS_MIN_BYTES'] = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+
+    if config:
+        app.config.update(config)
+
+    api.init_app(app)
+    jwt.init_app(app)
+    cache.init_app(app)
+    # Клиент Redis подключается лениво, при первой команде
+    redis_client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+    app.extensions['login_throttle'] = LoginThrottle.from_env(redis_client)
+    app.extensions['refresh_token_store'] = RefreshTokenStore(
+        redis_client,
+        refresh_ttl=app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds(),
+        access_ttl=app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds(),
+    )
+
+    # Создаем engine для подключения к базе данных
+    engine = create_db_engine(app.config.get('DATABASE_URL'))
+    # Массовый импорт (/admin/users/import) пропускает дубликаты через INSERT ... ON CONFLICT
+    check_upsert_support(engine.dialect.name)
+    # Реплики для чтения (DATABASE_REPLICA_URLS через запятую); без них все запросы идут на primary
+    replicas = create_replica_set(app.config.get('DATABASE_REPLICA_URLS'))
+    init_db(app, engine, replicas)
+    app.extensions['db_engine'] = engine
+    app.extensions['db_replicas'] = replicas
+
+    # RED-метрики по шаблону маршрута, методу и статусу + время в БД/кэше
+    init_metrics(app, engine, replicas)
+    # Семплирующий профайлер медленных запросов; при PROFILE_SAMPLE_RATE=0 хуки не ставятся
+    init_profiling(app)
+    app.before_request(before_request)
+    app.after_request(after_request)
+    # orjson для jsonify и сжатие gzip/brotli; регистрируется последним, чтобы latency учитывала сжатие
+    init_serialization(app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Применяет миграции Alembic и завершается."""
+        run_migrations()
+
+    return app
+
+app = create_app()
+
+def run_asgi(port):
+    # Воркеры uvicorn — отдельные процессы: метрики собираются так же, как под gunicorn
+    import shutil
+    import uvicorn
+    workers = int(os.getenv('ASGI_WORKERS', 1))
+    if workers > 1:
+        path = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+    uvicorn.run('asgi:app', host='0.0.0.0', port=port, workers=workers)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001)
\ No newline at end of file
+    # SERVER_MODE=asgi: те же маршруты на Starlette + asyncpg (asgi.py), по умолчанию — Flask
+    if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+        run_asgi(5001)
+    else:
+        app.run(host='0.0.0.0', port=5001)
\ No newline at end of file
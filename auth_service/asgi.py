@@ -0,0 +1,269 @@
+#asgi.py
+# ASGI-режим сервиса на Starlette, async SQLAlchemy (asyncpg) и redis.asyncio.
+# Маршруты: /register, /login, /refresh, /logout, /metrics.
+# Только в WSGI-режиме: /admin/users/import и /admin/users/export — редкие административные выгрузки,
+# которым не нужен асинхронный сервер; их обслуживает Flask-приложение.
+# Запуск: SERVER_MODE=asgi python app.py или uvicorn asgi:app --port 5001 --workers 4
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import Response
+from starlette.routing import Route
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, PyJWTError
+from prometheus_client import CONTENT_TYPE_LATEST
+from sqlalchemy import insert, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from database import ReplicaSet, RoutingSession, create_async_db_engine, replica_urls
+from models import User, OutboxEvent, user_registered_event
+from hashing import (
+    HashingPoolBusy, hash_password_async, check_password_async, check_dummy_password_async, needs_rehash
+)
+from throttling import AsyncLoginThrottle
+from token_store import AsyncRefreshTokenStore
+from schemas import validate_user
+from metrics import MetricsMiddleware, instrument_engine, metrics_payload
+from logs import RequestLogMiddleware
+from serialization import CompressionMiddleware, FastJSONResponse
+import redis.asyncio as aioredis
+import structlog
+import uuid
+import app as wsgi
+
+logger = structlog.get_logger()
+
+
+def busy_response():
+    body, status, headers = wsgi.busy_response()
+    return FastJSONResponse(body, status, headers=headers)
+
+
+class AuthError(Exception):
+    def __init__(self, msg, status):
+        super().__init__(msg)
+        self.msg = msg
+        self.status = status
+
+
+def auth_error_response(request, exc):
+    return FastJSONResponse({"msg": exc.msg}, exc.status)
+
+
+async def issue_tokens(state, identity, family=None):
+    # Токены выпускает тот же flask_jwt_extended, что и в WSGI-режиме: формат claims и kid совпадают
+    family = family or uuid.uuid4().hex
+    refresh_jti = str(uuid.uuid4())
+    with state.flask_app.app_context():
+        access_token = create_access_token(identity=identity, additional_claims={"fam": family})
+        refresh_token = create_refresh_token(identity=identity, additional_claims={"fam": family, "jti": refresh_jti})
+    try:
+        await state.refresh_token_store.remember(refresh_jti, family, identity)
+    except Exception as e:
+        logger.warning("Refresh token store unavailable", error=str(e))
+        refresh_token = None
+    return access_token, refresh_token
+
+
+async def authenticate(request, refresh=False, verify_type=True):
+    """Возвращает claims токена; ответы об ошибках — как у flask_jwt_extended."""
+    header = request.headers.get('Authorization')
+    if not header:
+        raise AuthError("Missing Authorization Header", 401)
+    parts = header.split()
+    if len(parts) != 2 or parts[0] != 'Bearer':
+        raise AuthError("Bad Authorization header. Expected value 'Bearer <JWT>'", 422)
+    try:
+        with request.app.state.flask_app.app_context():
+            claims = decode_token(parts[1])
+    except ExpiredSignatureError:
+        raise AuthError("Token has expired", 401)
+    except (PyJWTError, JWTExtendedException) as e:
+        raise AuthError(str(e), 422)
+    if verify_type and claims.get('type') != ('refresh' if refresh else 'access'):
+        raise AuthError("Only refresh tokens are allowed" if refresh else "Only non-refresh tokens are allowed", 422)
+    if claims.get('type') == 'access' and await request.app.state.refresh_token_store.is_revoked(claims['jti']):
+        raise AuthError("Token has been revoked", 401)
+    return claims
+
+
+async def register(request):
+    req_data = await request.json()
+    errors = validate_user(req_data)
+    if errors:
+        return FastJSONResponse({"success": False, "msg": "Invalid data", "errors": errors}, 400)
+
+    state = request.app.state
+    try:
+        # Повторная регистрация отсекается до bcrypt и не занимает пул хеширования
+        async with state.sessionmaker() as session:
+            existing_login = (await session.execute(
+                wsgi.existing_user_statement(req_data["login"], req_data["mail"])
+            )).scalar()
+        if existing_login is not None:
+            return FastJSONResponse(
+                {"success": False, "msg": wsgi.existing_user_message(existing_login, req_data["login"])}, 400
+            )
+        password_hash = await hash_password_async(req_data["password"])
+        async with state.sessionmaker() as session:
+            user_id = (await session.execute(
+                insert(User).values(
+                    first_name=req_data["first_name"],
+                    last_name=req_data["last_name"],
+                    login=req_data["login"],
+                    mail=req_data["mail"],
+                    password_hash=password_hash
+                ).returning(User.id)
+            )).scalar_one()
+            await session.execute(insert(OutboxEvent).values(
+                **user_registered_event(user_id, req_data["first_name"], req_data["last_name"])
+            ))
+            await session.commit()
+    except IntegrityError as e:
+        return FastJSONResponse({"success": False, "msg": wsgi.duplicate_user_message(e)}, 400)
+    except HashingPoolBusy:
+        return busy_response()
+    except Exception as e:
+        logger.error("Error during registration", error=str(e))
+        return FastJSONResponse({"success": False, "msg": str(e)}, 500)
+
+    await state.login_throttle.forget_unknown(req_data["login"], req_data["mail"])
+    return FastJSONResponse({"success": True, "userID": user_id, "msg": "Пользователь успешно зарегистрирован"}, 201)
+
+
+async def login(request):
+    try:
+        req_data = await request.json()
+    except ValueError:
+        req_data = None
+    error = wsgi.credentials_error(req_data)
+    if error:
+        return FastJSONResponse({"success": False, "msg": error}, 400)
+    state = request.app.state
+    throttle = state.login_throttle
+    client_ip = request.client.host if request.client else None
+    allowed, retry_after = await throttle.check(req_data["login"], client_ip)
+    if not allowed:
+        return FastJSONResponse({"success": False, "msg": "Слишком много попыток входа, повторите позже"}, 429,
+                                headers={"Retry-After": str(retry_after)})
+
+    invalid = FastJSONResponse({"success": False, "msg": "Неверный логин или пароль"}, 401)
+    try:
+        if await throttle.is_unknown(req_data["login"]):
+            await check_dummy_password_async(req_data["password"])
+            return invalid
+
+        login = req_data["login"].lower()
+        statement = select(User).where((func.lower(User.login) == login) | (func.lower(User.mail) == login)).limit(1)
+        async with state.sessionmaker() as session:
+            user = (await session.execute(statement.execution_options(replica=True))).scalars().first() \
+                or (await session.execute(statement)).scalars().first()
+            if not user:
+                await throttle.remember_unknown(req_data["login"])
+                await check_dummy_password_async(req_data["password"])
+                return invalid
+            if not await check_password_async(req_data["password"], user.password_hash):
+                await throttle.register_failure(req_data["login"])
+                return invalid
+            await throttle.register_success(req_data["login"])
+            if needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = await hash_password_async(req_data["password"])
+                    await session.commit()
+                except HashingPoolBusy:
+                    await session.rollback()
+            user_id = user.id
+    except HashingPoolBusy:
+        return busy_response()
+    except Exception as e:
+        logger.error("Error during login", error=str(e))
+        return FastJSONResponse({"success": False, "msg": str(e)}, 500)
+
+    access_token, refresh_token = await issue_tokens(state, str(user_id))
+    return FastJSONResponse({"success": True, "msg": "Пользователь успешно авторизован",
+                             "access_token": access_token, "refresh_token": refresh_token}, 200)
+
+
+async def refresh(request):
+    claims = await authenticate(request, refresh=True)
+    state = request.app.state
+    try:
+        rotated = await state.refresh_token_store.rotate(claims['jti'], claims.get('fam'))
+    except Exception as e:
+        logger.error("Refresh token store unavailable", error=str(e))
+        return busy_response()
+    if not rotated:
+        return FastJSONResponse({"success": False, "msg": "Refresh-токен уже использован или отозван"}, 401)
+    access_token, refresh_token = await issue_tokens(state, claims['sub'], claims.get('fam'))
+    return FastJSONResponse({"success": True, "access_token": access_token, "refresh_token": refresh_token}, 200)
+
+
+async def logout(request):
+    claims = await authenticate(request, verify_type=False)
+    store = request.app.state.refresh_token_store
+    try:
+        if claims['type'] == 'access':
+            await store.revoke_access(claims['jti'], claims['exp'])
+        await store.revoke_family(claims.get('fam'))
+    except Exception as e:
+        logger.error("Refresh token store unavailable", error=str(e))
+        return busy_response()
+    return FastJSONResponse({"success": True, "msg": "Сеанс завершен"}, 200)
+
+
+async def metrics(request):
+    return Response(metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
+
+def create_app(config=None):
+    """Создает ASGI-приложение с настройками Flask-приложения; соединения открываются при первом запросе."""
+    flask_app = wsgi.app if config is None else wsgi.create_app(config)
+
+    engine = create_async_db_engine(flask_app.config.get('DATABASE_URL'))
+    instrument_engine(engine.sync_engine)
+    replica_engines = [create_async_db_engine(url) for url in replica_urls(flask_app.config.get('DATABASE_REPLICA_URLS'))]
+    for replica in replica_engines:
+        instrument_engine(replica.sync_engine)
+    redis_client = aioredis.Redis.from_url(flask_app.config['CACHE_REDIS_URL'])
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await redis_client.aclose()
+        await engine.dispose()
+        for replica in replica_engines:
+            await replica.dispose()
+
+    routes = [
+        Route('/register', register, methods=['POST']),
+        Route('/login', login, methods=['POST']),
+        Route('/refresh', refresh, methods=['POST']),
+        Route('/logout', logout, methods=['POST']),
+        Route('/metrics', metrics, methods=['GET']),
+    ]
+    app = Starlette(
+        routes=routes,
+        middleware=[
+            Middleware(RequestLogMiddleware),
+            Middleware(MetricsMiddleware, routes=routes),
+            Middleware(CompressionMiddleware, minimum_size=flask_app.config['COMPRESS_MIN_BYTES']),
+        ],
+        exception_handlers={AuthError: auth_error_response},
+        lifespan=lifespan,
+    )
+    app.state.flask_app = flask_app
+    app.state.engine = engine
+    app.state.replicas = ReplicaSet([replica.sync_engine for replica in replica_engines])
+    app.state.sessionmaker = async_sessionmaker(engine, expire_on_commit=False,
+                                                sync_session_class=RoutingSession, replicas=app.state.replicas)
+    app.state.login_throttle = AsyncLoginThrottle.from_env(redis_client)
+    app.state.refresh_token_store = AsyncRefreshTokenStore(
+        redis_client,
+        refresh_ttl=flask_app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds(),
+        access_ttl=flask_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds(),
+    )
+    return app
+
+
+app = create_app()
@@ -0,0 +1,37 @@
+#bench_metrics.py
+# Микробенчмарк накладных расходов middleware метрик на один запрос.
+# Запуск из каталога сервиса: python bench_metrics.py [--iterations 20000]
+import argparse
+import time
+from flask import Flask, Response
+from metrics import start_request, finish_request, teardown_request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.add_url_rule('/profile/<int:user_id>', 'profile', lambda user_id: '')
+    response = Response(status=200)
+
+    with app.test_request_context('/profile/1'):
+        for _ in range(1000):  # прогрев и создание дочерних метрик
+            start_request()
+            finish_request(response)
+            teardown_request()
+
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            start_request()
+            finish_request(response)
+            teardown_request()
+        elapsed = time.perf_counter() - start
+
+    print(f"iterations={args.iterations}")
+    print(f"middleware overhead: {elapsed / args.iterations * 1e6:.1f} us/request")
+
+
+if __name__ == '__main__':
+    main()
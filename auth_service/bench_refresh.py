@@ -0,0 +1,72 @@
+#bench_refresh.py
+# Сравнение CPU на запрос: повторный вход по паролю (/login, bcrypt) против обновления токенов (/refresh).
+# Приложение работает в этом же процессе на временной SQLite и fakeredis; bcrypt считается в процессе
+# (BCRYPT_WORKERS=0), поэтому time.process_time() учитывает его целиком.
+# Запуск из каталога сервиса: python bench_refresh.py [--requests 200] [--rounds 12]
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def measure(client, make_request, requests_total):
+    cpu, wall = [], []
+    for _ in range(requests_total):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        make_request()
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+    return statistics.mean(cpu) * 1000, statistics.median(wall) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=12, help='стоимость bcrypt')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_refresh.db')
+    os.environ.update({
+        'DATABASE_URL': f'sqlite:///{db_path}',
+        'BCRYPT_ROUNDS': str(args.rounds),
+        'BCRYPT_WORKERS': '0',
+        'LOGIN_MAX_ATTEMPTS_PER_LOGIN': '1000000000',
+        'LOGIN_MAX_ATTEMPTS_PER_IP': '1000000000',
+        'LOG_SAMPLE_RATE': '0',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import fakeredis
+    import migrate
+    from app import create_app
+    migrate.run_migrations()
+    app = create_app()
+    redis_client = fakeredis.FakeRedis()
+    app.extensions['login_throttle'].client = redis_client
+    app.extensions['refresh_token_store'].client = redis_client
+    client = app.test_client()
+
+    credentials = {"login": "bench_user", "password": "bench123"}
+    client.post('/register', json=dict(credentials, first_name="Bench", last_name="User",
+                                       confirm_password="bench123", mail="bench_user@example.com"))
+    tokens = {'refresh': client.post('/login', json=credentials).json['refresh_token']}
+
+    def login():
+        assert client.post('/login', json=credentials).status_code == 200
+
+    def refresh():
+        response = client.post('/refresh', headers={'Authorization': f"Bearer {tokens['refresh']}"})
+        assert response.status_code == 200
+        tokens['refresh'] = response.json['refresh_token']
+
+    results = {name: measure(client, request, args.requests) for name, request in
+               (('login', login), ('refresh', refresh))}
+    for name, (cpu_ms, p50_ms) in results.items():
+        print(f"{name:8} cpu/request={cpu_ms:8.3f} ms  p50={p50_ms:8.3f} ms")
+    print(f"refresh дешевле входа по CPU в {results['login'][0] / results['refresh'][0]:.0f} раз")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#bench_servers.py
+# Нагрузочное сравнение WSGI (gunicorn + Flask) и ASGI (uvicorn + Starlette) при равном бюджете CPU:
+# одинаковое число процессов, сервер закреплен на тех же ядрах (taskset), генератор нагрузки — на остальных.
+# Нужны Postgres и Redis из DATABASE_URL/REDIS_URL (например, docker compose up postgres redis).
+# Запуск из каталога сервиса: python bench_servers.py [--workers 2] [--threads 4] [--concurrency 64] [--duration 20]
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import time
+import httpx
+
+PORT = 5101
+BENCH_USER = {
+    "first_name": "Bench", "last_name": "User", "login": "bench_user",
+    "password": "bench123", "confirm_password": "bench123", "mail": "bench_user@example.com",
+}
+
+
+def server_command(mode, workers, threads):
+    if mode == 'wsgi':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+                   '--threads', str(threads), '--bind', f'127.0.0.1:{PORT}', 'app:app']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(workers),
+                   '--port', str(PORT), '--log-level', 'warning']
+    if shutil.which('taskset') and hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))[:workers]
+        command = ['taskset', '-c', ','.join(map(str, cpus))] + command
+    return command
+
+
+def server_env(args):
+    env = dict(os.environ)
+    env.update({
+        # Меряем накладные расходы сервера, а не bcrypt и лимиты входа
+        'BCRYPT_ROUNDS': str(args.bcrypt_rounds),
+        'LOGIN_MAX_ATTEMPTS_PER_LOGIN': '1000000000',
+        'LOGIN_MAX_ATTEMPTS_PER_IP': '1000000000',
+        'LOG_SAMPLE_RATE': '0',
+        'PROMETHEUS_MULTIPROC_DIR': f'/tmp/prometheus_bench_{PORT}',
+    })
+    shutil.rmtree(env['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    return env
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/metrics', timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Сервер не поднялся")
+
+
+async def drive(base_url, concurrency, duration, warmup):
+    latencies = []
+    errors = 0
+    login = {"login": BENCH_USER["login"], "password": BENCH_USER["password"]}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await client.post('/register', json=BENCH_USER)
+        measure_from = time.monotonic() + warmup
+        stop_at = measure_from + duration
+
+        async def worker():
+            nonlocal errors
+            while True:
+                start = time.monotonic()
+                if start >= stop_at:
+                    return
+                try:
+                    response = await client.post('/login', json=login)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if start >= measure_from:
+                    latencies.append(time.monotonic() - start)
+                    errors += not ok
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    latencies.sort()
+    return {
+        "rps": len(latencies) / duration,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def run(mode, args):
+    if hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) > args.workers:
+            os.sched_setaffinity(0, cpus[args.workers:])
+    server = subprocess.Popen(server_command(mode, args.workers, args.threads), env=server_env(args),
+                              stdout=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{PORT}'
+        wait_ready(base_url)
+        return asyncio.run(drive(base_url, args.concurrency, args.duration, args.warmup))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='потоков на воркер gunicorn')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    args = parser.parse_args()
+
+    results = {mode: run(mode, args) for mode in ('wsgi', 'asgi')}
+    print(f"POST /login workers={args.workers} threads={args.threads} concurrency={args.concurrency} "
+          f"bcrypt_rounds={args.bcrypt_rounds}")
+    for mode, r in results.items():
+        print(f"{mode}: {r['rps']:,.0f} req/s, p50 {r['p50']:.1f} ms, p99 {r['p99']:.1f} ms, errors {r['errors']}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
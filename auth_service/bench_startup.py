@@ -0,0 +1,50 @@
+#bench_startup.py
+# Замер холодного импорта приложения и задержки первого запроса в свежем процессе.
+# Запуск из каталога сервиса: python bench_startup.py [--runs 10] [--path /metrics]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get({path!r})
+first_request = time.perf_counter()
+print(imported - start, first_request - imported)
+"""
+
+
+def measure(path):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    env.setdefault('CACHE_TYPE', 'NullCache')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(path=path)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout.strip().splitlines()[-1]
+    import_time, first_request = map(float, output.split())
+    return import_time, first_request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/metrics')
+    args = parser.parse_args()
+
+    samples = [measure(args.path) for _ in range(args.runs)]
+    imports = [sample[0] * 1000 for sample in samples]
+    requests = [sample[1] * 1000 for sample in samples]
+    print(f"runs={args.runs} path={args.path}")
+    print(f"cold import:   median {statistics.median(imports):.1f} ms, max {max(imports):.1f} ms")
+    print(f"first request: median {statistics.median(requests):.1f} ms, max {max(requests):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
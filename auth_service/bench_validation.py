@@ -0,0 +1,38 @@
+#bench_validation.py
+# Пропускная способность проверки данных регистрации: новый UserSchema() на каждый вызов (как было),
+# один переиспользуемый экземпляр и validate_user() — валидаторы полей схемы без ее обхода.
+# Запуск из каталога сервиса: python bench_validation.py [--calls 20000]
+import argparse
+import time
+from schemas import UserSchema, validate_user
+
+VALID = {"first_name": "Иван", "last_name": "Иванов", "login": "ivan_1",
+         "password": "secret1", "confirm_password": "secret1", "mail": "ivan@example.com"}
+INVALID = dict(VALID, first_name="иван", login="x!", confirm_password="other1")
+
+
+def rate(check, data, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        check(data)
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    schema = UserSchema()
+    variants = {
+        'новая схема': lambda data: UserSchema().validate(data),
+        'одна схема': schema.validate,
+        'validate_user': validate_user,
+    }
+    print(f"{'вариант':14} {'верные, в/с':>12} {'ошибки, в/с':>12}")
+    for name, check in variants.items():
+        print(f"{name:14} {rate(check, VALID, args.calls):12.0f} {rate(check, INVALID, args.calls):12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#bulk_import.py
+# Массовый импорт пользователей из NDJSON/CSV.
+# Запуск: python bulk_import.py users.ndjson [--format csv] [--batch-size 1000]  ("-" — stdin)
+from datetime import datetime
+from sqlalchemy import insert
+from database import upsert_insert
+from models import User, OutboxEvent, user_registered_event
+from schemas import validate_user
+from hashing import hash_passwords
+import argparse
+import csv
+import itertools
+import json
+import sys
+
+USER_FIELDS = ('first_name', 'last_name', 'login', 'password', 'mail')
+MAX_REPORTED_ERRORS = 1000
+
+
+def iter_records(stream, fmt='ndjson'):
+    """Построчно читает текстовый поток и отдает (номер строки, запись или None, ошибка или None)."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for line_no, row in enumerate(reader, start=2):
+            yield line_no, row, None
+        return
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"Некорректный JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "Ожидался JSON-объект"
+            continue
+        yield line_no, record, None
+
+
+def _insert_statement(dialect_name, rows):
+    # ON CONFLICT DO NOTHING: дубликаты пропускаются без отката всей пачки
+    return upsert_insert(dialect_name, User).values(rows).on_conflict_do_nothing().returning(User.id, User.login)
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, line_no, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "errors": errors})
+
+    def to_dict(self):
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+
+def import_batch(engine, batch, report):
+    valid = []
+    seen = set()
+    for line_no, record, error in batch:
+        if error:
+            report.fail(line_no, error)
+            continue
+        record = {key: record.get(key) for key in USER_FIELDS}
+        record['confirm_password'] = record['password']
+        errors = validate_user(record)
+        if errors:
+            report.fail(line_no, errors)
+            continue
+        keys = (record['login'].lower(), record['mail'].lower())
+        if keys[0] in seen or keys[1] in seen:
+            report.fail(line_no, "Дубликат логина или email в импортируемых данных")
+            continue
+        seen.update(keys)
+        valid.append((line_no, record))
+
+    if not valid:
+        return
+
+    hashes = hash_passwords([record['password'] for _, record in valid])
+    now = datetime.utcnow()
+    rows = [
+        {
+            "first_name": record['first_name'],
+            "last_name": record['last_name'],
+            "login": record['login'],
+            "mail": record['mail'],
+            "password_hash": password_hash,
+            "date_of_registration": now,
+        }
+        for (_, record), password_hash in zip(valid, hashes)
+    ]
+
+    # Пользователи и события для profile_service пишутся в одной транзакции
+    with engine.begin() as conn:
+        inserted = {login: user_id for user_id, login in conn.execute(_insert_statement(engine.dialect.name, rows))}
+        events = [
+            dict(user_registered_event(inserted[record['login']], record['first_name'], record['last_name']),
+                 created_at=now)
+            for _, record in valid if record['login'] in inserted
+        ]
+        if events:
+            conn.execute(insert(OutboxEvent), events)
+
+    report.imported += len(inserted)
+    for line_no, record in valid:
+        if record['login'] not in inserted:
+            report.fail(line_no, "Пользователь с таким логином или email уже существует")
+
+
+def import_users(engine, stream, fmt='ndjson', batch_size=1000):
+    report = ImportReport()
+    records = iter_records(stream, fmt)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            break
+        import_batch(engine, batch, report)
+    return report.to_dict()
+
+
+def main():
+    from database import create_db_engine
+
+    parser = argparse.ArgumentParser(description="Массовый импорт пользователей")
+    parser.add_argument('path', help="Файл NDJSON/CSV или '-' для stdin")
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default=None)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+    engine = create_db_engine()
+    if args.path == '-':
+        report = import_users(engine, sys.stdin, fmt, args.batch_size)
+    else:
+        with open(args.path, encoding='utf-8', newline='') as f:
+            report = import_users(engine, f, fmt, args.batch_size)
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#hashing.py
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from prometheus_client import Histogram
+import asyncio
+import bcrypt
+import os
+import threading
+import time
+import uuid
+
+# Настройки пула хеширования
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', os.cpu_count() or 1))
+BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', max(BCRYPT_WORKERS, 1) * 4))
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', 10))
+
+HASHING_LATENCY = Histogram(
+    'bcrypt_operation_seconds',
+    'bcrypt operation latency in seconds, including queue wait',
+    ['operation'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+
+class HashingPoolBusy(Exception):
+    """Очередь пула хеширования заполнена — запрос нужно отклонить с 503."""
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+_executor = None
+_executor_pid = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Пул создается лениво и заново после fork (например, в воркерах gunicorn)
+    global _executor, _executor_pid, _slots
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS)
+                _slots = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+                _executor_pid = os.getpid()
+    return _executor, _slots
+
+
+def _submit(fn, *args):
+    """Ставит задачу в пул, если есть свободный слот очереди.
+
+    Слот освобождается, когда задача действительно завершилась, а не когда вызывающий перестал ждать:
+    после таймаута bcrypt продолжает работать в пуле и должен по-прежнему занимать место в очереди.
+    """
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        raise HashingPoolBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def _run(operation, fn, *args):
+    start = time.perf_counter()
+    try:
+        if BCRYPT_WORKERS <= 0:
+            return fn(*args)
+        try:
+            return _submit(fn, *args).result(timeout=BCRYPT_TIMEOUT)
+        except FutureTimeoutError:
+            raise HashingPoolBusy()
+    finally:
+        HASHING_LATENCY.labels(operation=operation).observe(time.perf_counter() - start)
+
+
+async def _run_async(operation, fn, *args):
+    # Для ASGI: ожидание результата пула не занимает поток, только корутину
+    start = time.perf_counter()
+    try:
+        if BCRYPT_WORKERS <= 0:
+            # Без пула bcrypt идет в потоке по умолчанию: он отпускает GIL и не блокирует цикл событий
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(_submit(fn, *args)), BCRYPT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HashingPoolBusy()
+    finally:
+        HASHING_LATENCY.labels(operation=operation).observe(time.perf_counter() - start)
+
+
+def hash_password(password: str, rounds: int = None) -> str:
+    hashed = _run('hash', _hashpw, password.encode('utf-8'), rounds or BCRYPT_ROUNDS)
+    return hashed.decode('utf-8')
+
+
+def hash_passwords(passwords, rounds: int = None) -> list:
+    """Хеширует пачку паролей на всех процессах пула (для массового импорта, без лимита очереди)."""
+    rounds = rounds or BCRYPT_ROUNDS
+    encoded = [password.encode('utf-8') for password in passwords]
+    start = time.perf_counter()
+    try:
+        if BCRYPT_WORKERS <= 0:
+            hashed = [_hashpw(password, rounds) for password in encoded]
+        else:
+            executor, _ = _get_executor()
+            chunksize = max(1, len(encoded) // (BCRYPT_WORKERS * 4))
+            hashed = list(executor.map(_hashpw, encoded, [rounds] * len(encoded), chunksize=chunksize))
+    finally:
+        HASHING_LATENCY.labels(operation='bulk_hash').observe(time.perf_counter() - start)
+    return [value.decode('utf-8') for value in hashed]
+
+
+async def hash_password_async(password: str, rounds: int = None) -> str:
+    hashed = await _run_async('hash', _hashpw, password.encode('utf-8'), rounds or BCRYPT_ROUNDS)
+    return hashed.decode('utf-8')
+
+
+def check_password(password: str, hashed: str) -> bool:
+    return _run('check', _checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+async def check_password_async(password: str, hashed: str) -> bool:
+    return await _run_async('check', _checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+_dummy_hash = None
+
+
+def check_dummy_password(password: str) -> bool:
+    """Проверка против фиктивного хеша той же стоимости: по времени ответа нельзя понять, что логина нет."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(uuid.uuid4().hex)
+    check_password(password, _dummy_hash)
+    return False
+
+
+async def check_dummy_password_async(password: str) -> bool:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hash_password_async(uuid.uuid4().hex)
+    await check_password_async(password, _dummy_hash)
+    return False
+
+
+def get_rounds(hashed: str) -> int:
+    # Формат bcrypt: $2b$<cost>$<salt+hash>
+    return int(hashed.split('$')[2])
+
+
+def needs_rehash(hashed: str) -> bool:
+    try:
+        return get_rounds(hashed) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
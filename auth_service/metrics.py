@@ -0,0 +1,248 @@
+#metrics.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import request, g, has_request_context
+import structlog
+from prometheus_client import (
+    Counter, Histogram, Gauge, CollectorRegistry, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+)
+from sqlalchemy import event
+import os
+import re
+import time
+
+logger = structlog.get_logger()
+
+# Под gunicorn каждый воркер пишет метрики в PROMETHEUS_MULTIPROC_DIR, /metrics их суммирует
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+LATENCY_BUCKETS = (0.002, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SUBSPAN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'Total number of HTTP requests',
+    ['endpoint', 'method', 'status']
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_latency_seconds', 'HTTP request latency in seconds',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests currently being processed',
+    ['endpoint', 'method'], multiprocess_mode='livesum'
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_seconds', 'Time spent in database calls per HTTP request',
+    ['endpoint'], buckets=SUBSPAN_BUCKETS
+)
+REQUEST_CACHE_TIME = Histogram(
+    'http_request_cache_seconds', 'Time spent in cache calls per HTTP request',
+    ['endpoint'], buckets=SUBSPAN_BUCKETS
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements executed per HTTP request',
+    ['endpoint'], buckets=(1, 2, 3, 5, 10, 20, 50, 100, 500)
+)
+REPEATED_STATEMENTS = Counter(
+    'http_request_repeated_statements_total',
+    'Requests in which one SQL statement ran at least N_PLUS_ONE_THRESHOLD times (likely N+1)',
+    ['endpoint']
+)
+
+# Сколько повторов одного и того же SQL за запрос считать N+1; 0 — не проверять
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 10))
+
+# В ASGI-режиме нет flask.g: время в БД/кэше копится в словаре текущего запроса
+_asgi_spans = ContextVar('metrics_spans', default=None)
+
+
+def _endpoint():
+    # Шаблон маршрута (/profile/<int:user_id>), а не фактический путь — иначе метки не ограничены
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_endpoint = _endpoint()
+    g.metrics_recorded = False
+    g.db_time = 0.0
+    g.cache_time = 0.0
+    g.db_queries = 0
+    # Текст SQL -> число выполнений; одинаковый текст с разными параметрами — признак N+1
+    g.db_statements = {}
+    REQUESTS_IN_PROGRESS.labels(g.metrics_endpoint, request.method).inc()
+
+
+def _record(status):
+    latency = time.perf_counter() - g.metrics_start
+    endpoint = g.metrics_endpoint
+    REQUEST_COUNT.labels(endpoint, request.method, status).inc()
+    REQUEST_LATENCY.labels(endpoint, request.method, status).observe(latency)
+    if g.db_time:
+        REQUEST_DB_TIME.labels(endpoint).observe(g.db_time)
+    if g.cache_time:
+        REQUEST_CACHE_TIME.labels(endpoint).observe(g.cache_time)
+    _record_queries(endpoint, g.db_queries, g.db_statements)
+    g.metrics_recorded = True
+    return latency
+
+
+def _record_queries(endpoint, queries, statements):
+    if not queries:
+        return
+    REQUEST_DB_QUERIES.labels(endpoint).observe(queries)
+    if not N_PLUS_ONE_THRESHOLD:
+        return
+    statement, count = max(statements.items(), key=lambda item: item[1])
+    if count >= N_PLUS_ONE_THRESHOLD:
+        REPEATED_STATEMENTS.labels(endpoint).inc()
+        logger.warning("Repeated SQL statement (possible N+1)", endpoint=endpoint, count=count,
+                       queries=queries, statement=statement[:500])
+
+
+def request_db_stats():
+    """Число запросов и время в БД для строки "Request completed"."""
+    if 'db_queries' not in g:
+        return {}
+    return {"db_queries": g.db_queries, "db_time": round(g.db_time, 6)}
+
+
+def finish_request(response):
+    """Записывает метрики запроса и возвращает его длительность в секундах."""
+    if 'metrics_start' not in g:
+        return 0.0
+    return _record(str(response.status_code))
+
+
+def teardown_request(exception=None):
+    if 'metrics_start' not in g:
+        return
+    # after_request не вызывается при необработанном исключении — учитываем его как 500
+    if not g.metrics_recorded:
+        _record('500')
+    REQUESTS_IN_PROGRESS.labels(g.metrics_endpoint, request.method).dec()
+
+
+def _add_span(name, seconds):
+    if has_request_context():
+        if name in g:
+            setattr(g, name, getattr(g, name) + seconds)
+        return
+    spans = _asgi_spans.get()
+    if spans is not None:
+        spans[name] += seconds
+
+
+def add_query(statement, seconds):
+    if has_request_context():
+        if 'db_queries' in g:
+            g.db_time += seconds
+            g.db_queries += 1
+            g.db_statements[statement] = g.db_statements.get(statement, 0) + 1
+        return
+    spans = _asgi_spans.get()
+    if spans is not None:
+        spans['db_time'] += seconds
+        spans['db_queries'] += 1
+        spans['db_statements'][statement] = spans['db_statements'].get(statement, 0) + 1
+
+
+@contextmanager
+def cache_timer():
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_span('cache_time', time.perf_counter() - start)
+
+
+def instrument_engine(engine):
+    """Считает SQL-запросы и суммирует их время в рамках текущего HTTP-запроса."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        add_query(statement, time.perf_counter() - conn.info['query_start'].pop())
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
+
+
+def init_metrics(app, engine, replicas=None):
+    app.before_request(start_request)
+    app.teardown_request(teardown_request)
+    for instrumented in [engine, *(replicas.engines if replicas else [])]:
+        instrument_engine(instrumented)
+
+
+def metrics_payload():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+def metrics_view():
+    return metrics_payload(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
+
+def _flask_rule(path):
+    return re.sub(r'\{(\w+)(?::(\w+))?\}',
+                  lambda m: f"<{m.group(2)}:{m.group(1)}>" if m.group(2) else f"<{m.group(1)}>", path)
+
+
+class MetricsMiddleware:
+    """ASGI-вариант start_request/finish_request: те же метрики и метки для Starlette-приложения."""
+
+    def __init__(self, app, routes):
+        self.app = app
+        # Метка в формате Flask (/profile/<int:user_id>), чтобы графики не зависели от режима
+        self.routes = [(route, _flask_rule(route.path)) for route in routes]
+
+    def _endpoint(self, scope):
+        from starlette.routing import Match
+        for route, rule in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return rule
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        endpoint = self._endpoint(scope)
+        method = scope['method']
+        status = '500'
+        spans = {'db_time': 0.0, 'cache_time': 0.0, 'db_queries': 0, 'db_statements': {}}
+        token = _asgi_spans.set(spans)
+        start = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels(endpoint, method).inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = str(message['status'])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            latency = time.perf_counter() - start
+            REQUEST_COUNT.labels(endpoint, method, status).inc()
+            REQUEST_LATENCY.labels(endpoint, method, status).observe(latency)
+            if spans['db_time']:
+                REQUEST_DB_TIME.labels(endpoint).observe(spans['db_time'])
+            if spans['cache_time']:
+                REQUEST_CACHE_TIME.labels(endpoint).observe(spans['cache_time'])
+            _record_queries(endpoint, spans['db_queries'], spans['db_statements'])
+            # Попадут в строку "Request completed" внешнего RequestLogMiddleware
+            structlog.contextvars.bind_contextvars(db_queries=spans['db_queries'], db_time=round(spans['db_time'], 6))
+            REQUESTS_IN_PROGRESS.labels(endpoint, method).dec()
+            _asgi_spans.reset(token)
@@ -0,0 +1,20 @@
+#migrate.py
+# Однократное применение миграций: python migrate.py [revision]
+from alembic import command
+from alembic.config import Config
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_migrations(revision="head"):
+    alembic_cfg = Config(os.path.join(BASE_DIR, "alembic.ini"))
+    alembic_cfg.set_main_option("script_location", os.path.join(BASE_DIR, "alembic"))
+    if os.getenv('DATABASE_URL'):
+        alembic_cfg.set_main_option("sqlalchemy.url", os.getenv('DATABASE_URL'))
+    command.upgrade(alembic_cfg, revision)
+
+
+if __name__ == '__main__':
+    run_migrations(sys.argv[1] if len(sys.argv) > 1 else "head")
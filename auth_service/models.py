@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index, JSON, func
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
-import bcrypt
+import hashing
 
 Base = declarative_base()
 
@@ -15,9 +15,32 @@ class User(Base):
     mail = Column(String, nullable=False, unique=True)
     date_of_registration = Column(DateTime, nullable=False, default=datetime.utcnow)
 
+    # Регистронезависимая уникальность и поиск по логину/почте при входе
+    __table_args__ = (
+        Index('ix_users_login_lower', func.lower(login), unique=True),
+        Index('ix_users_mail_lower', func.lower(mail), unique=True),
+    )
+
     def set_password(self, password: str):
-        salt = bcrypt.gensalt()
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        self.password_hash = hashing.hash_password(password)
 
     def check_password(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
\ No newline at end of file
+        return hashing.check_password(password, self.password_hash)
+
+    def needs_rehash(self) -> bool:
+        return hashing.needs_rehash(self.password_hash)
+
+class OutboxEvent(Base):
+    """Событие для других сервисов; пишется в той же транзакции, что и изменение, публикуется outbox.py."""
+    __tablename__ = 'outbox_events'
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+def user_registered_event(user_id, first_name, last_name):
+    return {
+        "event_type": "user_registered",
+        "payload": {"user_id": user_id, "first_name": first_name, "last_name": last_name},
+    }
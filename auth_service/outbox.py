@@ -0,0 +1,77 @@
+#outbox.py
+# Публикация событий из таблицы outbox_events в Redis Stream для других сервисов.
+# Запуск: python outbox.py (несколько экземпляров не мешают друг другу — строки берутся через SKIP LOCKED)
+from sqlalchemy import select, delete
+from models import OutboxEvent
+import json
+import os
+import time
+import structlog
+
+logger = structlog.get_logger()
+
+# Поток событий о пользователях; читает profile_service (consumer.py)
+USER_EVENTS_STREAM = "auth:user_events"
+
+
+class OutboxRelay:
+    """Переносит события пачками: SELECT ... FOR UPDATE SKIP LOCKED -> XADD -> DELETE в одной транзакции.
+
+    Доставка «хотя бы один раз»: если транзакция не закоммитится после XADD, пачка будет
+    отправлена повторно, поэтому потребитель должен быть идемпотентным.
+    """
+
+    def __init__(self, engine, client, batch_size=500, interval=0.5, stream_maxlen=1_000_000):
+        self.engine = engine
+        self.client = client
+        self.batch_size = batch_size
+        self.interval = interval
+        self.stream_maxlen = stream_maxlen
+
+    def relay_once(self):
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                select(OutboxEvent.id, OutboxEvent.event_type, OutboxEvent.payload)
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                return 0
+            pipe = self.client.pipeline(transaction=False)
+            for row in rows:
+                pipe.xadd(USER_EVENTS_STREAM, {
+                    'id': row.id, 'type': row.event_type, 'payload': json.dumps(row.payload),
+                }, maxlen=self.stream_maxlen, approximate=True)
+            pipe.execute()
+            conn.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([row.id for row in rows])))
+        return len(rows)
+
+    def run(self):
+        while True:
+            try:
+                relayed = self.relay_once()
+            except Exception as e:
+                logger.error("Outbox relay failed", error=str(e))
+                relayed = 0
+            if relayed:
+                logger.info("Outbox events relayed", count=relayed)
+            # Полная пачка — в очереди, скорее всего, есть еще
+            if relayed < self.batch_size:
+                time.sleep(self.interval)
+
+
+def main():
+    import redis
+    from database import create_db_engine
+    relay = OutboxRelay(
+        create_db_engine(),
+        redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://redis:6379/0')),
+        batch_size=int(os.getenv('OUTBOX_BATCH_SIZE', 500)),
+        interval=float(os.getenv('OUTBOX_POLL_INTERVAL', 0.5)),
+    )
+    relay.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,87 @@
 #schemas.py
-from marshmallow import Schema, fields, validate, ValidationError
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError
 import re
 
+# Регулярные выражения компилируются один раз и общие для схемы и быстрого валидатора
+NAME_RE = re.compile(r'^[A-ZА-Я][a-zа-я]*$')
+LOGIN_RE = re.compile(r'^[a-zA-Z0-9_]+$')
+PASSWORD_RE = re.compile(r'^(?=.*[A-Za-z])(?=.*\d).{6,}$')
+
+FIRST_NAME_ERROR = "Имя должно начинаться с заглавной буквы и содержать только буквы."
+LAST_NAME_ERROR = "Фамилия должна начинаться с заглавной буквы и содержать только буквы."
+LOGIN_ERROR = "Логин должен содержать только латинские буквы, цифры и символ подчеркивания."
+PASSWORD_ERROR = "Пароль должен содержать минимум 6 символов, включая хотя бы одну букву и одну цифру."
+PASSWORDS_MISMATCH_ERROR = "Пароли не совпадают."
+
 class UserSchema(Schema):
     first_name = fields.Str(required=True, validate=[
         validate.Length(min=1, max=50),
-        validate.Regexp(r'^[A-ZА-Я][a-zа-я]*$', error="Имя должно начинаться с заглавной буквы и содержать только буквы.")
+        validate.Regexp(NAME_RE, error=FIRST_NAME_ERROR)
     ])
     last_name = fields.Str(required=True, validate=[
         validate.Length(min=1, max=50),
-        validate.Regexp(r'^[A-ZА-Я][a-zа-я]*$', error="Фамилия должна начинаться с заглавной буквы и содержать только буквы.")
+        validate.Regexp(NAME_RE, error=LAST_NAME_ERROR)
     ])
     login = fields.Str(required=True, validate=[
         validate.Length(min=3, max=20),
-        validate.Regexp(r'^[a-zA-Z0-9_]+$', error="Логин должен содержать только латинские буквы, цифры и символ подчеркивания.")
+        validate.Regexp(LOGIN_RE, error=LOGIN_ERROR)
     ])
     password = fields.Str(required=True, validate=[
         validate.Length(min=6),
-        validate.Regexp(r'^(?=.*[A-Za-z])(?=.*\d).{6,}$', 
-                       error="Пароль должен содержать минимум 6 символов, включая хотя бы одну букву и одну цифру.")
+        validate.Regexp(PASSWORD_RE, error=PASSWORD_ERROR)
     ])
     confirm_password = fields.Str(required=True)
     mail = fields.Email(required=True)
 
-    def validate(self, data, **kwargs):
-        # Проверка наличия confirm_password в данных
-        if 'confirm_password' not in data:
-            raise ValidationError("Поле 'confirm_password' обязательно.", field_name="confirm_password")
-        
-        # Проверка совпадения пароля и подтверждения пароля
+    @validates_schema
+    def validate_passwords_match(self, data, **kwargs):
+        # Выполняется после проверки полей, поэтому оба значения уже на месте
         if data['password'] != data['confirm_password']:
-            raise ValidationError("Пароли не совпадают.", field_name="confirm_password")
-        
-        return super().validate(data, **kwargs)
\ No newline at end of file
+            raise ValidationError(PASSWORDS_MISMATCH_ERROR, field_name="confirm_password")
+
+
+_user_schema = UserSchema()
+_MISSING = object()
+
+
+def _field_errors(field, value):
+    # Те же проверки и тексты, что при Schema.validate: обязательность, null, тип, затем все валидаторы поля
+    if value is _MISSING:
+        return [field.error_messages["required"]]
+    if value is None:
+        return [field.error_messages["null"]]
+    if not isinstance(value, str):
+        return [field.error_messages["invalid"]]
+    messages = []
+    for validator in field.validators:
+        try:
+            validator(value)
+        except ValidationError as e:
+            messages.extend(e.messages)
+    return messages
+
+
+
+def validate_user(data, first_error_only=False):
+    """Быстрая проверка регистрации: тот же результат, что UserSchema().validate(data), без обхода схемы.
+
+    Валидаторы берутся из полей UserSchema, поэтому формат ({поле: [сообщения]}) и тексты совпадают.
+    first_error_only=True — остановиться на первом неверном поле.
+    """
+    if not isinstance(data, dict):
+        return {"_schema": [_user_schema.error_messages["type"]]}
+    errors = {}
+    for name, field in _user_schema.fields.items():
+        messages = _field_errors(field, data.get(name, _MISSING))
+        if messages:
+            errors[name] = messages
+            if first_error_only:
+                return errors
+    for name in data.keys() - _user_schema.fields.keys():
+        errors[name] = [_user_schema.error_messages["unknown"]]
+        if first_error_only:
+            return errors
+    # Как и @validates_schema в marshmallow: совпадение паролей проверяется только без ошибок в полях
+    if not errors and data["password"] != data["confirm_password"]:
+        errors["confirm_password"] = [PASSWORDS_MISMATCH_ERROR]
+    return errors
@@ -0,0 +1,213 @@
+#throttling.py
+from prometheus_client import Counter
+import os
+import time
+import uuid
+import structlog
+
+logger = structlog.get_logger()
+
+LOGIN_DECISIONS = Counter(
+    'login_throttle_decisions_total',
+    'Login attempts by throttling decision',
+    ['decision']
+)
+
+
+class LoginThrottle:
+    """Ограничение попыток входа в Redis, проверяется до обращения к Postgres и bcrypt.
+
+    - скользящее окно (ZSET) отдельно по логину и по IP;
+    - блокировка логина после серии неудач с экспоненциально растущим сроком;
+    - короткий негативный кэш несуществующих логинов.
+    При недоступности Redis вход не блокируется.
+    """
+
+    def __init__(self, client, window=60, max_per_login=10, max_per_ip=50,
+                 lockout_threshold=5, lockout_base=30, lockout_max=900, negative_ttl=60):
+        self.client = client
+        self.window = window
+        self.max_per_login = max_per_login
+        self.max_per_ip = max_per_ip
+        self.lockout_threshold = lockout_threshold
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.negative_ttl = negative_ttl
+
+    @classmethod
+    def from_env(cls, client):
+        return cls(
+            client,
+            window=int(os.getenv('LOGIN_RATE_WINDOW', 60)),
+            max_per_login=int(os.getenv('LOGIN_MAX_ATTEMPTS_PER_LOGIN', 10)),
+            max_per_ip=int(os.getenv('LOGIN_MAX_ATTEMPTS_PER_IP', 50)),
+            lockout_threshold=int(os.getenv('LOGIN_LOCKOUT_THRESHOLD', 5)),
+            lockout_base=int(os.getenv('LOGIN_LOCKOUT_BASE_SECONDS', 30)),
+            lockout_max=int(os.getenv('LOGIN_LOCKOUT_MAX_SECONDS', 900)),
+            negative_ttl=int(os.getenv('LOGIN_NEGATIVE_CACHE_TTL', 60)),
+        )
+
+    @staticmethod
+    def _login(login):
+        return str(login).lower()
+
+    def _queue_window(self, pipe, key, now):
+        # Скользящее окно: чистим старые отметки, добавляем текущую и считаем
+        pipe.zremrangebyscore(key, 0, now - self.window)
+        pipe.zadd(key, {f"{now}:{uuid.uuid4().hex}": now})
+        pipe.zcard(key)
+        pipe.zrange(key, 0, 0, withscores=True)
+        pipe.expire(key, self.window)
+
+    def _window_retry_after(self, results, limit, now):
+        _, _, count, oldest, _ = results
+        if count <= limit:
+            return 0
+        return max(1, int(oldest[0][1] + self.window - now) + 1)
+
+    def _hit_window(self, key, limit, now):
+        pipe = self.client.pipeline()
+        self._queue_window(pipe, key, now)
+        return self._window_retry_after(pipe.execute(), limit, now)
+
+    def _lockout_seconds(self, failures):
+        # Каждая следующая неудача удваивает срок блокировки
+        if failures < self.lockout_threshold:
+            return 0
+        return int(min(self.lockout_base * 2 ** (failures - self.lockout_threshold), self.lockout_max))
+
+    @staticmethod
+    def _decision(allowed, retry_after):
+        if allowed:
+            LOGIN_DECISIONS.labels(decision='allowed').inc()
+        else:
+            LOGIN_DECISIONS.labels(decision='rate_limited').inc()
+        return allowed, retry_after
+
+    def check(self, login, ip):
+        """Возвращает (разрешено, через сколько секунд повторить)."""
+        login = self._login(login)
+        try:
+            lock_ttl = self.client.ttl(f"auth:lock:{login}")
+            if lock_ttl and lock_ttl > 0:
+                LOGIN_DECISIONS.labels(decision='locked_out').inc()
+                return False, lock_ttl
+
+            now = time.time()
+            retry_after = max(
+                self._hit_window(f"auth:rate:login:{login}", self.max_per_login, now),
+                self._hit_window(f"auth:rate:ip:{ip}", self.max_per_ip, now),
+            )
+        except Exception as e:
+            logger.warning("Login throttle unavailable", error=str(e))
+            return self._decision(True, 0)
+        return self._decision(not retry_after, retry_after)
+
+    def is_unknown(self, login):
+        try:
+            unknown = bool(self.client.exists(f"auth:unknown:{self._login(login)}"))
+        except Exception:
+            return False
+        if unknown:
+            LOGIN_DECISIONS.labels(decision='unknown_login').inc()
+        return unknown
+
+    def remember_unknown(self, login):
+        try:
+            self.client.set(f"auth:unknown:{self._login(login)}", 1, ex=self.negative_ttl)
+        except Exception:
+            pass
+
+    def forget_unknown(self, *logins):
+        try:
+            self.client.delete(*[f"auth:unknown:{self._login(login)}" for login in logins])
+        except Exception as e:
+            logger.warning("Failed to clear negative login cache", error=str(e))
+
+    def register_failure(self, login):
+        login = self._login(login)
+        try:
+            pipe = self.client.pipeline()
+            pipe.incr(f"auth:fail:{login}")
+            pipe.expire(f"auth:fail:{login}", self.lockout_max)
+            failures, _ = pipe.execute()
+            lockout = self._lockout_seconds(failures)
+            if lockout:
+                self.client.set(f"auth:lock:{login}", 1, ex=lockout)
+        except Exception as e:
+            logger.warning("Failed to record login failure", error=str(e))
+
+    def register_success(self, login):
+        login = self._login(login)
+        try:
+            self.client.delete(f"auth:fail:{login}", f"auth:lock:{login}")
+        except Exception:
+            pass
+
+
+class AsyncLoginThrottle(LoginThrottle):
+    """Те же ключи и правила поверх redis.asyncio — для ASGI-режима."""
+
+    async def _hit_window(self, key, limit, now):
+        async with self.client.pipeline() as pipe:
+            self._queue_window(pipe, key, now)
+            return self._window_retry_after(await pipe.execute(), limit, now)
+
+    async def check(self, login, ip):
+        login = self._login(login)
+        try:
+            lock_ttl = await self.client.ttl(f"auth:lock:{login}")
+            if lock_ttl and lock_ttl > 0:
+                LOGIN_DECISIONS.labels(decision='locked_out').inc()
+                return False, lock_ttl
+
+            now = time.time()
+            retry_after = max(
+                await self._hit_window(f"auth:rate:login:{login}", self.max_per_login, now),
+                await self._hit_window(f"auth:rate:ip:{ip}", self.max_per_ip, now),
+            )
+        except Exception as e:
+            logger.warning("Login throttle unavailable", error=str(e))
+            return self._decision(True, 0)
+        return self._decision(not retry_after, retry_after)
+
+    async def is_unknown(self, login):
+        try:
+            unknown = bool(await self.client.exists(f"auth:unknown:{self._login(login)}"))
+        except Exception:
+            return False
+        if unknown:
+            LOGIN_DECISIONS.labels(decision='unknown_login').inc()
+        return unknown
+
+    async def remember_unknown(self, login):
+        try:
+            await self.client.set(f"auth:unknown:{self._login(login)}", 1, ex=self.negative_ttl)
+        except Exception:
+            pass
+
+    async def forget_unknown(self, *logins):
+        try:
+            await self.client.delete(*[f"auth:unknown:{self._login(login)}" for login in logins])
+        except Exception as e:
+            logger.warning("Failed to clear negative login cache", error=str(e))
+
+    async def register_failure(self, login):
+        login = self._login(login)
+        try:
+            async with self.client.pipeline() as pipe:
+                pipe.incr(f"auth:fail:{login}")
+                pipe.expire(f"auth:fail:{login}", self.lockout_max)
+                failures, _ = await pipe.execute()
+            lockout = self._lockout_seconds(failures)
+            if lockout:
+                await self.client.set(f"auth:lock:{login}", 1, ex=lockout)
+        except Exception as e:
+            logger.warning("Failed to record login failure", error=str(e))
+
+    async def register_success(self, login):
+        login = self._login(login)
+        try:
+            await self.client.delete(f"auth:fail:{login}", f"auth:lock:{login}")
+        except Exception:
+            pass
@@ -0,0 +1,131 @@
+#token_store.py
+from prometheus_client import Counter
+import time
+import structlog
+
+logger = structlog.get_logger()
+
+REFRESH_TOKEN_EVENTS = Counter(
+    'refresh_token_events_total',
+    'Refresh token store events',
+    ['event']
+)
+
+REFRESH_KEY = "auth:refresh:{}"
+FAMILY_KEY = "auth:refresh_family:{}"
+REVOKED_KEY = "auth:revoked:{}"
+# Поток отзывов читает profile_service, чтобы держать локальный bloom-фильтр
+REVOCATIONS_STREAM = "auth:revocations"
+
+
+class RefreshTokenStore:
+    """Серверное хранилище refresh-токенов в Redis.
+
+    - refresh-токен одноразовый: при /refresh его jti удаляется (GETDEL) и выдается новый;
+    - токены одной цепочки ротаций образуют семейство (claim `fam`), повторное
+      предъявление уже использованного токена отзывает все семейство;
+    - отозванные access-токены попадают в denylist (ключ с TTL до истечения токена)
+      и в поток REVOCATIONS_STREAM.
+    """
+
+    def __init__(self, client, refresh_ttl, access_ttl):
+        self.client = client
+        self.refresh_ttl = int(refresh_ttl)
+        self.access_ttl = int(access_ttl)
+
+    def _queue_remember(self, pipe, jti, family, user_id):
+        pipe.set(REFRESH_KEY.format(jti), f"{family}:{user_id}", ex=self.refresh_ttl)
+        # Последний выданный токен семейства — чтобы отозвать цепочку целиком
+        pipe.set(FAMILY_KEY.format(family), jti, ex=self.refresh_ttl)
+
+    def _queue_revoke_access(self, pipe, jti, ttl):
+        pipe.set(REVOKED_KEY.format(jti), 1, ex=ttl)
+        # В потоке держим отзывы не старше срока жизни access-токена
+        min_id = f"{int((time.time() - self.access_ttl) * 1000)}-0"
+        pipe.xadd(REVOCATIONS_STREAM, {'jti': jti}, minid=min_id, approximate=True)
+
+    @staticmethod
+    def _text(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def remember(self, jti, family, user_id):
+        pipe = self.client.pipeline()
+        self._queue_remember(pipe, jti, family, user_id)
+        pipe.execute()
+        REFRESH_TOKEN_EVENTS.labels(event='issued').inc()
+
+    def rotate(self, jti, family):
+        """Погашает refresh-токен. False — токен уже использован или отозван."""
+        if self.client.getdel(REFRESH_KEY.format(jti)) is not None:
+            REFRESH_TOKEN_EVENTS.labels(event='rotated').inc()
+            return True
+        # Повторное использование: токен мог быть украден, закрываем всю цепочку
+        REFRESH_TOKEN_EVENTS.labels(event='reused').inc()
+        self.revoke_family(family)
+        return False
+
+    def revoke_family(self, family):
+        if not family:
+            return
+        head = self.client.getdel(FAMILY_KEY.format(family))
+        if head is not None:
+            self.client.delete(REFRESH_KEY.format(self._text(head)))
+            REFRESH_TOKEN_EVENTS.labels(event='family_revoked').inc()
+
+    def revoke_access(self, jti, expires_at):
+        ttl = int(expires_at - time.time()) + 1
+        if ttl <= 0:
+            return
+        pipe = self.client.pipeline()
+        self._queue_revoke_access(pipe, jti, ttl)
+        pipe.execute()
+        REFRESH_TOKEN_EVENTS.labels(event='access_revoked').inc()
+
+    def is_revoked(self, jti):
+        try:
+            return bool(self.client.exists(REVOKED_KEY.format(jti)))
+        except Exception as e:
+            logger.warning("Token denylist unavailable", error=str(e))
+            return False
+
+
+class AsyncRefreshTokenStore(RefreshTokenStore):
+    """Те же ключи и правила поверх redis.asyncio — для ASGI-режима."""
+
+    async def remember(self, jti, family, user_id):
+        async with self.client.pipeline() as pipe:
+            self._queue_remember(pipe, jti, family, user_id)
+            await pipe.execute()
+        REFRESH_TOKEN_EVENTS.labels(event='issued').inc()
+
+    async def rotate(self, jti, family):
+        if await self.client.getdel(REFRESH_KEY.format(jti)) is not None:
+            REFRESH_TOKEN_EVENTS.labels(event='rotated').inc()
+            return True
+        REFRESH_TOKEN_EVENTS.labels(event='reused').inc()
+        await self.revoke_family(family)
+        return False
+
+    async def revoke_family(self, family):
+        if not family:
+            return
+        head = await self.client.getdel(FAMILY_KEY.format(family))
+        if head is not None:
+            await self.client.delete(REFRESH_KEY.format(self._text(head)))
+            REFRESH_TOKEN_EVENTS.labels(event='family_revoked').inc()
+
+    async def revoke_access(self, jti, expires_at):
+        ttl = int(expires_at - time.time()) + 1
+        if ttl <= 0:
+            return
+        async with self.client.pipeline() as pipe:
+            self._queue_revoke_access(pipe, jti, ttl)
+            await pipe.execute()
+        REFRESH_TOKEN_EVENTS.labels(event='access_revoked').inc()
+
+    async def is_revoked(self, jti):
+        try:
+            return bool(await self.client.exists(REVOKED_KEY.format(jti)))
+        except Exception as e:
+            logger.warning("Token denylist unavailable", error=str(e))
+            return False
@@ -0,0 +1,136 @@
+#run.py
+# Бенчмарк auth_service и profile_service: сценарии нагрузки, RPS, p50/p95/p99 и число SQL-запросов на запрос.
+# Каждый сценарий идет в отдельном процессе на свежей БД (SQLite по умолчанию или --database-url) с fakeredis.
+# Результат сравнивается с baseline.json; при регрессии код выхода 1.
+#
+# Запуск из корня репозитория:
+#   python benchmarks/run.py                      # все сценарии, сравнение с baseline.json
+#   python benchmarks/run.py --scenario login_storm --scale 0.2
+#   python benchmarks/run.py --update-baseline    # записать текущие результаты как эталон
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER = os.path.join(ROOT, 'benchmarks', 'worker.py')
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# сценарий: (сервис, число запросов при --scale 1)
+SCENARIOS = {
+    'signup_burst': ('auth_service', 400),
+    'login_storm': ('auth_service', 2000),
+    'profile_read_heavy': ('profile_service', 4000),
+    'profile_update': ('profile_service', 1000),
+    'profile_patch': ('profile_service', 1000),
+}
+
+# Схема общая: profiles ссылается на users, массовый импорт пишет в обе таблицы
+MIGRATION_ORDER = ('auth_service', 'profile_service')
+
+
+def migrate(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    for service in MIGRATION_ORDER:
+        subprocess.run([sys.executable, 'migrate.py'], cwd=os.path.join(ROOT, service), env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run_scenario(name, args):
+    service, requests = SCENARIOS[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        migrate(database_url)
+        output = os.path.join(tmp, 'result.json')
+        subprocess.run([
+            sys.executable, WORKER,
+            '--scenario', name,
+            '--database-url', database_url,
+            '--requests', str(max(args.threads, int(requests * args.scale))),
+            '--threads', str(args.threads),
+            '--users', str(args.users),
+            '--seed', str(args.seed),
+            '--output', output,
+        ], cwd=os.path.join(ROOT, service), check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance, latency_tolerance):
+    """Регрессия: ошибки, падение RPS, рост p99, рост числа SQL-запросов на запрос."""
+    failures = []
+    for name, result in results.items():
+        if result['errors']:
+            failures.append(f"{name}: {result['errors']} неожиданных ответов")
+        base = baseline.get(name)
+        if not base:
+            continue
+        if (base['requests'], base['threads']) != (result['requests'], result['threads']):
+            # Доля холодных промахов кэша и задержки зависят от объема прогона
+            print(f"SKIP {name}: эталон снят на {base['requests']} запросах и {base['threads']} потоках")
+            continue
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            failures.append(f"{name}: RPS {result['rps']:.0f} < {base['rps']:.0f} (допуск {tolerance:.0%})")
+        if result['p99_ms'] > base['p99_ms'] * (1 + latency_tolerance):
+            failures.append(f"{name}: p99 {result['p99_ms']:.1f} ms > {base['p99_ms']:.1f} ms "
+                            f"(допуск {latency_tolerance:.0%})")
+        # Число SQL-запросов почти не зависит от машины: допуск только на гонки при заполнении кэша
+        if result['queries_per_request'] > base['queries_per_request'] * 1.05 + 0.01:
+            failures.append(f"{name}: SQL-запросов на запрос {result['queries_per_request']:.2f} "
+                            f"> {base['queries_per_request']:.2f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='можно указать несколько раз; по умолчанию все')
+    parser.add_argument('--database-url', help='например, локальный Postgres; по умолчанию свежий SQLite')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--scale', type=float, default=1.0, help='множитель числа запросов')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимое падение RPS')
+    parser.add_argument('--latency-tolerance', type=float, default=0.5, help='допустимый рост p99')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    results = {name: run_scenario(name, args) for name in (args.scenario or SCENARIOS)}
+
+    print(f"{'scenario':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql/req':>8} {'errors':>7}")
+    for name, r in results.items():
+        print(f"{name:<20} {r['rps']:>8.0f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['queries_per_request']:>8.2f} {r['errors']:>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Эталон обновлен: {args.baseline}")
+        return 0
+
+    failures = compare(results, baseline, args.tolerance, args.latency_tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
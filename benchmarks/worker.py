@@ -0,0 +1,224 @@
+#worker.py
+# Прогон одного сценария внутри каталога сервиса (запускается из run.py, не вручную).
+# Приложение создается через create_app(), Redis подменяется fakeredis, запросы идут через test_client
+# из нескольких потоков; для каждого запроса считаются задержка и число SQL-запросов.
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+# Бенчмарк меряет накладные расходы сервиса, а не стоимость bcrypt и лимиты входа
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+os.environ.setdefault('BCRYPT_WORKERS', '0')
+os.environ.setdefault('LOGIN_MAX_ATTEMPTS_PER_LOGIN', '1000000000')
+os.environ.setdefault('LOGIN_MAX_ATTEMPTS_PER_IP', '1000000000')
+os.environ.setdefault('LOG_SAMPLE_RATE', '0')
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret-key-of-sufficient-length')
+sys.path.insert(0, os.getcwd())
+
+import fakeredis
+from flask_caching.backends import RedisCache
+from sqlalchemy import event, text
+
+PASSWORD = 'bench123'
+
+_query_counter = threading.local()
+
+
+def create_app(database_url):
+    import app as service
+    flask_app = service.create_app({'DATABASE_URL': database_url})
+    client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    # Тот же RedisCache, что и в проде, но поверх fakeredis
+    flask_app.extensions['cache'][service.cache] = RedisCache(host=client, key_prefix='flask_cache_')
+    for name in ('login_throttle', 'refresh_token_store', 'revocation_filter'):
+        if name in flask_app.extensions:
+            flask_app.extensions[name].client = client
+
+    @event.listens_for(flask_app.extensions['db_engine'], 'before_cursor_execute')
+    def count_query(*args):
+        _query_counter.count = getattr(_query_counter, 'count', 0) + 1
+
+    return flask_app
+
+
+def user_record(i):
+    return {
+        "first_name": "Bench", "last_name": "User", "login": f"bench_{i}",
+        "password": PASSWORD, "mail": f"bench_{i}@example.com",
+    }
+
+
+def seed_auth_users(flask_app, users):
+    from bulk_import import import_users
+    stream = io.StringIO(''.join(json.dumps(user_record(i)) + '\n' for i in range(users)))
+    import_users(flask_app.extensions['db_engine'], stream, 'ndjson', batch_size=1000)
+
+
+def seed_profiles(flask_app, users):
+    """Пользователи и профили напрямую в БД, токены — через flask_jwt_extended."""
+    from flask_jwt_extended import create_access_token
+    with flask_app.extensions['db_engine'].begin() as conn:
+        for i in range(users):
+            conn.execute(text(
+                "INSERT INTO users (first_name, last_name, login, password_hash, mail, date_of_registration) "
+                "VALUES ('Bench', 'User', :login, 'x', :mail, CURRENT_TIMESTAMP)"
+            ), {"login": f"bench_{i}", "mail": f"bench_{i}@example.com"})
+        user_ids = conn.execute(text("SELECT id FROM users WHERE login LIKE 'bench_%'")).scalars().all()
+        for user_id in user_ids:
+            conn.execute(text(
+                "INSERT INTO profiles (user_id, first_name, last_name, city) "
+                "VALUES (:user_id, 'Bench', 'User', 'Moscow')"
+            ), {"user_id": user_id})
+    with flask_app.app_context():
+        return {user_id: create_access_token(identity=str(user_id)) for user_id in user_ids}
+
+
+# Сценарий: (сервис, подготовка данных, генератор запросов). Запрос — (метод, путь, kwargs, ожидаемые статусы)
+
+def signup_burst(flask_app, args, rng):
+    def requests(thread, count):
+        for i in range(count):
+            record = dict(user_record(f"{thread}_{i}"), confirm_password=PASSWORD)
+            yield 'post', '/register', {'json': record}, (201,)
+    return requests
+
+
+def login_storm(flask_app, args, rng):
+    seed_auth_users(flask_app, args.users)
+
+    def requests(thread, count):
+        for _ in range(count):
+            login = f"BENCH_{rng.randrange(args.users)}"
+            # Каждая десятая попытка — с неверным паролем
+            if rng.random() < 0.1:
+                yield 'post', '/login', {'json': {"login": login, "password": "wrong123"}}, (401,)
+            else:
+                yield 'post', '/login', {'json': {"login": login, "password": PASSWORD}}, (200,)
+    return requests
+
+
+def profile_read_heavy(flask_app, args, rng):
+    tokens = seed_profiles(flask_app, args.users)
+    user_ids = list(tokens)
+
+    def requests(thread, count):
+        for _ in range(count):
+            headers = {"Authorization": f"Bearer {tokens[rng.choice(user_ids)]}"}
+            if rng.random() < 0.1:
+                ids = ','.join(str(user_id) for user_id in rng.sample(user_ids, min(20, len(user_ids))))
+                yield 'get', f'/profiles?ids={ids}', {'headers': headers}, (200,)
+            else:
+                # Популярные профили читаются чаще (степенное распределение)
+                user_id = user_ids[int(len(user_ids) * rng.random() ** 3)]
+                yield 'get', f'/profile/{user_id}', {'headers': headers}, (200,)
+    return requests
+
+
+def profile_update(flask_app, args, rng):
+    tokens = seed_profiles(flask_app, args.users)
+    user_ids = list(tokens)
+
+    def requests(thread, count):
+        for i in range(count):
+            headers = {"Authorization": f"Bearer {tokens[rng.choice(user_ids)]}"}
+            yield 'put', '/profile', {'headers': headers, 'json': {"city": f"City {thread}-{i}"}}, (200,)
+    return requests
+
+
+def profile_patch(flask_app, args, rng):
+    tokens = seed_profiles(flask_app, args.users)
+    user_ids = list(tokens)
+
+    def requests(thread, count):
+        for i in range(count):
+            headers = {"Authorization": f"Bearer {tokens[rng.choice(user_ids)]}"}
+            yield 'patch', '/profile', {'headers': headers, 'json': {"city": f"City {thread}-{i}"}}, (200,)
+    return requests
+
+
+SCENARIOS = {
+    'signup_burst': signup_burst,
+    'login_storm': login_storm,
+    'profile_read_heavy': profile_read_heavy,
+    'profile_update': profile_update,
+    'profile_patch': profile_patch,
+}
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run(args):
+    flask_app = create_app(args.database_url)
+    rng = random.Random(args.seed)
+    make_requests = SCENARIOS[args.scenario](flask_app, args, rng)
+
+    # Запросы генерируются заранее, чтобы в замер не попадало время генератора
+    per_thread = args.requests // args.threads
+    plans = [list(make_requests(thread, per_thread + args.warmup)) for thread in range(args.threads)]
+    results = [[] for _ in range(args.threads)]
+    barrier = threading.Barrier(args.threads + 1)
+
+    def worker(thread):
+        client = flask_app.test_client()
+        plan = plans[thread]
+        for method, path, kwargs, _ in plan[:args.warmup]:
+            getattr(client, method)(path, **kwargs)
+        barrier.wait()
+        for method, path, kwargs, expected in plan[args.warmup:]:
+            _query_counter.count = 0
+            start = time.perf_counter()
+            response = getattr(client, method)(path, **kwargs)
+            results[thread].append((time.perf_counter() - start, _query_counter.count,
+                                    response.status_code in expected))
+
+    threads = [threading.Thread(target=worker, args=(thread,)) for thread in range(args.threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    samples = [sample for thread_results in results for sample in thread_results]
+    latencies = sorted(latency for latency, _, _ in samples)
+    queries = [count for _, count, _ in samples]
+    return {
+        "requests": len(samples),
+        "threads": args.threads,
+        "rps": len(samples) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "queries_per_request": sum(queries) / len(queries),
+        "max_queries_per_request": max(queries),
+        "errors": sum(1 for _, _, ok in samples if not ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', choices=SCENARIOS, required=True)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=10, help='запросов на поток до начала замера')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    result = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(result, f)
+
+
+if __name__ == '__main__':
+    main()
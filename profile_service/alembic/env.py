@@ -44,6 +44,9 @@ def run_migrations_online():
 
         # Объединяем метаданные
         Base.metadata.reflect(bind=connection)
+        # Отражение открывает транзакцию (autobegin в SQLAlchemy 2); закрываем ее, иначе
+        # begin_transaction() ниже не станет владельцем транзакции и миграции откатятся при закрытии
+        connection.commit()
 
         context.configure(
             connection=connection,
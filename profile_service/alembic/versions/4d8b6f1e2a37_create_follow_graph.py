@@ -0,0 +1,43 @@
+"""Create follow graph tables
+
+Revision ID: 4d8b6f1e2a37
+Revises: c5e2a9d3f817
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d8b6f1e2a37'
+down_revision: Union[str, None] = 'c5e2a9d3f817'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'follows',
+        sa.Column('follower_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('followee_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.PrimaryKeyConstraint('follower_id', 'followee_id'),
+        sa.CheckConstraint('follower_id <> followee_id', name='ck_follows_not_self'),
+    )
+    op.create_index('ix_follows_followee', 'follows', ['followee_id', 'follower_id'])
+    op.create_table(
+        'follow_stats',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('followers', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('following', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('follow_stats')
+    op.drop_index('ix_follows_followee', 'follows')
+    op.drop_table('follows')
@@ -0,0 +1,47 @@
+"""Add profile search indexes
+
+Revision ID: 8c1f4a7e5d92
+Revises: 3b7d9e2c41a0
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1f4a7e5d92'
+down_revision: Union[str, None] = '3b7d9e2c41a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Порядок колонок совпадает с запросом search.search_statement: фильтр по стране/городу, seek по user_id
+LOCATION_COLUMNS = [sa.text('lower(country)'), sa.text('lower(city)'), 'user_id']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index('ix_profiles_location', 'profiles', LOCATION_COLUMNS)
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # CONCURRENTLY нельзя выполнять в транзакции, зато таблица не блокируется на запись
+    with op.get_context().autocommit_block():
+        for column in ('first_name', 'last_name'):
+            op.create_index(f'ix_profiles_{column}_trgm', 'profiles', [column],
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+                            postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_profiles_location', 'profiles', LOCATION_COLUMNS,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index('ix_profiles_location', 'profiles')
+        return
+    with op.get_context().autocommit_block():
+        for name in ('ix_profiles_location', 'ix_profiles_last_name_trgm', 'ix_profiles_first_name_trgm'):
+            op.drop_index(name, 'profiles', postgresql_concurrently=True, if_exists=True)
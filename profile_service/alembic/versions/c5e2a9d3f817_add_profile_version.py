@@ -0,0 +1,34 @@
+"""Add version and updated_at to profiles
+
+Revision ID: c5e2a9d3f817
+Revises: 8c1f4a7e5d92
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e2a9d3f817'
+down_revision: Union[str, None] = '8c1f4a7e5d92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('profiles', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    # В Postgres now() вычисляется один раз при ALTER, таблица не переписывается.
+    # SQLite не допускает такой DEFAULT в ADD COLUMN: старые строки получат updated_at при первом изменении
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    op.add_column('profiles', sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True,
+                                        server_default=sa.func.now() if postgres else None))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('profiles', 'updated_at')
+    op.drop_column('profiles', 'version')
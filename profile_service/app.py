@@ -1,48 +1,54 @@
 #app.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, current_app, send_file
 from flask_restx import Api, Resource, fields
-from flask_jwt_extended import jwt_required, get_jwt_identity, JWTManager
-from database import create_db_engine, create_session
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from database import check_upsert_support, create_db_engine, create_replica_set, create_session, init_db
 from models import Profile, Base
-from schemas import ProfileSchema
-from prometheus_client import start_http_server, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from marshmallow import ValidationError
+from schemas import profile_schema, PROFILE_COLUMNS, PROFILE_FIELDS, profile_row_to_dict, profile_values
+from cache import (cache, get_profile, get_profiles, get_search_results, invalidate_profile, put_profile,
+                   remember_write, written_recently, get_follow_counts, put_follow_counts, get_first_page,
+                   invalidate_first_page)
+from tokens import CachingJWTManager, configure_verification_keys
+from revocation import RevocationFilter
+from search import SearchError, parse_search_args, search_statement, search_page
+from conditional import validator_headers, is_not_modified, if_match_failed, if_match_versions
+from patch import patch_statement
+from follows import (FOLLOWERS, FOLLOWING, FollowError, follow, unfollow, parse_page_args, page_statement,
+                     adjacency_page, counts_statement, following_statement)
+from export import ExportError, FORMATS, export_profiles, parse_since
+from media import MediaStorage, UploadError, KEY_RE, MIMETYPES, CHUNK_SIZE
+from migrate import run_migrations
+from metrics import init_metrics, finish_request, metrics_view, request_db_stats
+from profiling import init_profiling
+from logs import configure_logging, bind_request_id, set_request_id_header
+from serialization import init_serialization, output_json
+import redis
 import structlog
-import time
 import os
-from alembic import command
-from alembic.config import Config
-
-# Применение миграций
-alembic_cfg = Config("alembic.ini")
-command.upgrade(alembic_cfg, "head")
-
-# Настройка structlog для логирования
-structlog.configure(
-    processors=[
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.JSONRenderer()
-    ],
-    context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),
-    wrapper_class=structlog.BoundLogger,
-    cache_logger_on_first_use=True,
-)
+import hmac
 
-logger = structlog.get_logger()
-
-app = Flask(__name__)
-api = Api(app)
+# Настройка structlog: запись через очередь в фоновом потоке, выборка успешных запросов
+configure_logging()
 
-# Конфигурация JWT
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'fallback_secret_key')
-app.config['JWT_TOKEN_LOCATION'] = ['headers']  # Указываем, где искать токен (в заголовках)
-app.config['JWT_HEADER_NAME'] = 'Authorization'  # Имя заголовка для токена
-app.config['JWT_HEADER_TYPE'] = 'Bearer'  # Тип токена
+logger = structlog.get_logger()
 
-jwt = JWTManager(app)
+# Расширения создаются без приложения и подключаются в create_app()
+api = Api()
+# Ответы flask_restx кодируются orjson, а не json.dumps
+api.representations['application/json'] = output_json
+# Проверенные claims кэшируются в процессе; при RS256/EdDSA нужен только открытый ключ
+jwt = CachingJWTManager()
 
-# Создаем engine для подключения к базе данных
-engine = create_db_engine()
+@jwt.token_in_blocklist_loader
+def is_token_revoked(jwt_header, jwt_payload):
+    # Неотозванный токен отсекается локальным bloom-фильтром, Redis — только при попадании в него
+    if jwt_payload.get('type') != 'access':
+        return False
+    return current_app.extensions['revocation_filter'].is_revoked(jwt_payload['jti'])
 
 # Модели для Swagger
 profile_model = api.model('ProfileModel', {
@@ -55,52 +61,332 @@ profile_model = api.model('ProfileModel', {
     "profile_picture": fields.String(required=False),
 })
 
-# Prometheus метрики
-REQUEST_COUNT = Counter('http_requests_total', 'Total number of HTTP requests')
-REQUEST_LATENCY = Histogram('http_request_latency_seconds', 'HTTP request latency in seconds')
+batch_model = api.model('ProfileBatchModel', {
+    "ids": fields.List(fields.Integer, required=True),
+    "fields": fields.List(fields.String, required=False),
+})
+
+follow_check_model = api.model('FollowCheckModel', {
+    "ids": fields.List(fields.Integer, required=True),
+})
 
-@app.before_request
 def before_request():
-    request.start_time = time.time()
-    logger.info("Request started", path=request.path)
+    bind_request_id()
 
-@app.after_request
 def after_request(response):
-    latency = time.time() - request.start_time
-    REQUEST_LATENCY.observe(latency)
-    logger.info("Request completed", path=request.path, latency=latency)
-    return response
+    latency = finish_request(response)
+    # sample=True: успешные быстрые запросы логируются с долей LOG_SAMPLE_RATE
+    logger.info("Request completed", path=request.path, method=request.method,
+                status=response.status_code, latency=latency, sample=True, **request_db_stats())
+    return set_request_id_header(response)
+
+def profile_to_dict(profile):
+    # ORM-объект или строка RETURNING; чтения выбирают PROFILE_COLUMNS и зовут profile_row_to_dict сразу
+    return profile_row_to_dict(profile_values(profile))
+
+def use_replica(user_ids):
+    # Реплика может отставать: только что измененные профили читаются с primary
+    return bool(current_app.extensions['db_replicas']) and not written_recently(user_ids)
+
+def mark_written(user_id):
+    if current_app.extensions['db_replicas']:
+        remember_write(user_id, timeout=current_app.config['REPLICA_STICKY_SECONDS'])
+
+def load_profile(user_id):
+    session = create_session()
+    try:
+        row = session.execute(select(*PROFILE_COLUMNS).where(Profile.user_id == user_id)
+                              .execution_options(replica=use_replica([user_id]))).first()
+        return profile_row_to_dict(row) if row else None
+    finally:
+        session.close()
+
+def read_profile(user_id):
+    try:
+        data = get_profile(user_id, lambda: load_profile(user_id), timeout=current_app.config['PROFILE_CACHE_TTL'])
+    except Exception as e:
+        logger.error("Error reading profile", user_id=user_id, error=str(e))
+        return {"success": False, "msg": str(e)}, 500
+    if data is None:
+        return {"success": False, "msg": "Профиль не найден"}, 404
+    # no-cache: клиент хранит ответ, но перепроверяет его условным запросом
+    headers = dict(validator_headers(data), **{'Cache-Control': 'private, no-cache'})
+    if is_not_modified(data, request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+        return current_app.response_class(status=304, headers=headers)
+    return {"success": True, "profile": data}, 200, headers
+
+def load_profiles(user_ids):
+    session = create_session()
+    try:
+        # Кортежи столбцов без создания ORM-объектов: на сотнях профилей это основная часть времени
+        rows = session.execute(select(*PROFILE_COLUMNS).where(Profile.user_id.in_(user_ids))
+                               .execution_options(replica=use_replica(user_ids))).all()
+        return {row.user_id: profile_row_to_dict(row) for row in rows}
+    finally:
+        session.close()
+
+# Попыток PUT /profile без If-Match при конкурентном изменении той же строки
+UPDATE_ATTEMPTS = 3
+
+def save_profile(session, user_id, data, if_match=None):
+    """PUT /profile через ORM: обновляет или создает профиль и возвращает ETag/Last-Modified; None — конфликт (412)."""
+    for attempt in range(UPDATE_ATTEMPTS):
+        profile = session.query(Profile).filter(Profile.user_id == user_id).first()
+        if if_match_failed(profile and {"user_id": profile.user_id, "version": profile.version}, if_match):
+            return None
+        created = profile is None
+        if created:
+            profile = Profile(user_id=user_id)
+            session.add(profile)
+
+        # Обновляем только те поля, которые переданы в запросе
+        for key, value in data.items():
+            if value is not None:  # Обновляем только если значение передано
+                setattr(profile, key, value)
+
+        try:
+            # Версия известна после flush; после commit объект истекает и ее чтение стоило бы SELECT
+            session.flush()
+            headers = validator_headers({"user_id": profile.user_id, "version": profile.version})
+            session.commit()
+            return headers
+        except StaleDataError:
+            # Версия сменилась между чтением и UPDATE ... WHERE version = :version.
+            # С If-Match решает клиент, без него — повторяем, последняя запись выигрывает
+            session.rollback()
+            if if_match or attempt == UPDATE_ATTEMPTS - 1:
+                return None
+        except IntegrityError:
+            # Профиль успели создать между чтением и INSERT — например, consumer по событию регистрации.
+            # Перечитываем: следующая попытка обновит уже существующую строку
+            session.rollback()
+            if not created or attempt == UPDATE_ATTEMPTS - 1:
+                raise
+
+def is_admin_request():
+    admin_token = current_app.config.get('ADMIN_TOKEN')
+    return bool(admin_token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token)
+
+def parse_ids(raw_ids):
+    """Список идентификаторов без повторов или (ответ об ошибке, статус)."""
+    try:
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in raw_ids))
+    except (TypeError, ValueError):
+        return None, ({"success": False, "msg": "Некорректный список идентификаторов"}, 400)
+    if not user_ids:
+        return None, ({"success": False, "msg": "Список идентификаторов пуст"}, 400)
+    if len(user_ids) > current_app.config['PROFILE_BATCH_MAX_IDS']:
+        return None, ({"success": False, "msg": f"Не более {current_app.config['PROFILE_BATCH_MAX_IDS']} идентификаторов за запрос"}, 400)
+    return user_ids, None
+
+def parse_profiles_request(raw_ids, raw_fields=None):
+    """(user_ids, projection, None) или (None, None, (ответ об ошибке, статус)); общая часть WSGI и ASGI."""
+    user_ids, error = parse_ids(raw_ids)
+    if error:
+        return None, None, error
+
+    projection = None
+    if raw_fields:
+        projection = set(raw_fields)
+        unknown = projection.difference(PROFILE_FIELDS)
+        if unknown:
+            return None, None, ({"success": False, "msg": "Неизвестные поля", "errors": sorted(unknown)}, 400)
+    return user_ids, projection, None
+
+def profiles_response(user_ids, found, projection=None):
+    profiles = {}
+    for user_id, data in found.items():
+        if projection:
+            data = {key: value for key, value in data.items() if key in projection}
+        profiles[str(user_id)] = data
+    missing = [user_id for user_id in user_ids if user_id not in found]
+    return {"success": True, "profiles": profiles, "missing": missing}, 200
+
+def read_profiles(raw_ids, raw_fields=None):
+    user_ids, projection, error = parse_profiles_request(raw_ids, raw_fields)
+    if error:
+        return error
+    try:
+        found = get_profiles(user_ids, load_profiles, timeout=current_app.config['PROFILE_CACHE_TTL'])
+    except Exception as e:
+        logger.error("Error reading profiles", error=str(e))
+        return {"success": False, "msg": str(e)}, 500
+    return profiles_response(user_ids, found, projection)
 
-@app.route('/metrics')
-def metrics():
-    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+def load_search_page(params):
+    session = create_session()
+    try:
+        # Результаты поиска и так кэшируются на PROFILE_SEARCH_CACHE_TTL, отставание реплики не заметно
+        rows = session.execute(search_statement(params).execution_options(replica=True)).all()
+        return search_page(rows, params["limit"], profile_row_to_dict)
+    finally:
+        session.close()
+
+def search_profiles(args):
+    try:
+        params = parse_search_args(args, max_limit=current_app.config['PROFILE_SEARCH_MAX_LIMIT'])
+    except SearchError as e:
+        return {"success": False, "msg": str(e)}, 400
+    try:
+        page = get_search_results(params, lambda: load_search_page(params),
+                                  timeout=current_app.config['PROFILE_SEARCH_CACHE_TTL'])
+    except Exception as e:
+        logger.error("Error searching profiles", error=str(e))
+        return {"success": False, "msg": str(e)}, 500
+    return dict(page, success=True), 200
+
+def load_follow_counts(user_ids):
+    session = create_session()
+    try:
+        rows = session.execute(counts_statement(user_ids)).all()
+    finally:
+        session.close()
+    # Строка в follow_stats появляется при первой подписке; до нее счетчики нулевые
+    counts = {user_id: {"followers": 0, "following": 0} for user_id in user_ids}
+    counts.update({row.user_id: {"followers": row.followers, "following": row.following} for row in rows})
+    return counts
+
+def change_follow(action, followee_id):
+    follower_id = int(get_jwt_identity())
+    session = create_session()
+    try:
+        counts = action(session, follower_id, followee_id)
+        session.commit()
+    except FollowError as e:
+        session.rollback()
+        return {"success": False, "msg": str(e)}, 400
+    except IntegrityError:
+        session.rollback()
+        return {"success": False, "msg": "Пользователь не найден"}, 404
+    except Exception as e:
+        session.rollback()
+        logger.error("Error changing follow", followee_id=followee_id, error=str(e))
+        return {"success": False, "msg": str(e)}, 500
+    finally:
+        session.close()
+    if counts is None:
+        # Подписка уже была (или ее не было) — ни ребро, ни счетчики не менялись
+        return {"success": True, "changed": False}, 200
+    put_follow_counts(counts, timeout=current_app.config['FOLLOW_CACHE_TTL'])
+    invalidate_first_page(FOLLOWERS, followee_id, follower_id)
+    invalidate_first_page(FOLLOWING, follower_id, followee_id)
+    return {"success": True, "changed": True,
+            "counts": {str(user_id): data for user_id, data in counts.items()}}, 200
+
+def read_follow_page(direction, user_id, args):
+    config = current_app.config
+    try:
+        params = parse_page_args(args, default_limit=config['FOLLOW_PAGE_SIZE'], max_limit=config['FOLLOW_PAGE_MAX_LIMIT'])
+    except FollowError as e:
+        return {"success": False, "msg": str(e)}, 400
+
+    def load_page(replica):
+        session = create_session()
+        try:
+            statement = page_statement(direction, user_id, params["after"], params["limit"])
+            ids = session.execute(statement.execution_options(replica=replica)).scalars().all()
+        finally:
+            session.close()
+        return adjacency_page(ids, params["limit"])
+
+    try:
+        if params["after"] == 0 and params["limit"] == config['FOLLOW_PAGE_SIZE']:
+            # Первая страница кэшируется и сбрасывается при подписках, поэтому читается с primary
+            page = get_first_page(direction, user_id, lambda: load_page(False), timeout=config['FOLLOW_CACHE_TTL'])
+        else:
+            page = load_page(True)
+    except Exception as e:
+        logger.error("Error reading follows", user_id=user_id, error=str(e))
+        return {"success": False, "msg": str(e)}, 500
+    return dict(page, success=True), 200
+
+def media_url(key):
+    return f"/media/{key}"
+
+def picture_variant_urls(storage, key):
+    return {size: media_url(variant) for size, variant in storage.variants(key).items()}
+
+def set_picture(user_id, key, variants):
+    session = create_session()
+    try:
+        profile = session.query(Profile).filter(Profile.user_id == user_id).first()
+        if not profile:
+            profile = Profile(user_id=user_id)
+            session.add(profile)
+        profile.profile_picture = media_url(key)
+        profile.picture_variants = variants
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    mark_written(user_id)
+    invalidate_profile(user_id)
+
+def record_picture_variants(app, user_id, key, future):
+    """Сохраняет миниатюры в профиль, если за это время пользователь не загрузил другую картинку."""
+    with app.app_context():
+        storage = app.extensions['media_storage']
+        session = create_session()
+        try:
+            query = session.query(Profile).filter(Profile.user_id == user_id,
+                                                  Profile.profile_picture == media_url(key))
+            if future.exception() is None:
+                query.update({Profile.picture_variants: picture_variant_urls(storage, key),
+                              Profile.version: Profile.version + 1})
+            else:
+                # Файл с подписью картинки, но не декодируется — не показываем его в профиле
+                query.update({Profile.profile_picture: None, Profile.picture_variants: None,
+                              Profile.version: Profile.version + 1})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error("Error saving picture variants", user_id=user_id, error=str(e))
+            return
+        finally:
+            session.close()
+        mark_written(user_id)
+        invalidate_profile(user_id)
+
+def media_view(key):
+    # Картинки отдаются без токена: ключ — хеш содержимого, его нельзя подобрать
+    if not KEY_RE.match(key):
+        return {"success": False, "msg": "Файл не найден"}, 404
+    path = current_app.extensions['media_storage'].path(key)
+    try:
+        response = send_file(path, mimetype=MIMETYPES[key.rsplit('.', 1)[1]], conditional=True,
+                             etag=key, max_age=current_app.config['MEDIA_CACHE_MAX_AGE'])
+    except FileNotFoundError:
+        return {"success": False, "msg": "Файл не найден"}, 404
+    # Содержимое по ключу никогда не меняется
+    response.cache_control.immutable = True
+    return response
 
 @api.route('/profile')
 class ProfileResource(Resource):
+    @jwt_required()
+    def get(self):
+        return read_profile(get_jwt_identity())
+
     @jwt_required()
     @api.expect(profile_model)
     def put(self):
         user_id = get_jwt_identity()
-        req_data = request.get_json()
-        schema = ProfileSchema()
-        errors = schema.validate(req_data)
-        if errors:
-            return {"success": False, "msg": "Invalid data", "errors": errors}, 400
+        try:
+            # load() возвращает типизированные значения (date_of_birth — date), повторный разбор не нужен
+            data = profile_schema.load(request.get_json())
+        except ValidationError as e:
+            return {"success": False, "msg": "Invalid data", "errors": e.messages}, 400
 
-        session = create_session(engine)
+        session = create_session()
         try:
-            profile = session.query(Profile).filter(Profile.user_id == user_id).first()
-            if not profile:
-                profile = Profile(user_id=user_id)
-                session.add(profile)
-            
-            # Обновляем только те поля, которые переданы в запросе
-            for key, value in req_data.items():
-                if value is not None:  # Обновляем только если значение передано
-                    setattr(profile, key, value)
-            
-            session.commit()
-            return {"success": True, "msg": "Профиль успешно обновлен"}, 200
+            headers = save_profile(session, user_id, data, request.headers.get('If-Match'))
+            if headers is None:
+                return {"success": False, "msg": "Профиль изменен другим запросом"}, 412
+            mark_written(user_id)
+            invalidate_profile(user_id)
+            return {"success": True, "msg": "Профиль успешно обновлен"}, 200, headers
         except Exception as e:
             session.rollback()
             logger.error("Error updating profile", error=str(e))
@@ -110,26 +396,23 @@ class ProfileResource(Resource):
 
     @jwt_required()
     @api.expect(profile_model)
-    def put(self):
-        user_id = get_jwt_identity()
-        req_data = request.get_json()
-        schema = ProfileSchema()
-        errors = schema.validate(req_data)
-        if errors:
-            return {"success": False, "msg": "Invalid data", "errors": errors}, 400
+    def patch(self):
+        """Меняет только переданные поля одним запросом и обновляет запись в кэше на месте."""
+        user_id = int(get_jwt_identity())
+        try:
+            data = profile_schema.load(request.get_json())
+        except ValidationError as e:
+            return {"success": False, "msg": "Invalid data", "errors": e.messages}, 400
+        if not data:
+            return {"success": False, "msg": "Нет полей для обновления"}, 400
 
-        session = create_session(engine)
+        if_match = request.headers.get('If-Match')
+        statement = patch_statement(current_app.extensions['db_engine'].dialect.name,
+                                    user_id, data, if_match_versions(user_id, if_match))
+        session = create_session()
         try:
-            profile = session.query(Profile).filter(Profile.user_id == user_id).first()
-            if not profile:
-                profile = Profile(user_id=user_id)
-                session.add(profile)
-            
-            for key, value in req_data.items():
-                setattr(profile, key, value)
-            
+            row = session.execute(statement).first()
             session.commit()
-            return {"success": True, "msg": "Профиль успешно обновлен"}, 200
         except Exception as e:
             session.rollback()
             logger.error("Error updating profile", error=str(e))
@@ -137,5 +420,289 @@ class ProfileResource(Resource):
         finally:
             session.close()
 
+        timeout = current_app.config['PROFILE_CACHE_TTL']
+        if row is not None:
+            profile = profile_to_dict(row)
+            mark_written(user_id)
+            put_profile(user_id, profile, timeout=timeout)
+        else:
+            # Строка не вернулась: значения уже такие же либо не совпала версия из If-Match
+            profile = get_profile(user_id, lambda: load_profile(user_id), timeout=timeout)
+            if if_match_failed(profile, if_match):
+                return {"success": False, "msg": "Профиль изменен другим запросом"}, 412
+            if profile is None:
+                return {"success": False, "msg": "Профиль не найден"}, 404
+        return {"success": True, "profile": profile}, 200, validator_headers(profile)
+
+@api.route('/profile/picture')
+class ProfilePictureResource(Resource):
+    @jwt_required()
+    @api.doc(consumes=['image/jpeg', 'image/png', 'image/gif', 'image/webp'])
+    def put(self):
+        """Принимает картинку телом запроса; миниатюры строятся в фоне (202)."""
+        user_id = int(get_jwt_identity())
+        storage = current_app.extensions['media_storage']
+        if (request.content_length or 0) > storage.max_bytes:
+            return {"success": False, "msg": f"Файл больше {storage.max_bytes} байт"}, 413
+
+        upload = storage.open_upload()
+        try:
+            while True:
+                chunk = request.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                upload.write(chunk)
+            key = upload.commit()
+        except UploadError as e:
+            upload.abort()
+            return {"success": False, "msg": e.msg}, e.status
+        except Exception:
+            # Обрыв соединения или ошибка диска: временный файл не должен остаться в MEDIA_ROOT/tmp
+            upload.abort()
+            raise
+
+        # Такую картинку уже загружали — миниатюры есть, пересчитывать нечего
+        ready = storage.has_variants(key)
+        try:
+            set_picture(user_id, key, picture_variant_urls(storage, key) if ready else None)
+        except Exception as e:
+            logger.error("Error updating profile picture", error=str(e))
+            return {"success": False, "msg": str(e)}, 500
+        if not ready:
+            app = current_app._get_current_object()
+            storage.build_thumbnails(key).add_done_callback(
+                lambda future: record_picture_variants(app, user_id, key, future)
+            )
+        return {"success": True, "profile_picture": media_url(key),
+                "picture_variants": picture_variant_urls(storage, key), "ready": ready}, 200 if ready else 202
+
+@api.route('/profile/<int:user_id>')
+class UserProfileResource(Resource):
+    @jwt_required()
+    def get(self, user_id):
+        return read_profile(user_id)
+
+@api.route('/profile/<int:user_id>/follow')
+class FollowResource(Resource):
+    @jwt_required()
+    def put(self, user_id):
+        """Подписка; повторный запрос ничего не меняет."""
+        return change_follow(follow, user_id)
+
+    @jwt_required()
+    def delete(self, user_id):
+        return change_follow(unfollow, user_id)
+
+@api.route('/profile/<int:user_id>/followers')
+class FollowersResource(Resource):
+    @jwt_required()
+    @api.doc(params={'limit': 'Размер страницы', 'cursor': 'next_cursor из предыдущей страницы'})
+    def get(self, user_id):
+        return read_follow_page(FOLLOWERS, user_id, request.args)
+
+@api.route('/profile/<int:user_id>/following')
+class FollowingResource(Resource):
+    @jwt_required()
+    @api.doc(params={'limit': 'Размер страницы', 'cursor': 'next_cursor из предыдущей страницы'})
+    def get(self, user_id):
+        return read_follow_page(FOLLOWING, user_id, request.args)
+
+@api.route('/profile/following/check')
+class FollowCheckResource(Resource):
+    @jwt_required()
+    @api.expect(follow_check_model)
+    def post(self):
+        """На кого из переданных пользователей подписан текущий — для отрисовки списков."""
+        user_ids, error = parse_ids((request.get_json() or {}).get("ids") or [])
+        if error:
+            return error
+        session = create_session()
+        try:
+            # Свои подписки читаются с primary: пользователь должен сразу видеть результат своего действия
+            following = set(session.execute(following_statement(int(get_jwt_identity()), user_ids)).scalars())
+        except Exception as e:
+            logger.error("Error checking follows", error=str(e))
+            return {"success": False, "msg": str(e)}, 500
+        finally:
+            session.close()
+        return {"success": True, "following": {str(user_id): user_id in following for user_id in user_ids}}, 200
+
+@api.route('/profiles/follow-counts')
+class FollowCountsResource(Resource):
+    @jwt_required()
+    @api.doc(params={'ids': 'Идентификаторы через запятую'})
+    def get(self):
+        user_ids, error = parse_ids([value for value in request.args.get('ids', '').split(',') if value])
+        if error:
+            return error
+        try:
+            counts = get_follow_counts(user_ids, load_follow_counts, timeout=current_app.config['FOLLOW_CACHE_TTL'])
+        except Exception as e:
+            logger.error("Error reading follow counts", error=str(e))
+            return {"success": False, "msg": str(e)}, 500
+        return {"success": True, "counts": {str(user_id): counts[user_id] for user_id in user_ids}}, 200
+
+@api.route('/profiles')
+class ProfileListResource(Resource):
+    @jwt_required()
+    @api.doc(params={'ids': 'Идентификаторы через запятую', 'fields': 'Поля через запятую'})
+    def get(self):
+        raw_ids = [value for value in request.args.get('ids', '').split(',') if value]
+        raw_fields = [value for value in request.args.get('fields', '').split(',') if value]
+        return read_profiles(raw_ids, raw_fields)
+
+@api.route('/profiles/search')
+class ProfileSearchResource(Resource):
+    @jwt_required()
+    @api.doc(params={
+        'q': 'Начало имени или фамилии (до 3 слов)', 'country': 'Страна', 'city': 'Город',
+        'limit': 'Размер страницы', 'cursor': 'next_cursor из предыдущей страницы',
+    })
+    def get(self):
+        return search_profiles(request.args)
+
+@api.route('/profiles/batch')
+class ProfileBatchResource(Resource):
+    @jwt_required()
+    @api.expect(batch_model)
+    def post(self):
+        req_data = request.get_json() or {}
+        raw_ids = req_data.get("ids")
+        if not isinstance(raw_ids, list):
+            return {"success": False, "msg": "Поле 'ids' должно быть списком"}, 400
+        return read_profiles(raw_ids, req_data.get("fields"))
+
+@api.route('/admin/profiles/export')
+class ProfileExport(Resource):
+    @api.doc(params={'format': 'ndjson или csv', 'since': 'Только измененные с этой даты (ISO 8601)'})
+    def get(self):
+        """Потоковая выгрузка; при Accept-Encoding: gzip сжимается на лету."""
+        if not is_admin_request():
+            return {"success": False, "msg": "Доступ запрещен"}, 403
+        fmt = request.args.get('format', 'ndjson')
+        try:
+            since = parse_since(request.args.get('since'))
+            # Реплика, если есть: выгрузка не занимает соединения primary
+            engine = current_app.extensions['db_replicas'].choose() or current_app.extensions['db_engine']
+            compress = bool(request.accept_encodings['gzip'])
+            chunks = export_profiles(engine, fmt, since, compress)
+        except ExportError as e:
+            return {"success": False, "msg": str(e)}, 400
+        headers = {"Content-Disposition": f"attachment; filename=profiles.{fmt}", "Vary": "Accept-Encoding"}
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        return current_app.response_class(chunks, mimetype=FORMATS[fmt], headers=headers)
+
+def create_app(config=None):
+    """Создает приложение без обращений к БД и Redis: соединения открываются при первом запросе.
+
+    Миграции применяются отдельно: `python migrate.py` или `flask migrate`.
+    """
+    app = Flask(__name__)
+    # Ошибки JWT должны доходить до обработчиков flask_jwt_extended (401/422), а не превращаться в 500
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+
+    # Конфигурация JWT
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'fallback_secret_key')
+    app.config['JWT_TOKEN_LOCATION'] = ['headers']  # Указываем, где искать токен (в заголовках)
+    app.config['JWT_HEADER_NAME'] = 'Authorization'  # Имя заголовка для токена
+    app.config['JWT_HEADER_TYPE'] = 'Bearer'  # Тип токена
+
+    # Конфигурация кэширования Redis
+    app.config['CACHE_TYPE'] = os.getenv('CACHE_TYPE', 'RedisCache')
+    app.config['CACHE_REDIS_URL'] = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+    app.config['PROFILE_CACHE_TTL'] = int(os.getenv('PROFILE_CACHE_TTL', 300))
+    app.config['PROFILE_BATCH_MAX_IDS'] = int(os.getenv('PROFILE_BATCH_MAX_IDS', 500))
+    app.config['PROFILE_SEARCH_CACHE_TTL'] = int(os.getenv('PROFILE_SEARCH_CACHE_TTL', 30))
+    app.config['PROFILE_SEARCH_MAX_LIMIT'] = int(os.getenv('PROFILE_SEARCH_MAX_LIMIT', 100))
+    # Токен для административных эндпоинтов (/admin/...); без него они недоступны
+    app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN')
+    # Профилирование медленных запросов: доля запросов под профайлером (0 — выключено), порог и куда писать
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_SLOW_MS'] = float(os.getenv('PROFILE_SLOW_MS', 500))
+    app.config['PROFILE_MODE'] = os.getenv('PROFILE_MODE', 'stack')
+    app.config['PROFILE_INTERVAL_MS'] = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', '/tmp/profiles')
+    # Ответы меньше порога не сжимаются: выигрыш в байтах меньше затрат на сжатие
+    app.config['COMPRESS_MIN_BYTES'] = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+    app.config['FOLLOW_CACHE_TTL'] = int(os.getenv('FOLLOW_CACHE_TTL', 300))
+    app.config['FOLLOW_PAGE_SIZE'] = int(os.getenv('FOLLOW_PAGE_SIZE', 20))
+    app.config['FOLLOW_PAGE_MAX_LIMIT'] = int(os.getenv('FOLLOW_PAGE_MAX_LIMIT', 100))
+    # Сколько секунд после изменения профиль читается с primary (верхняя граница отставания реплик)
+    app.config['REPLICA_STICKY_SECONDS'] = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+    # Как часто подтягивать отозванные токены из потока auth:revocations
+    app.config['JWT_REVOCATION_SYNC_INTERVAL'] = float(os.getenv('JWT_REVOCATION_SYNC_INTERVAL', 1.0))
+
+    # Загрузка аватаров: хранилище по содержимому и размеры миниатюр
+    app.config['MEDIA_ROOT'] = os.getenv('MEDIA_ROOT', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media'))
+    app.config['PICTURE_SIZES'] = [int(size) for size in os.getenv('PICTURE_SIZES', '64,256,512').split(',')]
+    app.config['PICTURE_MAX_BYTES'] = int(os.getenv('PICTURE_MAX_BYTES', 10 * 1024 * 1024))
+    app.config['MEDIA_WORKERS'] = int(os.getenv('MEDIA_WORKERS', 2))
+    app.config['MEDIA_CACHE_MAX_AGE'] = int(os.getenv('MEDIA_CACHE_MAX_AGE', 365 * 24 * 3600))
+
+    if config:
+        app.config.update(config)
+
+    api.init_app(app)
+    jwt.init_app(app)
+    configure_verification_keys(app, jwt)
+    cache.init_app(app)
+    app.extensions['revocation_filter'] = RevocationFilter(
+        redis.Redis.from_url(app.config['CACHE_REDIS_URL']),
+        sync_interval=app.config['JWT_REVOCATION_SYNC_INTERVAL'],
+    )
+
+    app.extensions['media_storage'] = MediaStorage(
+        app.config['MEDIA_ROOT'],
+        sizes=app.config['PICTURE_SIZES'],
+        max_bytes=app.config['PICTURE_MAX_BYTES'],
+        workers=app.config['MEDIA_WORKERS'],
+    )
+
+    # Создаем engine для подключения к базе данных
+    engine = create_db_engine(app.config.get('DATABASE_URL'))
+    # PATCH /profile и счетчики подписок пишутся через INSERT ... ON CONFLICT
+    check_upsert_support(engine.dialect.name)
+    # Реплики для чтения (DATABASE_REPLICA_URLS через запятую); без них все запросы идут на primary
+    replicas = create_replica_set(app.config.get('DATABASE_REPLICA_URLS'))
+    init_db(app, engine, replicas)
+    app.extensions['db_engine'] = engine
+    app.extensions['db_replicas'] = replicas
+
+    # RED-метрики по шаблону маршрута, методу и статусу + время в БД/кэше
+    init_metrics(app, engine, replicas)
+    # Семплирующий профайлер медленных запросов; при PROFILE_SAMPLE_RATE=0 хуки не ставятся
+    init_profiling(app)
+    app.before_request(before_request)
+    app.after_request(after_request)
+    # orjson для jsonify и сжатие gzip/brotli; регистрируется последним, чтобы latency учитывала сжатие
+    init_serialization(app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.add_url_rule('/media/<key>', 'media', media_view)
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Применяет миграции Alembic и завершается."""
+        run_migrations()
+
+    return app
+
+app = create_app()
+
+def run_asgi(port):
+    # Воркеры uvicorn — отдельные процессы: метрики собираются так же, как под gunicorn
+    import shutil
+    import uvicorn
+    workers = int(os.getenv('ASGI_WORKERS', 1))
+    if workers > 1:
+        path = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+    uvicorn.run('asgi:app', host='0.0.0.0', port=port, workers=workers)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5002)
\ No newline at end of file
+    # SERVER_MODE=asgi: те же маршруты на Starlette + asyncpg (asgi.py), по умолчанию — Flask
+    if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+        run_asgi(5002)
+    else:
+        app.run(host='0.0.0.0', port=5002)
\ No newline at end of file
@@ -0,0 +1,420 @@
+#asgi.py
+# ASGI-режим сервиса на Starlette, async SQLAlchemy (asyncpg) и redis.asyncio.
+# Маршруты: GET/PUT/PATCH /profile, PUT /profile/picture, GET /profile/<id>, GET /profiles,
+# POST /profiles/batch, GET /profiles/search, /media/<key>, /metrics.
+# Только в WSGI-режиме: граф подписок (/profile/<id>/follow, followers, following, /profile/following/check,
+# /profiles/follow-counts) и /admin/profiles/export; их обслуживает Flask-приложение.
+# Запуск: SERVER_MODE=asgi python app.py или uvicorn asgi:app --port 5002 --workers 4
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import FileResponse, Response
+from starlette.routing import Route
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, PyJWTError
+from prometheus_client import CONTENT_TYPE_LATEST
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+from database import ReplicaSet, RoutingSession, create_async_db_engine, replica_urls
+from models import Profile
+from marshmallow import ValidationError
+from schemas import profile_schema, PROFILE_COLUMNS, profile_row_to_dict
+from cache import AsyncProfileCache
+from revocation import AsyncRevocationFilter
+from search import SearchError, parse_search_args, search_statement, search_page
+from conditional import validator_headers, is_not_modified, if_match_failed, if_match_versions
+from patch import patch_statement
+from media import UploadError, KEY_RE, MIMETYPES
+from metrics import MetricsMiddleware, instrument_engine, metrics_payload
+from logs import RequestLogMiddleware
+from serialization import CompressionMiddleware, FastJSONResponse
+import redis.asyncio as aioredis
+import asyncio
+import os
+import structlog
+import app as wsgi
+
+logger = structlog.get_logger()
+
+
+class AuthError(Exception):
+    def __init__(self, msg, status):
+        super().__init__(msg)
+        self.msg = msg
+        self.status = status
+
+
+async def authenticate(request):
+    """Возвращает user_id из access-токена; ответы об ошибках — как у flask_jwt_extended."""
+    flask_app = request.app.state.flask_app
+    header = request.headers.get(flask_app.config['JWT_HEADER_NAME'])
+    if not header:
+        raise AuthError(f"Missing {flask_app.config['JWT_HEADER_NAME']} Header", 401)
+    parts = header.split()
+    if len(parts) != 2 or parts[0] != flask_app.config['JWT_HEADER_TYPE']:
+        raise AuthError(f"Bad {flask_app.config['JWT_HEADER_NAME']} header. "
+                        f"Expected value '{flask_app.config['JWT_HEADER_TYPE']} <JWT>'", 422)
+    try:
+        # Проверка идет через CachingJWTManager: кэш claims и ключи те же, что в WSGI-режиме
+        with flask_app.app_context():
+            claims = decode_token(parts[1])
+    except ExpiredSignatureError:
+        raise AuthError("Token has expired", 401)
+    except (PyJWTError, JWTExtendedException) as e:
+        raise AuthError(str(e), 422)
+    if claims.get('type') != 'access':
+        raise AuthError("Only non-refresh tokens are allowed", 422)
+    if await request.app.state.revocation_filter.is_revoked(claims['jti']):
+        raise AuthError("Token has been revoked", 401)
+    return int(claims['sub'])
+
+
+def auth_error_response(request, exc):
+    return FastJSONResponse({"msg": exc.msg}, exc.status)
+
+
+async def use_replica(state, user_ids):
+    return bool(state.replicas) and not await state.profile_cache.written_recently(user_ids)
+
+
+async def mark_written(state, user_id):
+    if state.replicas:
+        await state.profile_cache.remember_write(user_id, timeout=state.flask_app.config['REPLICA_STICKY_SECONDS'])
+
+
+async def load_profile(state, user_id):
+    statement = select(*PROFILE_COLUMNS).where(Profile.user_id == user_id).limit(1) \
+        .execution_options(replica=await use_replica(state, [user_id]))
+    async with state.sessionmaker() as session:
+        row = (await session.execute(statement)).first()
+        return profile_row_to_dict(row) if row else None
+
+
+async def read_profile(request, user_id):
+    state = request.app.state
+    try:
+        data = await state.profile_cache.get_profile(
+            user_id, lambda: load_profile(state, user_id),
+            timeout=state.flask_app.config['PROFILE_CACHE_TTL']
+        )
+    except Exception as e:
+        logger.error("Error reading profile", user_id=user_id, error=str(e))
+        return FastJSONResponse({"success": False, "msg": str(e)}, 500)
+    if data is None:
+        return FastJSONResponse({"success": False, "msg": "Профиль не найден"}, 404)
+    headers = dict(validator_headers(data), **{'Cache-Control': 'private, no-cache'})
+    if is_not_modified(data, request.headers.get('if-none-match'), request.headers.get('if-modified-since')):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse({"success": True, "profile": data}, 200, headers=headers)
+
+
+async def get_own_profile(request):
+    return await read_profile(request, await authenticate(request))
+
+
+async def update_profile(request):
+    user_id = await authenticate(request)
+    try:
+        # asyncpg не приводит строки к date, поэтому нужны типизированные значения из load()
+        data = profile_schema.load(await request.json())
+    except ValidationError as e:
+        return FastJSONResponse({"success": False, "msg": "Invalid data", "errors": e.messages}, 400)
+
+    state = request.app.state
+    if_match = request.headers.get('if-match')
+    conflict = FastJSONResponse({"success": False, "msg": "Профиль изменен другим запросом"}, 412)
+    try:
+        async with state.sessionmaker() as session:
+            for attempt in range(wsgi.UPDATE_ATTEMPTS):
+                profile = (await session.execute(
+                    select(Profile).where(Profile.user_id == user_id).limit(1)
+                )).scalars().first()
+                if if_match_failed(profile and {"user_id": profile.user_id, "version": profile.version}, if_match):
+                    return conflict
+                created = profile is None
+                if created:
+                    profile = Profile(user_id=user_id)
+                    session.add(profile)
+                for key, value in data.items():
+                    if value is not None:
+                        setattr(profile, key, value)
+                try:
+                    await session.flush()
+                    headers = validator_headers({"user_id": profile.user_id, "version": profile.version})
+                    await session.commit()
+                    break
+                except StaleDataError:
+                    await session.rollback()
+                    if if_match or attempt == wsgi.UPDATE_ATTEMPTS - 1:
+                        return conflict
+                except IntegrityError:
+                    # Профиль создан параллельно (см. wsgi.save_profile): перечитываем и обновляем
+                    await session.rollback()
+                    if not created or attempt == wsgi.UPDATE_ATTEMPTS - 1:
+                        raise
+    except Exception as e:
+        logger.error("Error updating profile", error=str(e))
+        return FastJSONResponse({"success": False, "msg": str(e)}, 500)
+
+    await mark_written(state, user_id)
+    await state.profile_cache.invalidate_profile(user_id)
+    return FastJSONResponse({"success": True, "msg": "Профиль успешно обновлен"}, 200, headers=headers)
+
+
+async def patch_profile(request):
+    user_id = await authenticate(request)
+    try:
+        data = profile_schema.load(await request.json())
+    except ValidationError as e:
+        return FastJSONResponse({"success": False, "msg": "Invalid data", "errors": e.messages}, 400)
+    if not data:
+        return FastJSONResponse({"success": False, "msg": "Нет полей для обновления"}, 400)
+
+    state = request.app.state
+    if_match = request.headers.get('if-match')
+    statement = patch_statement(state.engine.dialect.name, user_id, data, if_match_versions(user_id, if_match))
+    try:
+        async with state.sessionmaker() as session:
+            row = (await session.execute(statement)).first()
+            await session.commit()
+    except Exception as e:
+        logger.error("Error updating profile", error=str(e))
+        return FastJSONResponse({"success": False, "msg": str(e)}, 500)
+
+    timeout = state.flask_app.config['PROFILE_CACHE_TTL']
+    if row is not None:
+        profile = wsgi.profile_to_dict(row)
+        await mark_written(state, user_id)
+        await state.profile_cache.put_profile(user_id, profile, timeout=timeout)
+    else:
+        profile = await state.profile_cache.get_profile(
+            user_id, lambda: load_profile(state, user_id), timeout=timeout
+        )
+        if if_match_failed(profile, if_match):
+            return FastJSONResponse({"success": False, "msg": "Профиль изменен другим запросом"}, 412)
+        if profile is None:
+            return FastJSONResponse({"success": False, "msg": "Профиль не найден"}, 404)
+    return FastJSONResponse({"success": True, "profile": profile}, 200, headers=validator_headers(profile))
+
+
+async def get_user_profile(request):
+    await authenticate(request)
+    return await read_profile(request, request.path_params['user_id'])
+
+
+async def load_profiles(state, user_ids):
+    statement = select(*PROFILE_COLUMNS).where(Profile.user_id.in_(user_ids)) \
+        .execution_options(replica=await use_replica(state, user_ids))
+    async with state.sessionmaker() as session:
+        rows = (await session.execute(statement)).all()
+    return {row.user_id: profile_row_to_dict(row) for row in rows}
+
+
+async def read_profiles(request, raw_ids, raw_fields=None):
+    state = request.app.state
+    with state.flask_app.app_context():
+        user_ids, projection, error = wsgi.parse_profiles_request(raw_ids, raw_fields)
+    if error:
+        return FastJSONResponse(*error)
+    try:
+        found = await state.profile_cache.get_profiles(
+            user_ids, lambda ids: load_profiles(state, ids), timeout=state.flask_app.config['PROFILE_CACHE_TTL']
+        )
+    except Exception as e:
+        logger.error("Error reading profiles", error=str(e))
+        return FastJSONResponse({"success": False, "msg": str(e)}, 500)
+    return FastJSONResponse(*wsgi.profiles_response(user_ids, found, projection))
+
+
+async def list_profiles(request):
+    await authenticate(request)
+    raw_ids = [value for value in request.query_params.get('ids', '').split(',') if value]
+    raw_fields = [value for value in request.query_params.get('fields', '').split(',') if value]
+    return await read_profiles(request, raw_ids, raw_fields)
+
+
+async def batch_profiles(request):
+    await authenticate(request)
+    req_data = await request.json() or {}
+    raw_ids = req_data.get("ids")
+    if not isinstance(raw_ids, list):
+        return FastJSONResponse({"success": False, "msg": "Поле 'ids' должно быть списком"}, 400)
+    return await read_profiles(request, raw_ids, req_data.get("fields"))
+
+
+async def search_profiles(request):
+    await authenticate(request)
+    state = request.app.state
+    config = state.flask_app.config
+    try:
+        params = parse_search_args(request.query_params, max_limit=config['PROFILE_SEARCH_MAX_LIMIT'])
+    except SearchError as e:
+        return FastJSONResponse({"success": False, "msg": str(e)}, 400)
+
+    async def load_page():
+        async with state.sessionmaker() as session:
+            rows = (await session.execute(search_statement(params).execution_options(replica=True))).all()
+            return search_page(rows, params["limit"], profile_row_to_dict)
+
+    try:
+        page = await state.profile_cache.get_search_results(params, load_page, timeout=config['PROFILE_SEARCH_CACHE_TTL'])
+    except Exception as e:
+        logger.error("Error searching profiles", error=str(e))
+        return FastJSONResponse({"success": False, "msg": str(e)}, 500)
+    return FastJSONResponse(dict(page, success=True), 200)
+
+
+async def set_picture(state, user_id, key, variants):
+    async with state.sessionmaker() as session:
+        profile = (await session.execute(
+            select(Profile).where(Profile.user_id == user_id).limit(1)
+        )).scalars().first()
+        if not profile:
+            profile = Profile(user_id=user_id)
+            session.add(profile)
+        profile.profile_picture = wsgi.media_url(key)
+        profile.picture_variants = variants
+        await session.commit()
+    await mark_written(state, user_id)
+    await state.profile_cache.invalidate_profile(user_id)
+
+
+async def record_picture_variants(state, user_id, key, future):
+    storage = state.flask_app.extensions['media_storage']
+    try:
+        await asyncio.wrap_future(future)
+        values = {Profile.picture_variants: wsgi.picture_variant_urls(storage, key)}
+    except Exception:
+        values = {Profile.profile_picture: None, Profile.picture_variants: None}
+    values[Profile.version] = Profile.version + 1
+    try:
+        async with state.sessionmaker() as session:
+            await session.execute(update(Profile).where(
+                Profile.user_id == user_id, Profile.profile_picture == wsgi.media_url(key)
+            ).values(values))
+            await session.commit()
+    except Exception as e:
+        logger.error("Error saving picture variants", user_id=user_id, error=str(e))
+        return
+    await mark_written(state, user_id)
+    await state.profile_cache.invalidate_profile(user_id)
+
+
+async def upload_picture(request):
+    user_id = await authenticate(request)
+    state = request.app.state
+    storage = state.flask_app.extensions['media_storage']
+    if int(request.headers.get('content-length') or 0) > storage.max_bytes:
+        return FastJSONResponse({"success": False, "msg": f"Файл больше {storage.max_bytes} байт"}, 413)
+
+    upload = storage.open_upload()
+    try:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        key = upload.commit()
+    except UploadError as e:
+        upload.abort()
+        return FastJSONResponse({"success": False, "msg": e.msg}, e.status)
+    except BaseException:
+        # Обрыв соединения (ClientDisconnect, отмена задачи — CancelledError) или ошибка диска
+        upload.abort()
+        raise
+
+    ready = storage.has_variants(key)
+    try:
+        await set_picture(state, user_id, key, wsgi.picture_variant_urls(storage, key) if ready else None)
+    except Exception as e:
+        logger.error("Error updating profile picture", error=str(e))
+        return FastJSONResponse({"success": False, "msg": str(e)}, 500)
+    if not ready:
+        task = asyncio.create_task(record_picture_variants(state, user_id, key, storage.build_thumbnails(key)))
+        # Ссылка на задачу держится до ее завершения, иначе ее может собрать GC
+        state.background_tasks.add(task)
+        task.add_done_callback(state.background_tasks.discard)
+    return FastJSONResponse({"success": True, "profile_picture": wsgi.media_url(key),
+                             "picture_variants": wsgi.picture_variant_urls(storage, key), "ready": ready},
+                            200 if ready else 202)
+
+
+async def media(request):
+    key = request.path_params['key']
+    not_found = FastJSONResponse({"success": False, "msg": "Файл не найден"}, 404)
+    if not KEY_RE.match(key):
+        return not_found
+    path = request.app.state.flask_app.extensions['media_storage'].path(key)
+    if not os.path.exists(path):
+        return not_found
+    headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": f"public, max-age={request.app.state.flask_app.config['MEDIA_CACHE_MAX_AGE']}, immutable",
+    }
+    if headers["ETag"] in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=MIMETYPES[key.rsplit('.', 1)[1]], headers=headers)
+
+
+async def metrics(request):
+    return Response(metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
+
+def create_app(config=None):
+    """Создает ASGI-приложение с настройками Flask-приложения; соединения открываются при первом запросе."""
+    flask_app = wsgi.app if config is None else wsgi.create_app(config)
+
+    engine = create_async_db_engine(flask_app.config.get('DATABASE_URL'))
+    instrument_engine(engine.sync_engine)
+    replica_engines = [create_async_db_engine(url) for url in replica_urls(flask_app.config.get('DATABASE_REPLICA_URLS'))]
+    for replica in replica_engines:
+        instrument_engine(replica.sync_engine)
+    redis_client = aioredis.Redis.from_url(flask_app.config['CACHE_REDIS_URL'])
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await redis_client.aclose()
+        await engine.dispose()
+        for replica in replica_engines:
+            await replica.dispose()
+
+    routes = [
+        Route('/profile', get_own_profile, methods=['GET']),
+        Route('/profile', update_profile, methods=['PUT']),
+        Route('/profile', patch_profile, methods=['PATCH']),
+        Route('/profile/picture', upload_picture, methods=['PUT']),
+        Route('/profile/{user_id:int}', get_user_profile, methods=['GET']),
+        Route('/profiles', list_profiles, methods=['GET']),
+        Route('/profiles/batch', batch_profiles, methods=['POST']),
+        Route('/profiles/search', search_profiles, methods=['GET']),
+        Route('/media/{key}', media, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+    ]
+    app = Starlette(
+        routes=routes,
+        middleware=[
+            Middleware(RequestLogMiddleware),
+            Middleware(MetricsMiddleware, routes=routes),
+            Middleware(CompressionMiddleware, minimum_size=flask_app.config['COMPRESS_MIN_BYTES']),
+        ],
+        exception_handlers={AuthError: auth_error_response},
+        lifespan=lifespan,
+    )
+    app.state.flask_app = flask_app
+    app.state.engine = engine
+    # Маршрутизация по репликам выполняется синхронной сессией внутри AsyncSession
+    app.state.replicas = ReplicaSet([replica.sync_engine for replica in replica_engines])
+    app.state.sessionmaker = async_sessionmaker(engine, expire_on_commit=False,
+                                                sync_session_class=RoutingSession, replicas=app.state.replicas)
+    app.state.profile_cache = AsyncProfileCache(
+        redis_client, key_prefix=flask_app.config.get('CACHE_KEY_PREFIX', 'flask_cache_')
+    )
+    app.state.background_tasks = set()
+    app.state.revocation_filter = AsyncRevocationFilter(
+        redis_client, sync_interval=flask_app.config['JWT_REVOCATION_SYNC_INTERVAL']
+    )
+    return app
+
+
+app = create_app()
@@ -0,0 +1,164 @@
+#bench_follows.py
+# Граф подписок на синтетическом степенном распределении (нужен Postgres; миграции обоих сервисов применены).
+# Несколько «знаменитостей» получают по --celebrity-followers подписчиков, остальные подписываются
+# с перекосом к младшим id. Меряются чтения, которые видит клиент, и подписка на горячий аккаунт
+# из нескольких потоков (конкуренция за строку счетчика).
+# Запуск из каталога сервиса: python bench_follows.py [--users 1200000] [--celebrity-followers 1000000] [--keep]
+import argparse
+import os
+import statistics
+import threading
+import time
+from sqlalchemy import text, select, func
+from sqlalchemy.orm import Session
+from database import create_db_engine
+from models import Follow
+from follows import FOLLOWERS, FOLLOWING, follow, unfollow, page_statement, counts_statement, following_statement
+
+BENCH_LOGIN = "follow\\_bench\\_%"
+
+SEED_SQL = """
+INSERT INTO users (first_name, last_name, login, password_hash, mail, date_of_registration)
+SELECT 'Bench', 'Follow', 'follow_bench_' || g, 'x', 'follow_bench_' || g || '@example.com', CURRENT_TIMESTAMP
+FROM generate_series(1, :users) AS g;
+
+CREATE TEMP TABLE bench_users AS
+SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE login LIKE 'follow\\_bench\\_%';
+
+-- Знаменитости — первые --celebrities пользователей
+INSERT INTO follows (follower_id, followee_id)
+SELECT f.id, c.id
+FROM bench_users c JOIN bench_users f ON f.n > :celebrities AND f.n <= :celebrities + :celebrity_followers
+WHERE c.n <= :celebrities;
+
+-- Длинный хвост: --degree подписок на пользователя, цель тяготеет к младшим id (random()^3)
+-- Цель вычисляется в подзапросе: volatile random() в условии соединения не дал бы сделать hash join
+INSERT INTO follows (follower_id, followee_id)
+SELECT e.follower_id, t.id
+FROM (SELECT f.id AS follower_id, 1 + floor(:users * power(random(), 3))::int AS target
+      FROM bench_users f CROSS JOIN generate_series(1, :degree)) AS e
+JOIN bench_users t ON t.n = e.target
+WHERE t.id <> e.follower_id
+ON CONFLICT DO NOTHING;
+
+INSERT INTO follow_stats (user_id, followers, following)
+SELECT u.id, coalesce(fr.total, 0), coalesce(fg.total, 0)
+FROM bench_users u
+LEFT JOIN (SELECT followee_id AS id, count(*) AS total FROM follows GROUP BY followee_id) AS fr USING (id)
+LEFT JOIN (SELECT follower_id AS id, count(*) AS total FROM follows GROUP BY follower_id) AS fg USING (id)
+ON CONFLICT (user_id) DO UPDATE SET followers = excluded.followers, following = excluded.following;
+"""
+
+
+def seed(engine, args):
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT count(*) FROM users WHERE login LIKE :login"),
+                        {"login": BENCH_LOGIN}).scalar() >= args.users:
+            return
+        print(f"Заполнение: {args.users} пользователей, {args.celebrities} x {args.celebrity_followers} подписчиков...")
+        params = {"users": args.users, "celebrities": args.celebrities,
+                  "celebrity_followers": args.celebrity_followers, "degree": args.degree}
+        for statement in SEED_SQL.split(';'):
+            if statement.strip():
+                conn.execute(text(statement), params)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text("VACUUM ANALYZE follows"))
+        conn.execute(text("VACUUM ANALYZE follow_stats"))
+
+
+def cleanup(engine):
+    with engine.begin() as conn:
+        # follows и follow_stats удаляются каскадом
+        conn.execute(text("DELETE FROM users WHERE login LIKE :login"), {"login": BENCH_LOGIN})
+
+
+def timed(engine, make_statement, runs):
+    samples = []
+    with Session(engine) as session:
+        for _ in range(runs):
+            statement = make_statement()
+            start = time.perf_counter()
+            session.execute(statement).all()
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95)]
+
+
+def hot_follows(engine, celebrity, followers, threads):
+    """Подписка и отписка на одного пользователя из нескольких потоков; задержка транзакции целиком."""
+    samples = []
+    lock = threading.Lock()
+
+    def worker(chunk):
+        local = []
+        with Session(engine) as session:
+            for follower_id in chunk:
+                for action in (unfollow, follow):
+                    start = time.perf_counter()
+                    action(session, follower_id, celebrity)
+                    session.commit()
+                    local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            samples.extend(local)
+
+    chunks = [followers[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return len(samples) / elapsed, statistics.median(samples), samples[int(len(samples) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1_200_000)
+    parser.add_argument('--celebrities', type=int, default=3)
+    parser.add_argument('--celebrity-followers', type=int, default=1_000_000)
+    parser.add_argument('--degree', type=int, default=20, help='подписок на обычного пользователя')
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--keep', action='store_true', help='не удалять тестовые данные')
+    args = parser.parse_args()
+
+    # Заполнение и пересчет счетчиков дольше обычного statement_timeout
+    engine = create_db_engine(os.getenv('DATABASE_URL'), statement_timeout=0)
+    seed(engine, args)
+    try:
+        with engine.connect() as conn:
+            ids = conn.execute(text("SELECT id FROM users WHERE login LIKE :login ORDER BY id"),
+                               {"login": BENCH_LOGIN}).scalars().all()
+        celebrity, regular = ids[0], ids[len(ids) // 2]
+        deep_after = ids[args.celebrities + args.celebrity_followers // 2]
+        sample = ids[::max(1, len(ids) // 50)][:50]
+
+        shapes = {
+            'followers_first_page': lambda: page_statement(FOLLOWERS, celebrity, 0, 20),
+            'followers_deep_page': lambda: page_statement(FOLLOWERS, celebrity, deep_after, 20),
+            'following_first_page': lambda: page_statement(FOLLOWING, regular, 0, 20),
+            'counts_x50': lambda: counts_statement(sample),
+            'is_following_x50': lambda: following_statement(regular, sample),
+            # Без денормализованных счетчиков пришлось бы считать так
+            'count_star_celebrity': lambda: select(func.count()).select_from(Follow)
+                                            .where(Follow.followee_id == celebrity),
+        }
+        print(f"{'запрос':22} {'p50, мс':>8} {'p95, мс':>8}")
+        for name, make_statement in shapes.items():
+            runs = max(5, args.runs // 20) if name == 'count_star_celebrity' else args.runs
+            p50, p95 = timed(engine, make_statement, runs)
+            print(f"{name:22} {p50:8.2f} {p95:8.2f}")
+
+        followers = ids[args.celebrities:args.celebrities + args.runs]
+        rate, p50, p95 = hot_follows(engine, celebrity, followers, args.threads)
+        print(f"подписка на знаменитость, {args.threads} потоков: {rate:.0f} транзакций/с, "
+              f"p50 {p50:.2f} мс, p95 {p95:.2f} мс")
+    finally:
+        if not args.keep:
+            cleanup(engine)
+
+
+if __name__ == '__main__':
+    main()
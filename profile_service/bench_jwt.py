@@ -0,0 +1,64 @@
+#bench_jwt.py
+# Сравнение пропускной способности проверки JWT с кэшем claims и без него.
+# Запуск: python bench_jwt.py [--iterations 20000] [--algorithm HS256|RS256|EdDSA]
+import argparse
+import time
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, decode_token
+from tokens import CachingJWTManager
+
+
+def generate_keys(algorithm):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+    if algorithm == 'EdDSA':
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_pem, public_pem
+
+
+def make_app(manager_class, algorithm, keys):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'benchmark_secret_key_of_sufficient_length'
+    app.config['JWT_ALGORITHM'] = algorithm
+    if keys:
+        app.config['JWT_PRIVATE_KEY'], app.config['JWT_PUBLIC_KEY'] = keys
+    manager_class(app)
+    return app
+
+
+def run(manager_class, algorithm, keys, iterations, tokens):
+    app = make_app(manager_class, algorithm, keys)
+    with app.app_context():
+        pool = [create_access_token(identity=str(i)) for i in range(tokens)]
+        start = time.perf_counter()
+        for i in range(iterations):
+            decode_token(pool[i % tokens])
+        elapsed = time.perf_counter() - start
+    return iterations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--tokens', type=int, default=100, help='Число различных токенов в нагрузке')
+    parser.add_argument('--algorithm', default='HS256')
+    args = parser.parse_args()
+
+    keys = generate_keys(args.algorithm) if args.algorithm != 'HS256' else None
+    uncached = run(JWTManager, args.algorithm, keys, args.iterations, args.tokens)
+    cached = run(CachingJWTManager, args.algorithm, keys, args.iterations, args.tokens)
+    print(f"algorithm={args.algorithm} iterations={args.iterations} tokens={args.tokens}")
+    print(f"uncached: {uncached:,.0f} verifications/s")
+    print(f"cached:   {cached:,.0f} verifications/s ({cached / uncached:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#bench_logging.py
+# Нагрузочное сравнение p50/p99 задержки запроса с синхронным и очередным логированием.
+# stdout подменяется пайпом в отдельный процесс, чтобы запись в лог стоила как в контейнере.
+# Запуск из каталога сервиса: python bench_logging.py [--requests 5000] [--threads 8] [--sample-rate 1.0]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import structlog
+from flask import Flask, request
+from logs import configure_logging, bind_request_id, set_request_id_header
+
+
+def make_app():
+    app = Flask(__name__)
+    logger = structlog.get_logger()
+
+    @app.before_request
+    def before_request():
+        bind_request_id()
+        request.start = time.perf_counter()
+
+    @app.after_request
+    def after_request(response):
+        logger.info("Request completed", path=request.path, method=request.method,
+                    status=response.status_code, latency=time.perf_counter() - request.start, sample=True)
+        return set_request_id_header(response)
+
+    @app.route('/ping')
+    def ping():
+        return {"success": True}
+
+    return app
+
+
+def run(mode, requests_total, threads):
+    os.environ['LOG_ASYNC'] = mode
+    configure_logging()
+    app = make_app()
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        client = app.test_client()
+        local = []
+        for _ in range(count):
+            start = time.perf_counter()
+            client.get('/ping')
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(requests_total // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--sample-rate', default='1.0')
+    args = parser.parse_args()
+    os.environ['LOG_SAMPLE_RATE'] = args.sample_rate
+
+    reader = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True)
+    real_stdout, sys.stdout = sys.stdout, reader.stdin
+    try:
+        results = {mode: run(mode, args.requests, args.threads) for mode in ('false', 'true')}
+    finally:
+        sys.stdout = real_stdout
+        reader.stdin.close()
+        reader.wait()
+
+    print(f"requests={args.requests} threads={args.threads} sample_rate={args.sample_rate}")
+    for mode, label in (('false', 'sync '), ('true', 'queue')):
+        r = results[mode]
+        print(f"{label}: {r['rps']:,.0f} req/s, p50 {r['p50']:.2f} ms, p99 {r['p99']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
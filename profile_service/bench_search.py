@@ -0,0 +1,124 @@
+#bench_search.py
+# Задержка /profiles/search по формам запроса на 1M синтетических профилей (нужен Postgres с pg_trgm).
+# Перед запуском примените миграции обоих сервисов (auth_service/migrate.py, затем migrate.py).
+# Для сравнения меряется та же глубокая страница через OFFSET и через seek-курсор.
+# Запуск из каталога сервиса: python bench_search.py [--profiles 1000000] [--runs 50] [--keep]
+import argparse
+import os
+import statistics
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import create_db_engine
+from search import parse_search_args, search_statement, decode_cursor, search_page
+
+FIRST_NAMES = ['Иван', 'Петр', 'Анна', 'Мария', 'Алексей', 'Ольга', 'Дмитрий', 'Елена', 'Сергей', 'Наталья',
+               'Андрей', 'Татьяна', 'Михаил', 'Ирина', 'Николай', 'Светлана', 'Павел', 'Юлия', 'Роман', 'Ксения']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов', 'Михайлов',
+              'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров', 'Павлов']
+LOCATIONS = [('Россия', 'Москва'), ('Россия', 'Санкт-Петербург'), ('Россия', 'Казань'), ('Россия', 'Омск'),
+             ('Беларусь', 'Минск'), ('Казахстан', 'Алматы'), ('Россия', 'Тверь'), ('Армения', 'Ереван')]
+
+SHAPES = {
+    'name_prefix': {'q': 'ива'},
+    'first_last': {'q': 'анна смир'},
+    'rare_name': {'q': 'ксения лебед'},
+    'country_city': {'country': 'Россия', 'city': 'Омск'},
+    'name_city': {'q': 'пет', 'city': 'Казань'},
+}
+
+SEED_SQL = """
+INSERT INTO users (first_name, last_name, login, password_hash, mail, date_of_registration)
+SELECT 'Bench', 'Search', 'search_bench_' || g, 'x', 'search_bench_' || g || '@example.com', CURRENT_TIMESTAMP
+FROM generate_series(1, :count) AS g;
+
+INSERT INTO profiles (user_id, first_name, last_name, country, city)
+SELECT u.id,
+       (:first_names)[1 + (u.id * 7919) % cardinality(:first_names)],
+       (:last_names)[1 + (u.id * 104729) % cardinality(:last_names)],
+       (:countries)[1 + (u.id * 31) % cardinality(:countries)],
+       (:cities)[1 + (u.id * 31) % cardinality(:cities)]
+FROM users u WHERE u.login LIKE 'search\\_bench\\_%';
+"""
+
+
+def seed(engine, count):
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT count(*) FROM users WHERE login LIKE 'search\\_bench\\_%'")).scalar() >= count:
+            return
+        print(f"Заполнение {count} профилей...")
+        params = {
+            'count': count, 'first_names': FIRST_NAMES, 'last_names': LAST_NAMES,
+            'countries': [country for country, _ in LOCATIONS], 'cities': [city for _, city in LOCATIONS],
+        }
+        for statement in SEED_SQL.split(';'):
+            if statement.strip():
+                conn.execute(text(statement), params)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text("VACUUM ANALYZE profiles"))
+
+
+def cleanup(engine):
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE login LIKE 'search\\_bench\\_%'"))
+
+
+def timed(engine, statement, runs):
+    samples = []
+    with Session(engine) as session:
+        for _ in range(runs):
+            start = time.perf_counter()
+            rows = session.execute(statement).all()
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95)], rows
+
+
+def plan(engine, statement):
+    compiled = statement.compile(engine, compile_kwargs={'literal_binds': True})
+    with engine.connect() as conn:
+        lines = conn.execute(text(f"EXPLAIN {compiled}")).scalars().all()
+    # Узел, который реально читает таблицу: индекс или Seq Scan
+    scans = [line.strip().lstrip('-> ') for line in lines if 'Scan' in line]
+    return scans[0] if scans else lines[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', type=int, default=1_000_000)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--deep-pages', type=int, default=200, help='глубина страницы для сравнения OFFSET и seek')
+    parser.add_argument('--keep', action='store_true', help='не удалять тестовые профили')
+    args = parser.parse_args()
+
+    # Заполнение миллиона строк и VACUUM дольше обычного statement_timeout
+    engine = create_db_engine(os.getenv('DATABASE_URL'), statement_timeout=0)
+    seed(engine, args.profiles)
+    try:
+        print(f"{'форма':14} {'p50, мс':>8} {'p95, мс':>8}  план")
+        for name, query in SHAPES.items():
+            params = parse_search_args(dict(query, limit=str(args.limit)))
+            statement = search_statement(params)
+            p50, p95, _ = timed(engine, statement, args.runs)
+            print(f"{name:14} {p50:8.2f} {p95:8.2f}  {plan(engine, statement)}")
+
+        # Глубокая страница: seek-курсор против OFFSET
+        params = parse_search_args({'q': 'ива', 'limit': str(args.limit)})
+        for _ in range(args.deep_pages):
+            rows = timed(engine, search_statement(params), 1)[2]
+            cursor = search_page(rows, args.limit, lambda profile: None)['next_cursor']
+            if not cursor:
+                break
+            params['after'] = decode_cursor(cursor)
+        seek_p50 = timed(engine, search_statement(params), args.runs)[0]
+        offset = search_statement(dict(params, after=0)).offset(args.deep_pages * args.limit)
+        offset_p50 = timed(engine, offset, args.runs)[0]
+        print(f"страница {args.deep_pages}: seek {seek_p50:.2f} мс, OFFSET {offset_p50:.2f} мс")
+    finally:
+        if not args.keep:
+            cleanup(engine)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#bench_serialization.py
+# Ответ на 500 профилей по стадиям: строки -> словари (ORM + marshmallow или кортежи столбцов),
+# словари -> JSON (json.dumps, как было в flask_restx, или orjson), JSON -> сжатие (gzip/brotli).
+# Строки читаются из SQLite в памяти, Postgres не нужен.
+# Запуск из каталога сервиса: python bench_serialization.py [--profiles 500] [--runs 200]
+import argparse
+import json
+import time
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from models import Base, Profile, users_table
+from schemas import PROFILE_COLUMNS, profile_row_to_dict, profile_schema
+from serialization import ENCODINGS, compress, dumps
+
+
+def seed(engine, count):
+    Base.metadata.create_all(engine)
+    updated_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as conn:
+        conn.execute(insert(users_table), [{"id": i} for i in range(1, count + 1)])
+        conn.execute(insert(Profile), [{
+            "user_id": i, "first_name": "Иван", "last_name": f"Иванов{i}", "gender": "Мужской",
+            "date_of_birth": date(1990, 1, 1) + timedelta(days=i), "country": "Россия", "city": "Москва",
+            "profile_picture": f"/media/{i:064x}.jpg",
+            "picture_variants": {str(size): f"/media/{i:064x}-{size}.jpg" for size in (64, 256, 512)},
+            "version": 1, "updated_at": updated_at + timedelta(seconds=i),
+        } for i in range(1, count + 1)])
+
+
+def orm_dicts(engine):
+    with Session(engine) as session:
+        return [dict(profile_schema.dump(profile), user_id=profile.user_id)
+                for profile in session.scalars(select(Profile))]
+
+
+def row_dicts(engine):
+    with engine.connect() as conn:
+        return [profile_row_to_dict(row) for row in conn.execute(select(*PROFILE_COLUMNS))]
+
+
+def rate(action, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = action()
+    return runs / (time.perf_counter() - start), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    seed(engine, args.profiles)
+    print(f"{'стадия':28} {'ответов/с':>10} {'байт':>9}")
+
+    stages = {'ORM + marshmallow': lambda: orm_dicts(engine), 'кортежи столбцов': lambda: row_dicts(engine)}
+    for name, action in stages.items():
+        per_second, profiles = rate(action, args.runs)
+        print(f"{name:28} {per_second:10.0f} {'':>9}")
+    assert orm_dicts(engine) == profiles
+
+    payload = {"success": True, "profiles": {str(p["user_id"]): p for p in profiles}, "missing": []}
+    encoders = {'json.dumps': lambda: json.dumps(payload).encode('utf-8'), 'orjson': lambda: dumps(payload)}
+    for name, action in encoders.items():
+        per_second, body = rate(action, args.runs)
+        print(f"{name:28} {per_second:10.0f} {len(body):9}")
+
+    for encoding in ENCODINGS:
+        per_second, compressed = rate(lambda: compress(body, encoding), args.runs)
+        print(f"{encoding:28} {per_second:10.0f} {len(compressed):9}")
+
+    # Весь путь ответа: было — ORM, marshmallow и json.dumps без сжатия, стало — кортежи, orjson и сжатие
+    before, _ = rate(lambda: json.dumps({"profiles": orm_dicts(engine)}).encode('utf-8'), args.runs)
+    after, _ = rate(lambda: compress(dumps({"profiles": row_dicts(engine)}), ENCODINGS[0]), args.runs)
+    print(f"{'итого: было / стало':28} {before:10.0f} / {after:.0f}")
+
+
+if __name__ == '__main__':
+    main()
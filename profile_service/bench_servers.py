@@ -0,0 +1,154 @@
+#bench_servers.py
+# Нагрузочное сравнение WSGI (gunicorn + Flask) и ASGI (uvicorn + Starlette) при равном бюджете CPU:
+# одинаковое число процессов, сервер закреплен на тех же ядрах (taskset), генератор нагрузки — на остальных.
+# Нужны Postgres и Redis из DATABASE_URL/REDIS_URL (например, docker compose up postgres redis).
+# Запуск из каталога сервиса: python bench_servers.py [--workers 2] [--threads 4] [--concurrency 64] [--duration 20]
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import random
+import time
+import httpx
+from sqlalchemy import text
+from flask_jwt_extended import create_access_token
+
+PORT = 5102
+
+
+def server_command(mode, workers, threads):
+    if mode == 'wsgi':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+                   '--threads', str(threads), '--bind', f'127.0.0.1:{PORT}', 'app:app']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(workers),
+                   '--port', str(PORT), '--log-level', 'warning']
+    if shutil.which('taskset') and hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))[:workers]
+        command = ['taskset', '-c', ','.join(map(str, cpus))] + command
+    return command
+
+
+def server_env(args):
+    env = dict(os.environ)
+    env.update({
+        'LOG_SAMPLE_RATE': '0',
+        'PROMETHEUS_MULTIPROC_DIR': f'/tmp/prometheus_bench_{PORT}',
+    })
+    shutil.rmtree(env['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    return env
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/metrics', timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Сервер не поднялся")
+
+
+def seed(users):
+    """Создает пользователей bench_user_N с профилями и возвращает {user_id: access_token}."""
+    import app
+    engine = app.app.extensions['db_engine']
+    with engine.begin() as conn:
+        for i in range(users):
+            conn.execute(text(
+                "INSERT INTO users (first_name, last_name, login, password_hash, mail, date_of_registration) "
+                "VALUES ('Bench', 'User', :login, 'x', :mail, CURRENT_TIMESTAMP) ON CONFLICT DO NOTHING"
+            ), {"login": f"bench_user_{i}", "mail": f"bench_user_{i}@example.com"})
+        user_ids = conn.execute(text("SELECT id FROM users WHERE login LIKE 'bench_user_%'")).scalars().all()
+        for user_id in user_ids:
+            conn.execute(text(
+                "INSERT INTO profiles (user_id, first_name, last_name) VALUES (:user_id, 'Bench', 'User') "
+                "ON CONFLICT DO NOTHING"
+            ), {"user_id": user_id})
+    with app.app.app_context():
+        return {user_id: create_access_token(identity=str(user_id)) for user_id in user_ids}
+
+
+async def drive(base_url, tokens, concurrency, duration, warmup, write_ratio):
+    latencies = []
+    errors = 0
+    user_ids = list(tokens)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        measure_from = time.monotonic() + warmup
+        stop_at = measure_from + duration
+
+        async def worker():
+            nonlocal errors
+            while True:
+                start = time.monotonic()
+                if start >= stop_at:
+                    return
+                user_id = random.choice(user_ids)
+                headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+                try:
+                    # Чтения чужих профилей из кэша с долей обновлений своего профиля
+                    if random.random() < write_ratio:
+                        response = await client.put('/profile', headers=headers, json={"city": f"City {start}"})
+                    else:
+                        response = await client.get(f'/profile/{random.choice(user_ids)}', headers=headers)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if start >= measure_from:
+                    latencies.append(time.monotonic() - start)
+                    errors += not ok
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    latencies.sort()
+    return {
+        "rps": len(latencies) / duration,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def run(mode, args, tokens):
+    if hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) > args.workers:
+            os.sched_setaffinity(0, cpus[args.workers:])
+    server = subprocess.Popen(server_command(mode, args.workers, args.threads), env=server_env(args),
+                              stdout=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{PORT}'
+        wait_ready(base_url)
+        return asyncio.run(drive(base_url, tokens, args.concurrency, args.duration, args.warmup,
+                                 args.write_ratio))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='потоков на воркер gunicorn')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+
+    tokens = seed(args.users)
+    results = {mode: run(mode, args, tokens) for mode in ('wsgi', 'asgi')}
+    print(f"GET /profile/<id> + PUT /profile ({args.write_ratio:.0%}) workers={args.workers} threads={args.threads} "
+          f"concurrency={args.concurrency} users={len(tokens)}")
+    for mode, r in results.items():
+        print(f"{mode}: {r['rps']:,.0f} req/s, p50 {r['p50']:.1f} ms, p99 {r['p99']:.1f} ms, errors {r['errors']}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
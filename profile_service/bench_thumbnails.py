@@ -0,0 +1,70 @@
+#bench_thumbnails.py
+# Сколько байт экономит лента на миниатюрах и сколько CPU стоит их построение.
+# Снимок генерируется синтетически (шум + градиент, как у фото), миниатюры строятся так же, как в media.py,
+# и для сравнения — полным декодированием без draft().
+# Запуск из каталога сервиса: python bench_thumbnails.py [--width 4000] [--height 3000] [--runs 5]
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+from PIL import Image
+from media import make_thumbnails, variant_key
+
+
+def make_photo(width, height):
+    noise = Image.effect_noise((width, height), 64).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buf = io.BytesIO()
+    Image.blend(noise, gradient, 0.5).save(buf, 'JPEG', quality=92)
+    return buf.getvalue()
+
+
+def full_decode_thumbnails(source, targets):
+    with Image.open(source) as image:
+        image = image.convert('RGB')
+        for size, path in targets.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            thumbnail.save(path, 'JPEG', quality=85)
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--sizes', default='64,256,512')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, 'original.jpg')
+        with open(source, 'wb') as f:
+            f.write(make_photo(args.width, args.height))
+        targets = {size: os.path.join(root, variant_key('original.jpg', size)) for size in sizes}
+
+        draft_ms = timed(lambda: make_thumbnails(source, targets, 100_000_000), args.runs)
+        full_ms = timed(lambda: full_decode_thumbnails(source, targets), args.runs)
+        make_thumbnails(source, targets, 100_000_000)
+
+        original = os.path.getsize(source)
+        print(f"оригинал {args.width}x{args.height}: {original / 1024:.0f} КБ")
+        for size in sizes:
+            variant = os.path.getsize(targets[size])
+            print(f"  {size:4}px: {variant / 1024:7.1f} КБ ({original / variant:.0f}x меньше)")
+        print(f"миниатюры с draft(): {draft_ms:.1f} мс, полным декодированием: {full_ms:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,572 @@
+#cache.py
+from cachelib.serializers import RedisSerializer
+from flask_caching import Cache
+from metrics import cache_timer
+from prometheus_client import Counter
+from redis.exceptions import WatchError
+import asyncio
+import hashlib
+import json
+import structlog
+import threading
+import time
+import uuid
+import zlib
+
+logger = structlog.get_logger()
+
+cache = Cache()
+
+PROFILE_CACHE_REQUESTS = Counter(
+    'profile_cache_requests_total',
+    'Profile cache lookups by result',
+    ['result']
+)
+
+PROFILE_SEARCH_CACHE_REQUESTS = Counter(
+    'profile_search_cache_requests_total',
+    'Profile search cache lookups by result',
+    ['result']
+)
+
+FOLLOW_CACHE_REQUESTS = Counter(
+    'follow_cache_requests_total',
+    'Follow counts and first-page cache lookups by result',
+    ['kind', 'result']
+)
+
+PROFILE_KEY = "profile:{}"
+SEARCH_KEY = "profile_search:{}"
+FOLLOW_COUNTS_KEY = "follow_counts:{}"
+FOLLOW_PAGE_KEY = "follow_page:{}:{}"
+# Метка недавней записи: пока она жива, профиль читается с primary, а не с реплики
+WRITTEN_KEY = "profile_written:{}"
+LOCK_SUFFIX = ":lock"
+
+# Полосатые блокировки: не больше одного загрузчика на user_id внутри процесса
+_LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+
+def profile_key(user_id):
+    return PROFILE_KEY.format(int(user_id))
+
+
+def search_key(params):
+    return SEARCH_KEY.format(hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest())
+
+
+def _local_lock(key):
+    return _locks[zlib.crc32(key.encode('utf-8')) % _LOCK_STRIPES]
+
+
+def _cache_get(key):
+    try:
+        with cache_timer():
+            return cache.get(key)
+    except Exception as e:
+        # Недоступность Redis не должна ломать чтение профилей
+        logger.warning("Profile cache unavailable", error=str(e))
+        return None
+
+
+def get_profile(user_id, loader, timeout=None, lock_timeout=5, wait=2.0):
+    """Возвращает профиль из кэша, при промахе загружает его через loader().
+
+    Загрузка выполняется одним потоком на процесс и одним процессом на ключ
+    (блокировка через SET NX в Redis), остальные ждут заполнения кэша.
+    """
+    key = profile_key(user_id)
+    data = _cache_get(key)
+    if data is not None:
+        PROFILE_CACHE_REQUESTS.labels(result='hit').inc()
+        return data
+    PROFILE_CACHE_REQUESTS.labels(result='miss').inc()
+
+    with _local_lock(key):
+        data = _cache_get(key)
+        if data is not None:
+            return data
+
+        lock_key = key + LOCK_SUFFIX
+        lease = uuid.uuid4().hex
+        try:
+            acquired = cache.add(lock_key, lease, timeout=lock_timeout)
+        except Exception:
+            acquired = True
+
+        if not acquired:
+            # Профиль уже загружает другой процесс — ждём его результата
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                time.sleep(0.02)
+                data = _cache_get(key)
+                if data is not None:
+                    return data
+            return loader()
+
+        try:
+            data = loader()
+            if data is not None:
+                try:
+                    with cache_timer():
+                        _set_if_newer({key: data}, timeout=timeout, leases={key: lease})
+                except Exception as e:
+                    logger.warning("Profile cache write failed", user_id=user_id, error=str(e))
+            return data
+        finally:
+            try:
+                cache.delete(lock_key)
+            except Exception:
+                pass
+
+
+def get_profiles(user_ids, loader, timeout=None, lock_timeout=5):
+    """Пакетное чтение: один MGET по всем ключам, промахи догружаются одним вызовом loader(ids)."""
+    user_ids = [int(user_id) for user_id in user_ids]
+    keys = [profile_key(user_id) for user_id in user_ids]
+    try:
+        with cache_timer():
+            cached = cache.get_many(*keys) if keys else []
+    except Exception as e:
+        logger.warning("Profile cache unavailable", error=str(e))
+        cached = [None] * len(keys)
+
+    result = {}
+    missing = []
+    for user_id, data in zip(user_ids, cached):
+        if data is not None:
+            result[user_id] = data
+        else:
+            missing.append(user_id)
+    PROFILE_CACHE_REQUESTS.labels(result='hit').inc(len(result))
+    PROFILE_CACHE_REQUESTS.labels(result='miss').inc(len(missing))
+
+    if missing:
+        leases = _acquire_leases([profile_key(user_id) for user_id in missing], lock_timeout)
+        try:
+            loaded = loader(missing)
+            if loaded:
+                try:
+                    with cache_timer():
+                        _set_if_newer({profile_key(user_id): data for user_id, data in loaded.items()},
+                                      timeout=timeout, leases=leases)
+                except Exception as e:
+                    logger.warning("Profile cache write failed", error=str(e))
+                result.update(loaded)
+        finally:
+            _release_leases(leases)
+    return result
+
+
+def get_search_results(params, loader, timeout=None):
+    """Кэш страниц поиска. Не инвалидируется при изменении профилей — живет timeout секунд."""
+    key = search_key(params)
+    data = _cache_get(key)
+    if data is not None:
+        PROFILE_SEARCH_CACHE_REQUESTS.labels(result='hit').inc()
+        return data
+    PROFILE_SEARCH_CACHE_REQUESTS.labels(result='miss').inc()
+    data = loader()
+    try:
+        with cache_timer():
+            cache.set(key, data, timeout=timeout)
+    except Exception as e:
+        logger.warning("Profile search cache write failed", error=str(e))
+    return data
+
+
+def _is_newer(data, current):
+    return current is None or current.get('version') is None or current['version'] < data['version']
+
+
+def _redis_backend():
+    """cachelib RedisCache за flask_caching или None (SimpleCache и NullCache в тестах и бенчмарках)."""
+    backend = cache.cache
+    return backend if hasattr(backend, '_write_client') else None
+
+
+def _acquire_leases(keys, lock_timeout):
+    """Аренды загрузчика ({ключ: токен}) для пакетного чтения; занятые другим загрузчиком ключи пропускаются."""
+    leases = {key: uuid.uuid4().hex for key in keys}
+    try:
+        backend = _redis_backend()
+        if backend is None:
+            return {key: lease for key, lease in leases.items() if cache.add(key + LOCK_SUFFIX, lease, timeout=lock_timeout)}
+        prefix = backend._get_prefix()
+        pipe = backend._write_client.pipeline(transaction=False)
+        for key, lease in leases.items():
+            pipe.set(prefix + key + LOCK_SUFFIX, backend.serializer.dumps(lease), ex=lock_timeout, nx=True)
+        return {key: lease for (key, lease), acquired in zip(leases.items(), pipe.execute()) if acquired}
+    except Exception as e:
+        logger.warning("Profile cache unavailable", error=str(e))
+        return {}
+
+
+def _release_leases(leases):
+    if leases:
+        try:
+            cache.delete_many(*[key + LOCK_SUFFIX for key in leases])
+        except Exception:
+            pass
+
+
+def _set_if_newer(items, timeout=None, leases=None, attempts=3):
+    """Пишет профили {ключ: data}, если в кэше их нет или там версия ниже.
+
+    Проверка и запись атомарны (WATCH/MULTI). leases — аренды загрузчика {ключ: токен}:
+    пишутся только ключи, аренда которых еще цела. invalidate_profile снимает аренду вместе
+    с профилем, поэтому строка, прочитанная из БД до инвалидации, в кэш не попадает.
+    Возвращает False, если ключи так и не удалось записать из-за конкурентных изменений.
+    """
+    backend = _redis_backend()
+    if backend is None:
+        # Кэш в памяти процесса: межпроцессных гонок нет, хватает сравнения версий
+        for key, data in items.items():
+            if leases is not None and cache.get(key + LOCK_SUFFIX) != leases.get(key):
+                continue
+            if _is_newer(data, cache.get(key)):
+                cache.set(key, data, timeout=timeout)
+        return True
+
+    if leases is not None:
+        items = {key: data for key, data in items.items() if key in leases}
+    if not items:
+        return True
+    prefix = backend._get_prefix()
+    serializer = backend.serializer
+    names = [prefix + key for key in items]
+    lease_names = [prefix + key + LOCK_SUFFIX for key in items] if leases is not None else []
+    expire = backend._normalize_timeout(timeout)
+    for _ in range(attempts):
+        with backend._write_client.pipeline() as pipe:
+            try:
+                pipe.watch(*names, *lease_names)
+                current = pipe.mget(names)
+                held = pipe.mget(lease_names) if lease_names else [None] * len(names)
+                writes = [
+                    (name, data) for (key, data), name, value, lease in zip(items.items(), names, current, held)
+                    if (leases is None or serializer.loads(lease) == leases[key]) and _is_newer(data, serializer.loads(value))
+                ]
+                if not writes:
+                    return True
+                pipe.multi()
+                for name, data in writes:
+                    pipe.set(name, serializer.dumps(data), ex=None if expire == -1 else expire)
+                pipe.execute()
+                return True
+            except WatchError:
+                continue
+    return False
+
+
+def put_profile(user_id, data, timeout=None):
+    """Записывает свежую строку профиля в кэш вместо удаления: следующий GET не идет в БД.
+
+    Запись с версией не новее закэшированной пропускается, чтобы медленный запрос
+    не вернул в кэш устаревшие данные.
+    """
+    try:
+        with cache_timer():
+            written = _set_if_newer({profile_key(user_id): data}, timeout=timeout)
+    except Exception as e:
+        logger.warning("Profile cache write failed", user_id=user_id, error=str(e))
+        written = False
+    if not written:
+        # Не удалось обновить — хотя бы удаляем, иначе GET отдаст старую версию до истечения TTL
+        invalidate_profile(user_id)
+
+
+def get_follow_counts(user_ids, loader, timeout=None):
+    """Счетчики подписок пачкой: один MGET, промахи догружаются одним вызовом loader(ids)."""
+    keys = [FOLLOW_COUNTS_KEY.format(int(user_id)) for user_id in user_ids]
+    try:
+        with cache_timer():
+            cached = cache.get_many(*keys)
+    except Exception as e:
+        logger.warning("Follow cache unavailable", error=str(e))
+        cached = [None] * len(keys)
+    result = {user_id: data for user_id, data in zip(user_ids, cached) if data is not None}
+    missing = [user_id for user_id in user_ids if user_id not in result]
+    FOLLOW_CACHE_REQUESTS.labels(kind='counts', result='hit').inc(len(result))
+    FOLLOW_CACHE_REQUESTS.labels(kind='counts', result='miss').inc(len(missing))
+    if missing:
+        loaded = loader(missing)
+        put_follow_counts(loaded, timeout=timeout)
+        result.update(loaded)
+    return result
+
+
+def put_follow_counts(counts, timeout=None):
+    """Записывает счетчики, возвращенные UPDATE ... RETURNING, вместо удаления ключей.
+
+    Для популярных аккаунтов счетчик меняется постоянно, и удаление отправляло бы каждое чтение в БД.
+    """
+    try:
+        with cache_timer():
+            cache.set_many({FOLLOW_COUNTS_KEY.format(user_id): data for user_id, data in counts.items()}, timeout=timeout)
+    except Exception as e:
+        logger.warning("Follow cache write failed", error=str(e))
+        try:
+            cache.delete_many(*[FOLLOW_COUNTS_KEY.format(user_id) for user_id in counts])
+        except Exception:
+            pass
+
+
+def get_first_page(direction, user_id, loader, timeout=None):
+    key = FOLLOW_PAGE_KEY.format(direction, int(user_id))
+    data = _cache_get(key)
+    if data is not None:
+        FOLLOW_CACHE_REQUESTS.labels(kind='page', result='hit').inc()
+        return data
+    FOLLOW_CACHE_REQUESTS.labels(kind='page', result='miss').inc()
+    data = loader()
+    try:
+        with cache_timer():
+            cache.set(key, data, timeout=timeout)
+    except Exception as e:
+        logger.warning("Follow cache write failed", error=str(e))
+    return data
+
+
+def invalidate_first_page(direction, user_id, member_id):
+    """Сбрасывает первую страницу, только если member_id в нее попадает (страницы упорядочены по id).
+
+    Подписки на популярный аккаунт почти всегда приходят от id за пределами первой страницы,
+    поэтому его закэшированная страница живет до истечения TTL.
+    """
+    key = FOLLOW_PAGE_KEY.format(direction, int(user_id))
+    try:
+        page = cache.get(key)
+        if page is not None and not (page['next_cursor'] and member_id > page['ids'][-1]):
+            cache.delete(key)
+    except Exception as e:
+        logger.warning("Follow cache invalidation failed", user_id=user_id, error=str(e))
+
+
+def remember_write(user_id, timeout):
+    try:
+        cache.set(WRITTEN_KEY.format(int(user_id)), 1, timeout=timeout)
+    except Exception as e:
+        logger.warning("Profile write mark failed", user_id=user_id, error=str(e))
+
+
+def written_recently(user_ids):
+    """True, если хотя бы один из профилей изменялся недавно (или Redis недоступен — тогда читаем с primary)."""
+    try:
+        return any(value is not None for value in cache.get_many(*[WRITTEN_KEY.format(int(user_id)) for user_id in user_ids]))
+    except Exception:
+        return True
+
+
+def invalidate_profile(user_id):
+    """Удаляет профиль и аренду его загрузчика: строку, прочитанную до записи, загрузчик в кэш уже не положит."""
+    key = profile_key(user_id)
+    try:
+        cache.delete_many(key, key + LOCK_SUFFIX)
+    except Exception as e:
+        logger.warning("Profile cache invalidation failed", user_id=user_id, error=str(e))
+
+
+class AsyncProfileCache:
+    """get_profile/invalidate_profile для ASGI-режима поверх redis.asyncio.
+
+    Ключи, префикс и сериализация совпадают с RedisCache из flask_caching,
+    поэтому WSGI- и ASGI-процессы делят одни и те же записи.
+    """
+
+    def __init__(self, client, key_prefix='flask_cache_', lock_stripes=_LOCK_STRIPES):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.serializer = RedisSerializer()
+        self.lock_stripes = lock_stripes
+        self._locks = None
+
+    def _local_lock(self, key):
+        # Блокировки создаются внутри цикла событий сервера (в Python 3.9 они к нему привязываются)
+        if self._locks is None:
+            self._locks = [asyncio.Lock() for _ in range(self.lock_stripes)]
+        return self._locks[zlib.crc32(key.encode('utf-8')) % self.lock_stripes]
+
+    async def _get(self, key):
+        try:
+            with cache_timer():
+                value = await self.client.get(self.key_prefix + key)
+        except Exception as e:
+            logger.warning("Profile cache unavailable", error=str(e))
+            return None
+        return None if value is None else self.serializer.loads(value)
+
+    async def get_profile(self, user_id, loader, timeout=None, lock_timeout=5, wait=2.0):
+        key = profile_key(user_id)
+        data = await self._get(key)
+        if data is not None:
+            PROFILE_CACHE_REQUESTS.labels(result='hit').inc()
+            return data
+        PROFILE_CACHE_REQUESTS.labels(result='miss').inc()
+
+        async with self._local_lock(key):
+            data = await self._get(key)
+            if data is not None:
+                return data
+
+            lock_key = self.key_prefix + key + LOCK_SUFFIX
+            lease = uuid.uuid4().hex
+            try:
+                acquired = await self.client.set(lock_key, self.serializer.dumps(lease), ex=lock_timeout, nx=True)
+            except Exception:
+                acquired = True
+
+            if not acquired:
+                deadline = time.monotonic() + wait
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.02)
+                    data = await self._get(key)
+                    if data is not None:
+                        return data
+                return await loader()
+
+            try:
+                data = await loader()
+                if data is not None:
+                    try:
+                        with cache_timer():
+                            await self._set_if_newer({key: data}, timeout=timeout, leases={key: lease})
+                    except Exception as e:
+                        logger.warning("Profile cache write failed", user_id=user_id, error=str(e))
+                return data
+            finally:
+                try:
+                    await self.client.delete(lock_key)
+                except Exception:
+                    pass
+
+    async def _acquire_leases(self, keys, lock_timeout):
+        leases = {key: uuid.uuid4().hex for key in keys}
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, lease in leases.items():
+                pipe.set(self.key_prefix + key + LOCK_SUFFIX, self.serializer.dumps(lease), ex=lock_timeout, nx=True)
+            return {key: lease for (key, lease), acquired in zip(leases.items(), await pipe.execute()) if acquired}
+        except Exception as e:
+            logger.warning("Profile cache unavailable", error=str(e))
+            return {}
+
+    async def _release_leases(self, leases):
+        if leases:
+            try:
+                await self.client.delete(*[self.key_prefix + key + LOCK_SUFFIX for key in leases])
+            except Exception:
+                pass
+
+    async def _set_if_newer(self, items, timeout=None, leases=None, attempts=3):
+        """Как _set_if_newer: WATCH/MULTI, запись только новее закэшированной и при целой аренде."""
+        if leases is not None:
+            items = {key: data for key, data in items.items() if key in leases}
+        if not items:
+            return True
+        names = [self.key_prefix + key for key in items]
+        lease_names = [self.key_prefix + key + LOCK_SUFFIX for key in items] if leases is not None else []
+        for _ in range(attempts):
+            async with self.client.pipeline() as pipe:
+                try:
+                    await pipe.watch(*names, *lease_names)
+                    current = await pipe.mget(names)
+                    held = await pipe.mget(lease_names) if lease_names else [None] * len(names)
+                    writes = [
+                        (name, data) for (key, data), name, value, lease in zip(items.items(), names, current, held)
+                        if (leases is None or self.serializer.loads(lease) == leases[key])
+                        and _is_newer(data, self.serializer.loads(value))
+                    ]
+                    if not writes:
+                        return True
+                    pipe.multi()
+                    for name, data in writes:
+                        pipe.set(name, self.serializer.dumps(data), ex=timeout)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+        return False
+
+    async def invalidate_profile(self, user_id):
+        key = self.key_prefix + profile_key(user_id)
+        try:
+            await self.client.delete(key, key + LOCK_SUFFIX)
+        except Exception as e:
+            logger.warning("Profile cache invalidation failed", user_id=user_id, error=str(e))
+
+    async def put_profile(self, user_id, data, timeout=None):
+        try:
+            with cache_timer():
+                written = await self._set_if_newer({profile_key(user_id): data}, timeout=timeout)
+        except Exception as e:
+            logger.warning("Profile cache write failed", user_id=user_id, error=str(e))
+            written = False
+        if not written:
+            await self.invalidate_profile(user_id)
+
+    async def remember_write(self, user_id, timeout):
+        try:
+            await self.client.set(self.key_prefix + WRITTEN_KEY.format(int(user_id)), self.serializer.dumps(1), ex=timeout)
+        except Exception as e:
+            logger.warning("Profile write mark failed", user_id=user_id, error=str(e))
+
+    async def written_recently(self, user_ids):
+        try:
+            values = await self.client.mget([self.key_prefix + WRITTEN_KEY.format(int(user_id)) for user_id in user_ids])
+        except Exception:
+            return True
+        return any(value is not None for value in values)
+
+    async def get_profiles(self, user_ids, loader, timeout=None, lock_timeout=5):
+        """Как get_profiles: один MGET, промахи догружаются одним await loader(ids) и пишутся одной транзакцией."""
+        user_ids = [int(user_id) for user_id in user_ids]
+        keys = [self.key_prefix + profile_key(user_id) for user_id in user_ids]
+        try:
+            with cache_timer():
+                values = await self.client.mget(keys) if keys else []
+        except Exception as e:
+            logger.warning("Profile cache unavailable", error=str(e))
+            values = [None] * len(keys)
+
+        result = {}
+        missing = []
+        for user_id, value in zip(user_ids, values):
+            if value is not None:
+                result[user_id] = self.serializer.loads(value)
+            else:
+                missing.append(user_id)
+        PROFILE_CACHE_REQUESTS.labels(result='hit').inc(len(result))
+        PROFILE_CACHE_REQUESTS.labels(result='miss').inc(len(missing))
+
+        if missing:
+            leases = await self._acquire_leases([profile_key(user_id) for user_id in missing], lock_timeout)
+            try:
+                loaded = await loader(missing)
+                if loaded:
+                    try:
+                        with cache_timer():
+                            await self._set_if_newer({profile_key(user_id): data for user_id, data in loaded.items()},
+                                                     timeout=timeout, leases=leases)
+                    except Exception as e:
+                        logger.warning("Profile cache write failed", error=str(e))
+                    result.update(loaded)
+            finally:
+                await self._release_leases(leases)
+        return result
+
+    async def get_search_results(self, params, loader, timeout=None):
+        key = search_key(params)
+        data = await self._get(key)
+        if data is not None:
+            PROFILE_SEARCH_CACHE_REQUESTS.labels(result='hit').inc()
+            return data
+        PROFILE_SEARCH_CACHE_REQUESTS.labels(result='miss').inc()
+        data = await loader()
+        try:
+            with cache_timer():
+                await self.client.set(self.key_prefix + key, self.serializer.dumps(data), ex=timeout)
+        except Exception as e:
+            logger.warning("Profile search cache write failed", error=str(e))
+        return data
@@ -0,0 +1,73 @@
+#conditional.py
+# Валидаторы HTTP-кэша для профиля: ETag из (user_id, version), Last-Modified из updated_at.
+# Оба берутся из закэшированного словаря профиля, поэтому 304 отдается без запроса в БД.
+from datetime import datetime, timezone
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+
+def profile_etag(data):
+    if data.get('version') is None:
+        return None
+    return f"{data['user_id']}-{data['version']}"
+
+
+def profile_last_modified(data):
+    if not data.get('updated_at'):
+        return None
+    updated_at = datetime.fromisoformat(data['updated_at'])
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    # В HTTP-датах нет долей секунды
+    return updated_at.replace(microsecond=0)
+
+
+def validator_headers(data):
+    headers = {}
+    etag = profile_etag(data)
+    if etag:
+        headers['ETag'] = quote_etag(etag)
+    last_modified = profile_last_modified(data)
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(data, if_none_match=None, if_modified_since=None):
+    """Проверка для GET по RFC 9110: If-None-Match главнее If-Modified-Since."""
+    if if_none_match:
+        etag = profile_etag(data)
+        return etag is not None and parse_etags(if_none_match).contains_weak(etag)
+    if if_modified_since:
+        last_modified = profile_last_modified(data)
+        since = parse_date(if_modified_since)
+        return last_modified is not None and since is not None and last_modified <= since
+    return False
+
+
+def if_match_failed(data, if_match):
+    """True, если If-Match не совпадает с текущей версией (data=None — профиля еще нет)."""
+    if not if_match:
+        return False
+    etags = parse_etags(if_match)
+    if data is None:
+        return True
+    if etags.star_tag:
+        return False
+    etag = profile_etag(data)
+    # Для If-Match сравнение только строгое
+    return etag is None or not etags.contains(etag)
+
+
+def if_match_versions(user_id, if_match):
+    """Версии профиля из If-Match для условия UPDATE: [] для «*», None — заголовка нет.
+
+    Чужие и слабые ETag отбрасываются; если не осталось ни одного, возвращается [None] — такое условие не выполнится.
+    """
+    if not if_match:
+        return None
+    etags = parse_etags(if_match)
+    if etags.star_tag:
+        return []
+    prefix = f"{int(user_id)}-"
+    versions = [int(etag[len(prefix):]) for etag in etags if etag.startswith(prefix) and etag[len(prefix):].isdigit()]
+    return versions or [None]
@@ -0,0 +1,155 @@
+#consumer.py
+# Создание профилей по событиям регистрации из auth_service (поток auth:user_events, группа потребителей).
+# Запуск: python consumer.py (экземпляры делят поток через consumer group)
+from cachelib.serializers import RedisSerializer
+from redis.exceptions import ResponseError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from prometheus_client import Counter
+from models import Profile
+from database import upsert_insert
+from cache import profile_key
+import json
+import os
+import socket
+import time
+import structlog
+
+logger = structlog.get_logger()
+
+USER_EVENTS = Counter(
+    'profile_user_events_total',
+    'User events consumed from auth_service by result',
+    ['result']
+)
+
+# Ключ совпадает с auth_service/outbox.py
+USER_EVENTS_STREAM = "auth:user_events"
+CONSUMER_GROUP = "profile_service"
+
+
+class UserEventConsumer:
+    """Читает события пачками, создает профили одним INSERT ... ON CONFLICT DO NOTHING и прогревает кэш.
+
+    Записи кэша пишутся через SET NX в формате RedisCache (префикс и сериализация flask_caching),
+    чтобы не затереть более свежее значение. Сообщения подтверждаются (XACK) только после коммита;
+    зависшие у упавшего экземпляра забираются через XAUTOCLAIM.
+    """
+
+    def __init__(self, engine, client, to_dict, key_prefix='flask_cache_', cache_ttl=300, name=None,
+                 batch_size=500, block_ms=1000, claim_idle_ms=60000):
+        self.engine = engine
+        self.client = client
+        self.to_dict = to_dict
+        self.key_prefix = key_prefix
+        self.cache_ttl = cache_ttl
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.serializer = RedisSerializer()
+
+    def ensure_group(self):
+        try:
+            self.client.xgroup_create(USER_EVENTS_STREAM, CONSUMER_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    @staticmethod
+    def _field(fields, name):
+        value = fields.get(name.encode(), fields.get(name))
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _rows(self, entries):
+        rows = {}
+        for _, fields in entries:
+            if self._field(fields, 'type') != 'user_registered':
+                USER_EVENTS.labels(result='skipped').inc()
+                continue
+            payload = json.loads(self._field(fields, 'payload'))
+            rows[int(payload['user_id'])] = {
+                "user_id": int(payload['user_id']),
+                "first_name": payload.get('first_name'),
+                "last_name": payload.get('last_name'),
+            }
+        return list(rows.values())
+
+    def _insert(self, session, rows):
+        # Повторная доставка и уже созданный через PUT профиль — не ошибка
+        statement = upsert_insert(self.engine.dialect.name, Profile).on_conflict_do_nothing(index_elements=['user_id'])
+        try:
+            with session.begin_nested():
+                session.execute(statement, rows)
+        except IntegrityError:
+            # Пользователь удален до обработки события (FK) — пропускаем только такие строки
+            for row in rows:
+                try:
+                    with session.begin_nested():
+                        session.execute(statement, [row])
+                except IntegrityError:
+                    USER_EVENTS.labels(result='failed').inc()
+                    logger.warning("Profile for user event not created", user_id=row['user_id'])
+
+    def _warm_cache(self, profiles):
+        pipe = self.client.pipeline(transaction=False)
+        for profile in profiles:
+            pipe.set(self.key_prefix + profile_key(profile.user_id),
+                     self.serializer.dumps(self.to_dict(profile)), ex=self.cache_ttl, nx=True)
+        pipe.execute()
+
+    def handle(self, entries):
+        rows = self._rows(entries)
+        if rows:
+            with Session(self.engine) as session:
+                self._insert(session, rows)
+                session.commit()
+                profiles = session.execute(
+                    select(Profile).where(Profile.user_id.in_([row['user_id'] for row in rows]))
+                ).scalars().all()
+                try:
+                    self._warm_cache(profiles)
+                except Exception as e:
+                    logger.warning("Profile cache warm-up failed", error=str(e))
+            USER_EVENTS.labels(result='processed').inc(len(rows))
+        if entries:
+            self.client.xack(USER_EVENTS_STREAM, CONSUMER_GROUP, *[entry_id for entry_id, _ in entries])
+
+    def poll_once(self):
+        # Сначала сообщения, которые давно взял и не подтвердил другой экземпляр
+        _, entries, *_ = self.client.xautoclaim(USER_EVENTS_STREAM, CONSUMER_GROUP, self.name,
+                                                min_idle_time=self.claim_idle_ms, count=self.batch_size)
+        if not entries:
+            response = self.client.xreadgroup(CONSUMER_GROUP, self.name, {USER_EVENTS_STREAM: '>'},
+                                              count=self.batch_size, block=self.block_ms)
+            entries = response[0][1] if response else []
+        self.handle(entries)
+        return len(entries)
+
+    def run(self):
+        self.ensure_group()
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error("User event consumer failed", error=str(e))
+                time.sleep(1)
+
+
+def main():
+    import redis
+    from app import app, profile_to_dict
+    consumer = UserEventConsumer(
+        app.extensions['db_engine'],
+        redis.Redis.from_url(app.config['CACHE_REDIS_URL']),
+        profile_to_dict,
+        key_prefix=app.config.get('CACHE_KEY_PREFIX', 'flask_cache_'),
+        cache_ttl=app.config['PROFILE_CACHE_TTL'],
+        batch_size=int(os.getenv('USER_EVENTS_BATCH_SIZE', 500)),
+    )
+    consumer.run()
+
+
+if __name__ == '__main__':
+    main()
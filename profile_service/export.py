@@ -0,0 +1,146 @@
+#export.py
+# Потоковая выгрузка профилей в NDJSON/CSV (с gzip на лету) для аналитики и резервных копий.
+# Запуск: python export.py [--format csv] [--since 2026-01-01] [--gzip] [-o profiles.ndjson.gz]  (по умолчанию stdout)
+from datetime import date, datetime
+from sqlalchemy import select
+from models import Profile
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+EXPORT_COLUMNS = (Profile.user_id, Profile.first_name, Profile.last_name, Profile.gender, Profile.date_of_birth,
+                  Profile.country, Profile.city, Profile.profile_picture, Profile.picture_variants,
+                  Profile.version, Profile.updated_at)
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Строк на одну короткую транзакцию; между кусками соединение возвращается в пул
+CHUNK_ROWS = 50_000
+# Строк за один FETCH из серверного курсора
+YIELD_PER = 1000
+FLUSH_BYTES = 64 * 1024
+
+
+class ExportError(Exception):
+    pass
+
+
+def parse_since(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError("since должен быть датой в формате ISO 8601")
+
+
+def export_statement(since, after, limit):
+    # Даты регистрации здесь нет (она в auth_service), поэтому since — по времени последнего изменения
+    statement = select(*EXPORT_COLUMNS).where(Profile.user_id > after)
+    if since is not None:
+        statement = statement.where(Profile.updated_at >= since)
+    return statement.order_by(Profile.user_id).limit(limit)
+
+
+def iter_rows(engine, since=None, chunk_rows=CHUNK_ROWS, yield_per=YIELD_PER):
+    """Строки кусками по chunk_rows: каждый кусок — отдельная транзакция с серверным курсором (Core, без ORM).
+
+    Память не зависит от размера таблицы, и ни одна транзакция не живет дольше одного куска.
+    Цена — выгрузка не является снимком: строка, измененная по ходу, попадет в новой версии.
+    """
+    after = 0
+    while True:
+        count = 0
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=yield_per) \
+                .execute(export_statement(since, after, chunk_rows))
+            for row in result:
+                count += 1
+                after = row.user_id
+                yield row
+        if count < chunk_rows:
+            return
+
+
+def _value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    # picture_variants — словарь; в CSV он попадает JSON-строкой
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return _value(value)
+
+
+def encode_rows(rows, fmt):
+    """Генератор байтов: NDJSON или CSV с заголовком, куски по FLUSH_BYTES."""
+    names = [column.name for column in EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if fmt == 'csv':
+        writer.writerow(names)
+    for row in rows:
+        if fmt == 'csv':
+            writer.writerow([_csv_value(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(names, map(_value, row))), ensure_ascii=False))
+            buffer.write('\n')
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 — формат gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_profiles(engine, fmt='ndjson', since=None, compress=False):
+    if fmt not in FORMATS:
+        raise ExportError("Поддерживаются форматы ndjson и csv")
+    chunks = encode_rows(iter_rows(engine, since), fmt)
+    return gzip_stream(chunks) if compress else chunks
+
+
+def main():
+    from database import create_db_engine, create_replica_set
+
+    parser = argparse.ArgumentParser(description="Выгрузка профилей")
+    parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    parser.add_argument('--since', help="Только измененные начиная с даты (ISO 8601)")
+    parser.add_argument('--gzip', action='store_true', help="Сжимать (включается сам для файла .gz)")
+    parser.add_argument('-o', '--output', default='-', help="Файл или '-' для stdout")
+    args = parser.parse_args()
+    try:
+        since = parse_since(args.since)
+    except ExportError as e:
+        parser.error(str(e))
+
+    # Выгрузка читает с реплики, если она задана
+    engine = create_replica_set().choose() or create_db_engine()
+    compress = args.gzip or args.output.endswith('.gz')
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        for chunk in export_profiles(engine, args.format, since, compress):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#follows.py
+# Граф подписок: ребра в follows, счетчики в follow_stats, страницы followers/following через seek по id.
+from sqlalchemy import delete, select
+from database import upsert_insert
+from models import Follow, FollowStats
+from search import SearchError, encode_cursor, decode_cursor
+
+FOLLOWERS = 'followers'
+FOLLOWING = 'following'
+
+
+class FollowError(Exception):
+    pass
+
+
+def _bump_counts(session, follower_id, followee_id, delta):
+    """Оба счетчика одним INSERT ... ON CONFLICT DO UPDATE; возвращает новые значения {user_id: counts}.
+
+    Строки идут по возрастанию user_id, чтобы встречные подписки A->B и B->A блокировали их
+    в одном порядке и не упирались в deadlock.
+    """
+    rows = sorted([
+        {"user_id": follower_id, "followers": 0, "following": delta},
+        {"user_id": followee_id, "followers": delta, "following": 0},
+    ], key=lambda row: row["user_id"])
+    statement = upsert_insert(session.get_bind().dialect.name, FollowStats).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={"followers": FollowStats.followers + statement.excluded.followers,
+              "following": FollowStats.following + statement.excluded.following},
+    ).returning(FollowStats.user_id, FollowStats.followers, FollowStats.following)
+    return {row.user_id: {"followers": row.followers, "following": row.following}
+            for row in session.execute(statement)}
+
+
+def follow(session, follower_id, followee_id):
+    """Добавляет ребро. Возвращает новые счетчики обоих пользователей или None, если подписка уже была."""
+    if follower_id == followee_id:
+        raise FollowError("Нельзя подписаться на себя")
+    statement = upsert_insert(session.get_bind().dialect.name, Follow).values(
+        follower_id=follower_id, followee_id=followee_id
+    ).on_conflict_do_nothing().returning(Follow.followee_id)
+    if session.execute(statement).first() is None:
+        return None
+    return _bump_counts(session, follower_id, followee_id, 1)
+
+
+def unfollow(session, follower_id, followee_id):
+    """Удаляет ребро. Возвращает новые счетчики или None, если подписки не было."""
+    statement = delete(Follow).where(
+        Follow.follower_id == follower_id, Follow.followee_id == followee_id
+    ).returning(Follow.followee_id)
+    if session.execute(statement).first() is None:
+        return None
+    return _bump_counts(session, follower_id, followee_id, -1)
+
+
+def parse_page_args(args, default_limit=20, max_limit=100):
+    try:
+        limit = int(args.get('limit', default_limit))
+    except ValueError:
+        raise FollowError("Некорректный limit")
+    if not 1 <= limit <= max_limit:
+        raise FollowError(f"limit должен быть от 1 до {max_limit}")
+    cursor = args.get('cursor')
+    try:
+        after = decode_cursor(cursor) if cursor else 0
+    except SearchError as e:
+        raise FollowError(str(e))
+    return {"limit": limit, "after": after}
+
+
+def page_statement(direction, user_id, after, limit):
+    """Соседи пользователя по возрастанию id после курсора; limit + 1 строк — чтобы узнать о следующей странице."""
+    if direction == FOLLOWERS:
+        owner, other = Follow.followee_id, Follow.follower_id
+    else:
+        owner, other = Follow.follower_id, Follow.followee_id
+    return select(other).where(owner == user_id, other > after).order_by(other).limit(limit + 1)
+
+
+def adjacency_page(ids, limit):
+    page = ids[:limit]
+    return {"ids": page, "next_cursor": encode_cursor(page[-1]) if len(ids) > limit else None}
+
+
+def counts_statement(user_ids):
+    return select(FollowStats.user_id, FollowStats.followers, FollowStats.following) \
+        .where(FollowStats.user_id.in_(user_ids))
+
+
+def following_statement(follower_id, user_ids):
+    """Кого из user_ids читает follower_id: точечные поиски по первичному ключу."""
+    return select(Follow.followee_id).where(Follow.follower_id == follower_id, Follow.followee_id.in_(user_ids))
@@ -0,0 +1,185 @@
+#logs.py
+from flask import request, g
+from prometheus_client import Counter
+import atexit
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+import structlog
+
+LOG_RECORDS_DROPPED = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+
+class QueueLogSink:
+    """Неблокирующий приемник логов: запись кладется в очередь, фоновый поток пишет пачками.
+
+    При переполнении очереди запись отбрасывается (и учитывается в метрике), запрос не ждет stdout.
+    """
+
+    def __init__(self, stream=None, maxsize=10000, batch_size=256, flush_interval=0.1):
+        self.stream = stream or sys.stdout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # Поток запускается лениво и заново после fork воркера
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._thread = threading.Thread(target=self._run, name='log-sink', daemon=True)
+                    self._thread.start()
+                    self._pid = os.getpid()
+
+    def put(self, line):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def _drain(self, first):
+        lines = [first]
+        while len(lines) < self.batch_size:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self.stream.write('\n'.join(lines) + '\n')
+        self.stream.flush()
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._drain(first)
+
+    def flush(self):
+        while True:
+            try:
+                first = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._drain(first)
+
+
+class QueueLogger:
+    def __init__(self, sink):
+        self._sink = sink
+
+    def msg(self, message):
+        self._sink.put(message)
+
+    log = debug = info = warn = warning = error = critical = exception = fatal = failure = err = msg
+
+
+class QueueLoggerFactory:
+    def __init__(self, sink):
+        self._sink = sink
+
+    def __call__(self, *args):
+        return QueueLogger(self._sink)
+
+
+class RequestSampler:
+    """Процессор structlog: оставляет долю успешных быстрых запросов, ошибки и медленные — всегда."""
+
+    def __init__(self, rate=1.0, slow_ms=500):
+        self.rate = rate
+        self.slow_seconds = slow_ms / 1000.0
+
+    def __call__(self, logger, method_name, event_dict):
+        if not event_dict.pop('sample', False) or self.rate >= 1.0:
+            return event_dict
+        if event_dict.get('status', 0) >= 400 or event_dict.get('latency', 0) >= self.slow_seconds:
+            return event_dict
+        if random.random() < self.rate:
+            return event_dict
+        raise structlog.DropEvent
+
+
+def configure_logging():
+    processors = [
+        structlog.contextvars.merge_contextvars,
+        RequestSampler(
+            rate=float(os.getenv('LOG_SAMPLE_RATE', 1.0)),
+            slow_ms=float(os.getenv('LOG_SLOW_REQUEST_MS', 500)),
+        ),
+        structlog.processors.TimeStamper(fmt="iso"),
+        structlog.processors.JSONRenderer()
+    ]
+    if os.getenv('LOG_ASYNC', 'true').lower() in ('1', 'true', 'yes'):
+        sink = QueueLogSink(
+            maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+            batch_size=int(os.getenv('LOG_BATCH_SIZE', 256)),
+            flush_interval=float(os.getenv('LOG_FLUSH_INTERVAL', 0.1)),
+        )
+        atexit.register(sink.flush)
+        logger_factory = QueueLoggerFactory(sink)
+    else:
+        logger_factory = structlog.PrintLoggerFactory()
+
+    structlog.configure(
+        processors=processors,
+        context_class=dict,
+        logger_factory=logger_factory,
+        wrapper_class=structlog.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+
+def bind_request_id():
+    # Идентификатор запроса попадает во все строки лога этого запроса через contextvars
+    structlog.contextvars.clear_contextvars()
+    g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    structlog.contextvars.bind_contextvars(request_id=g.request_id)
+
+
+def set_request_id_header(response):
+    if 'request_id' in g:
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+    return response
+
+
+class RequestLogMiddleware:
+    """ASGI-вариант bind_request_id/set_request_id_header и строки "Request completed"."""
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = structlog.get_logger()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        header = REQUEST_ID_HEADER.lower().encode('latin-1')
+        request_id = next((value.decode('latin-1') for name, value in scope['headers'] if name == header), None)
+        request_id = request_id or uuid.uuid4().hex
+        structlog.contextvars.clear_contextvars()
+        structlog.contextvars.bind_contextvars(request_id=request_id)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message['headers'] = list(message.get('headers', [])) + [(header, request_id.encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.logger.info("Request completed", path=scope['path'], method=scope['method'],
+                             status=status, latency=time.perf_counter() - start, sample=True)
@@ -0,0 +1,193 @@
+#media.py
+from concurrent.futures import Future, ProcessPoolExecutor
+from prometheus_client import Counter, Histogram
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import structlog
+
+logger = structlog.get_logger()
+
+PICTURE_UPLOADS = Counter(
+    'profile_picture_uploads_total',
+    'Profile picture uploads by result',
+    ['result']
+)
+THUMBNAIL_SECONDS = Histogram(
+    'profile_picture_thumbnail_seconds',
+    'Time to build all thumbnails of one picture'
+)
+
+# Сигнатуры поддерживаемых форматов: тип определяется по содержимому, а не по заголовкам клиента
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+MIMETYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'}
+# <sha256>.<ext> — оригинал, <sha256>-<size>.jpg — миниатюра
+KEY_RE = re.compile(r'^[0-9a-f]{64}(-\d{1,4})?\.(jpg|png|gif|webp)$')
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.msg = msg
+        self.status = status
+
+
+def sniff_format(head):
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+def variant_key(original_key, size):
+    return f"{original_key.split('.')[0]}-{size}.jpg"
+
+
+def make_thumbnails(source, targets, max_pixels):
+    """Строит миниатюры в процессе пула. targets — {размер: путь}; файлы пишутся атомарно."""
+    from PIL import Image, ImageOps
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(source) as image:
+        # Для JPEG декодер сразу уменьшает картинку кратно 1/2..1/8 — основная экономия CPU
+        image.draft('RGB', (max(targets), max(targets)))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in sorted(targets, reverse=True):
+            image.thumbnail((size, size), Image.LANCZOS)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(targets[size]), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, 'JPEG', quality=85, optimize=True, progressive=True)
+            os.replace(tmp_path, targets[size])
+    return sorted(targets)
+
+
+class Upload:
+    """Потоковая запись тела запроса во временный файл с подсчетом SHA-256."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.size = 0
+        self.format = None
+        self._head = b''
+        self._hash = hashlib.sha256()
+        fd, self.tmp_path = tempfile.mkstemp(dir=storage.tmp_dir, suffix='.upload')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.storage.max_bytes:
+            raise UploadError(f"Файл больше {self.storage.max_bytes} байт", 413)
+        if self.format is None:
+            self._head += chunk[:16]
+            if len(self._head) >= 12:
+                self.format = sniff_format(self._head)
+                if self.format is None:
+                    raise UploadError("Поддерживаются только JPEG, PNG, GIF и WebP", 415)
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        """Переносит файл в хранилище и возвращает ключ; одинаковое содержимое хранится один раз."""
+        self._file.close()
+        if self.format is None:
+            os.remove(self.tmp_path)
+            raise UploadError("Поддерживаются только JPEG, PNG, GIF и WebP", 415)
+        key = f"{self._hash.hexdigest()}.{self.format}"
+        path = self.storage.path(key)
+        if os.path.exists(path):
+            os.remove(self.tmp_path)
+            PICTURE_UPLOADS.labels(result='duplicate').inc()
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.tmp_path, path)
+            PICTURE_UPLOADS.labels(result='stored').inc()
+        return key
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class MediaStorage:
+    """Локальное хранилище картинок по содержимому: MEDIA_ROOT/<первые 2 символа ключа>/<ключ>.
+
+    Миниатюры строятся в пуле процессов (MEDIA_WORKERS, 0 — в текущем потоке), чтобы
+    декодирование изображений не занимало воркеры веб-сервера.
+    """
+
+    def __init__(self, root, sizes=(64, 256, 512), max_bytes=10 * 1024 * 1024, workers=2,
+                 max_pixels=40_000_000):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.sizes = tuple(sorted(sizes))
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.max_pixels = max_pixels
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def open_upload(self):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return Upload(self)
+
+    def variants(self, key):
+        return {str(size): variant_key(key, size) for size in self.sizes}
+
+    def has_variants(self, key):
+        return all(os.path.exists(self.path(variant)) for variant in self.variants(key).values())
+
+    def _get_executor(self):
+        # Пул создается лениво и заново после fork (воркеры gunicorn/uvicorn)
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._executor_lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _job(self, key):
+        targets = {size: self.path(variant_key(key, size)) for size in self.sizes}
+        os.makedirs(os.path.dirname(targets[self.sizes[0]]), exist_ok=True)
+        return self.path(key), targets, self.max_pixels
+
+    def build_thumbnails(self, key):
+        """Запускает построение миниатюр и возвращает concurrent.futures.Future со словарем вариантов."""
+        started = time.perf_counter()
+        if self.workers <= 0:
+            future = Future()
+            try:
+                make_thumbnails(*self._job(key))
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self._get_executor().submit(make_thumbnails, *self._job(key))
+        result = Future()
+
+        def finish(done):
+            error = done.exception()
+            if error is None:
+                THUMBNAIL_SECONDS.observe(time.perf_counter() - started)
+                result.set_result(self.variants(key))
+            else:
+                logger.error("Thumbnail generation failed", key=key, error=str(error))
+                PICTURE_UPLOADS.labels(result='invalid').inc()
+                result.set_exception(error)
+
+        future.add_done_callback(finish)
+        return result
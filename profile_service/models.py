@@ -1,9 +1,16 @@
 #models.py
-from sqlalchemy import Column, Integer, String, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Table, JSON, Index, CheckConstraint
 from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime, timezone
 
 Base = declarative_base()
 
+def utcnow():
+    return datetime.now(timezone.utc)
+
+# Таблицей users владеет auth_service; здесь она нужна только для разрешения внешнего ключа при flush
+users_table = Table('users', Base.metadata, Column('id', Integer, primary_key=True))
+
 class Profile(Base):
     __tablename__ = 'profiles'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -14,4 +21,30 @@ class Profile(Base):
     date_of_birth = Column(Date, nullable=True)
     country = Column(String, nullable=True)
     city = Column(String, nullable=True)
-    profile_picture = Column(String, nullable=True)
\ No newline at end of file
+    profile_picture = Column(String, nullable=True)
+    # Миниатюры загруженной картинки: {"64": "/media/<sha256>-64.jpg", ...}
+    picture_variants = Column(JSON, nullable=True)
+    # Версия для ETag и If-Match: ORM увеличивает ее при каждом UPDATE и проверяет в WHERE
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    updated_at = Column(DateTime(timezone=True), nullable=True, default=utcnow, onupdate=utcnow)
+
+    __mapper_args__ = {'version_id_col': version}
+
+class Follow(Base):
+    """Ребро графа подписок. Только два столбца: PK (follower_id, followee_id) отвечает на «на кого подписан»,
+    обратный индекс (followee_id, follower_id) — на «кто подписан»; оба читаются index-only scan."""
+    __tablename__ = 'follows'
+    follower_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    followee_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+
+    __table_args__ = (
+        Index('ix_follows_followee', 'followee_id', 'follower_id'),
+        CheckConstraint('follower_id <> followee_id', name='ck_follows_not_self'),
+    )
+
+class FollowStats(Base):
+    """Денормализованные счетчики подписок; меняются в той же транзакции, что и ребро."""
+    __tablename__ = 'follow_stats'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    followers = Column(Integer, nullable=False, default=0, server_default='0')
+    following = Column(Integer, nullable=False, default=0, server_default='0')
@@ -0,0 +1,35 @@
+#patch.py
+# Частичное обновление профиля одним запросом к БД (PATCH /profile).
+# Меняются только переданные столбцы и только если значение действительно другое (IS DISTINCT FROM);
+# версия увеличивается в том же UPDATE, а RETURNING отдает строку целиком — для ответа и кэша.
+from sqlalchemy import or_, true, update
+from database import upsert_insert
+from models import Profile, utcnow
+
+profiles = Profile.__table__
+
+
+def patch_statement(dialect_name, user_id, values, versions=None):
+    """INSERT ... ON CONFLICT (user_id) DO UPDATE SET <переданные столбцы> WHERE <что-то изменилось>.
+
+    versions — версии из If-Match: тогда профиль должен существовать, и вместо upsert строится
+    UPDATE ... WHERE version IN (...); пустой список означает «*» (любая версия).
+    Если ничего не изменилось или версия не совпала, запрос не возвращает строк.
+    """
+    now = utcnow()
+    if versions is not None:
+        return (
+            update(profiles)
+            .where(profiles.c.user_id == user_id,
+                   profiles.c.version.in_(versions) if versions else true(),
+                   or_(*[profiles.c[key].is_distinct_from(value) for key, value in values.items()]))
+            .values(dict(values, version=profiles.c.version + 1, updated_at=now))
+            .returning(*profiles.c)
+        )
+    statement = upsert_insert(dialect_name, profiles).values(dict(values, user_id=user_id, updated_at=now))
+    return statement.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_=dict({key: statement.excluded[key] for key in values},
+                  version=profiles.c.version + 1, updated_at=statement.excluded.updated_at),
+        where=or_(*[profiles.c[key].is_distinct_from(statement.excluded[key]) for key in values]),
+    ).returning(*profiles.c)
@@ -0,0 +1,123 @@
+#profiling.py
+# Профилирование медленных запросов по выборке (WSGI). Включается PROFILE_SAMPLE_RATE > 0:
+# доля запросов выполняется под профайлером, и если запрос оказался дольше PROFILE_SLOW_MS,
+# профиль пишется в PROFILE_DIR.
+#   stack    — поток-семплер раз в PROFILE_INTERVAL_MS снимает стек; файл .folded в формате
+#              «кадр;кадр;кадр число» читают flamegraph.pl, speedscope и inferno
+#   cprofile — детерминированный cProfile, файл .prof для pstats/snakeviz (накладные расходы выше)
+# В ASGI-режиме не подключается: в цикле событий стек потока смешивает разные запросы.
+from collections import Counter
+from datetime import datetime, timezone
+from flask import request, g, current_app
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+import structlog
+
+logger = structlog.get_logger()
+
+MODES = ('stack', 'cprofile')
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """Стек от корня к вершине одной строкой через ';' — формат folded stacks."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Снимает стек одного потока раз в interval секунд из отдельного потока-демона."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.stacks[collapse_stack(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+def write_folded(path, stacks):
+    with open(path, 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def _profile_path(directory, suffix):
+    endpoint = re.sub(r'[^\w.-]+', '_', request.url_rule.rule if request.url_rule else request.path).strip('_')
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%f')
+    return os.path.join(directory, f"{stamp}-{request.method}-{endpoint or 'root'}{suffix}")
+
+
+def start_profile():
+    config = current_app.config
+    if random.random() >= config['PROFILE_SAMPLE_RATE']:
+        return
+    g.profile_start = time.perf_counter()
+    if config['PROFILE_MODE'] == 'cprofile':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    else:
+        g.profiler = StackSampler(threading.get_ident(), config['PROFILE_INTERVAL_MS'] / 1000).start()
+
+
+def stop_profile(exc=None):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler = profiler.stop()
+    latency_ms = (time.perf_counter() - g.profile_start) * 1000
+    config = current_app.config
+    if latency_ms < config['PROFILE_SLOW_MS']:
+        return
+    try:
+        os.makedirs(config['PROFILE_DIR'], exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            path = _profile_path(config['PROFILE_DIR'], '.prof')
+            profiler.dump_stats(path)
+        else:
+            path = _profile_path(config['PROFILE_DIR'], '.folded')
+            write_folded(path, profiler)
+    except OSError as e:
+        logger.error("Failed to write request profile", error=str(e))
+        return
+    logger.warning("Slow request profiled", path=request.path, method=request.method,
+                   latency=round(latency_ms / 1000, 6), profile=path)
+
+
+def init_profiling(app):
+    if not app.config['PROFILE_SAMPLE_RATE']:
+        return
+    if app.config['PROFILE_MODE'] not in MODES:
+        raise ValueError(f"PROFILE_MODE должен быть одним из: {', '.join(MODES)}")
+    app.before_request(start_profile)
+    app.teardown_request(stop_profile)
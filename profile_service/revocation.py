@@ -0,0 +1,162 @@
+#revocation.py
+from prometheus_client import Counter
+import hashlib
+import math
+import threading
+import time
+import structlog
+
+logger = structlog.get_logger()
+
+REVOCATION_CHECKS = Counter(
+    'jwt_revocation_checks_total',
+    'Access token revocation checks by result',
+    ['result']
+)
+
+# Ключи совпадают с auth_service/token_store.py
+REVOKED_KEY = "auth:revoked:{}"
+REVOCATIONS_STREAM = "auth:revocations"
+
+
+class BloomFilter:
+    """Bloom-фильтр на bytearray: k позиций берутся из одного SHA-256 (двойное хеширование)."""
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.sha256(item.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    """Проверка отзыва access-токена без похода в Redis для неотозванных токенов.
+
+    Отозванные jti читаются из потока auth:revocations в локальный bloom-фильтр не чаще
+    раза в sync_interval секунд. Если jti нет в фильтре, токен точно не отозван; при
+    попадании решение принимает EXISTS по denylist-ключу. Фильтр периодически
+    пересобирается: поток хранит отзывы только за срок жизни access-токена.
+    Задержка распространения отзыва — до sync_interval; при недоступности Redis
+    используется последнее известное состояние.
+    """
+
+    def __init__(self, client, sync_interval=1.0, rebuild_interval=900, capacity=100000, error_rate=0.001):
+        self.client = client
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._last_id = None
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entries(entries):
+        for entry_id, fields in entries:
+            entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+            jti = fields.get(b'jti', fields.get('jti'))
+            yield entry_id, jti.decode() if isinstance(jti, bytes) else jti
+
+    def _sync_due(self, now):
+        return now - self._synced_at >= self.sync_interval
+
+    def _start(self, now):
+        # Пересборка читает поток целиком, обычная синхронизация — только новые записи
+        rebuild = now - self._built_at >= self.rebuild_interval or self._last_id is None
+        bloom = BloomFilter(self.capacity, self.error_rate) if rebuild else self._bloom
+        return rebuild, bloom, '-' if rebuild else f"({self._last_id}"
+
+    def _finish(self, now, rebuild, bloom, last_id):
+        self._bloom = bloom
+        self._last_id = last_id or self._last_id
+        if rebuild:
+            self._built_at = now
+        self._synced_at = now
+
+    def _sync(self):
+        now = time.monotonic()
+        if not self._sync_due(now) or not self._lock.acquire(blocking=False):
+            return
+        try:
+            rebuild, bloom, start = self._start(now)
+            last_id = None
+            while True:
+                entries = self.client.xrange(REVOCATIONS_STREAM, min=start, count=1000)
+                if not entries:
+                    break
+                for last_id, jti in self._entries(entries):
+                    bloom.add(jti)
+                start = f"({last_id}"
+            self._finish(now, rebuild, bloom, last_id)
+        except Exception as e:
+            logger.warning("Token revocation stream unavailable", error=str(e))
+            self._synced_at = now
+        finally:
+            self._lock.release()
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._bloom:
+            REVOCATION_CHECKS.labels(result='bloom_negative').inc()
+            return False
+        try:
+            revoked = bool(self.client.exists(REVOKED_KEY.format(jti)))
+        except Exception as e:
+            # jti уже встречался в потоке отзывов — без Redis считаем токен отозванным
+            logger.warning("Token denylist unavailable", error=str(e))
+            REVOCATION_CHECKS.labels(result='unavailable').inc()
+            return True
+        REVOCATION_CHECKS.labels(result='revoked' if revoked else 'false_positive').inc()
+        return revoked
+
+
+class AsyncRevocationFilter(RevocationFilter):
+    """Тот же фильтр поверх redis.asyncio — для ASGI-режима (работает в одном цикле событий)."""
+
+    async def _sync(self):
+        now = time.monotonic()
+        if not self._sync_due(now):
+            return
+        # Помечаем синхронизацию начатой, чтобы параллельные корутины ее не повторяли
+        self._synced_at = now
+        try:
+            rebuild, bloom, start = self._start(now)
+            last_id = None
+            while True:
+                entries = await self.client.xrange(REVOCATIONS_STREAM, min=start, count=1000)
+                if not entries:
+                    break
+                for last_id, jti in self._entries(entries):
+                    bloom.add(jti)
+                start = f"({last_id}"
+            self._finish(now, rebuild, bloom, last_id)
+        except Exception as e:
+            logger.warning("Token revocation stream unavailable", error=str(e))
+
+    async def is_revoked(self, jti):
+        await self._sync()
+        if jti not in self._bloom:
+            REVOCATION_CHECKS.labels(result='bloom_negative').inc()
+            return False
+        try:
+            revoked = bool(await self.client.exists(REVOKED_KEY.format(jti)))
+        except Exception as e:
+            logger.warning("Token denylist unavailable", error=str(e))
+            REVOCATION_CHECKS.labels(result='unavailable').inc()
+            return True
+        REVOCATION_CHECKS.labels(result='revoked' if revoked else 'false_positive').inc()
+        return revoked
@@ -1,5 +1,7 @@
 #schemas.py
 from marshmallow import Schema, fields, validate
+from operator import attrgetter
+from models import Profile
 
 class ProfileSchema(Schema):
     first_name = fields.Str(required=False, validate=validate.Length(min=1, max=50))  
@@ -8,4 +10,24 @@ class ProfileSchema(Schema):
     date_of_birth = fields.Date(required=False)                                    
     country = fields.Str(required=False, validate=validate.Length(max=50))            
     city = fields.Str(required=False, validate=validate.Length(max=50))              
-    profile_picture = fields.Str(required=False)                                      
\ No newline at end of file
+    profile_picture = fields.Str(required=False)
+    picture_variants = fields.Dict(dump_only=True)
+    version = fields.Int(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)                                      
+
+# Схема без состояния: один экземпляр на процесс вместо создания на каждый запрос
+profile_schema = ProfileSchema()
+
+# Поля ответа в порядке profile_schema.dump (+ user_id) и соответствующие столбцы для select()
+PROFILE_FIELDS = tuple(profile_schema.fields) + ('user_id',)
+PROFILE_COLUMNS = tuple(Profile.__table__.c[name] for name in PROFILE_FIELDS)
+profile_values = attrgetter(*PROFILE_FIELDS)
+
+
+def profile_row_to_dict(row):
+    """Кортеж select(*PROFILE_COLUMNS) -> тот же словарь, что profile_schema.dump + user_id, без ORM и marshmallow."""
+    data = dict(zip(PROFILE_FIELDS, row))
+    for key in ('date_of_birth', 'updated_at'):
+        if data[key] is not None:
+            data[key] = data[key].isoformat()
+    return data
@@ -0,0 +1,76 @@
+#search.py
+from sqlalchemy import select, func, or_
+from models import Profile
+from schemas import PROFILE_COLUMNS
+import base64
+import json
+
+MAX_TERMS = 3
+
+
+class SearchError(Exception):
+    pass
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def encode_cursor(user_id):
+    return base64.urlsafe_b64encode(json.dumps({"after": user_id}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return int(data["after"])
+    except (ValueError, TypeError, KeyError):
+        raise SearchError("Некорректный курсор")
+
+
+def parse_search_args(args, default_limit=20, max_limit=100):
+    """Нормализует параметры поиска; одинаковые по смыслу запросы дают одинаковый ключ кэша."""
+    q = ' '.join(args.get('q', '').lower().split()[:MAX_TERMS])
+    country = args.get('country', '').strip().lower()
+    city = args.get('city', '').strip().lower()
+    if not (q or country or city):
+        raise SearchError("Нужен хотя бы один из параметров: q, country, city")
+    if q and min(len(term) for term in q.split()) < 2:
+        raise SearchError("Каждое слово запроса должно быть не короче 2 символов")
+    try:
+        limit = int(args.get('limit', default_limit))
+    except ValueError:
+        raise SearchError("Некорректный limit")
+    if not 1 <= limit <= max_limit:
+        raise SearchError(f"limit должен быть от 1 до {max_limit}")
+    cursor = args.get('cursor')
+    return {
+        "q": q, "country": country, "city": city, "limit": limit,
+        "after": decode_cursor(cursor) if cursor else 0,
+    }
+
+
+def search_statement(params):
+    """Запрос страницы: фильтры + seek по user_id вместо OFFSET; берется limit + 1 строк, чтобы узнать о следующей странице.
+
+    Префикс имени ищется через ILIKE — его обслуживают GIN-индексы pg_trgm по first_name/last_name,
+    страна и город — btree-индекс по (lower(country), lower(city), user_id).
+    """
+    statement = select(*PROFILE_COLUMNS).where(Profile.user_id > params["after"])
+    for term in params["q"].split():
+        pattern = _escape_like(term) + '%'
+        statement = statement.where(or_(
+            Profile.first_name.ilike(pattern, escape='\\'),
+            Profile.last_name.ilike(pattern, escape='\\'),
+        ))
+    if params["country"]:
+        statement = statement.where(func.lower(Profile.country) == params["country"])
+    if params["city"]:
+        statement = statement.where(func.lower(Profile.city) == params["city"])
+    return statement.order_by(Profile.user_id).limit(params["limit"] + 1)
+
+
+def search_page(profiles, limit, to_dict):
+    page = profiles[:limit]
+    next_cursor = encode_cursor(page[-1].user_id) if len(profiles) > limit else None
+    return {"profiles": [to_dict(profile) for profile in page], "next_cursor": next_cursor}
@@ -0,0 +1,142 @@
+#serialization.py
+# Быстрый JSON (orjson) и сжатие ответов gzip/brotli по Accept-Encoding для Flask и ASGI.
+# orjson сам сериализует date/datetime (ISO 8601) и пишет сразу bytes.
+# brotli необязателен: без пакета предлагается только gzip.
+from decimal import Decimal
+from flask import request, current_app
+from flask.json.provider import JSONProvider
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from werkzeug.http import parse_accept_header
+import zlib
+import orjson
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+COMPRESSIBLE_TYPES = ('application/json', 'application/problem+json', 'text/')
+# Сжатие на каждом запросе: быстрые уровни, почти тот же размер для JSON
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def dumps(data):
+    return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONProvider(JSONProvider):
+    """app.json на orjson: jsonify и request.get_json."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(dumps(self._prepare_response_obj(args, kwargs)), mimetype='application/json')
+
+
+def output_json(data, code, headers=None):
+    """Представление application/json для flask_restx вместо json.dumps."""
+    response = current_app.response_class(dumps(data), code, mimetype='application/json')
+    response.headers.extend(headers or {})
+    return response
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+def choose_encoding(accept_encoding):
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(ENCODINGS)
+
+
+def is_compressible(content_type):
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _has_body(status):
+    return status >= 200 and status not in (204, 304)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 — формат gzip
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress_response(response):
+    """after_request: сжимает готовый ответ не меньше COMPRESS_MIN_BYTES; потоковые ответы не трогает."""
+    if (response.direct_passthrough or response.is_streamed or not _has_body(response.status_code)
+            or 'Content-Encoding' in response.headers or not is_compressible(response.content_type)):
+        return response
+    if response.content_length is None or response.content_length < current_app.config['COMPRESS_MIN_BYTES']:
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_serialization(app):
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+
+
+class CompressionMiddleware:
+    """ASGI-вариант compress_response: ответ одним куском (more_body=False) сжимается, потоковый идет как есть."""
+
+    def __init__(self, app, minimum_size=1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        accept_encoding = next((value.decode('latin-1') for name, value in scope['headers']
+                                if name == b'accept-encoding'), None)
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if message['type'] == 'http.response.body' and start is not None:
+                headers = MutableHeaders(scope=start)
+                body = message.get('body', b'')
+                if (not message.get('more_body') and len(body) >= self.minimum_size
+                        and _has_body(start['status']) and 'content-encoding' not in headers
+                        and is_compressible(headers.get('content-type'))):
+                    body = compress(body, encoding)
+                    headers['Content-Encoding'] = encoding
+                    headers['Content-Length'] = str(len(body))
+                    headers.add_vary_header('Accept-Encoding')
+                    message = dict(message, body=body)
+                await send(start)
+                start = None
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,123 @@
+#tokens.py
+from collections import OrderedDict
+from flask_jwt_extended import JWTManager
+from jwt import PyJWKSet, InvalidSignatureError
+from prometheus_client import Counter
+import hashlib
+import os
+import threading
+import time
+
+JWT_CACHE_REQUESTS = Counter(
+    'jwt_verify_cache_requests_total',
+    'Verified JWT claims cache lookups by result',
+    ['result']
+)
+
+ASYMMETRIC_PREFIXES = ('RS', 'PS', 'ES', 'EdDSA')
+
+
+class ClaimsCache:
+    """Ограниченный LRU проверенных claims, ключ — SHA-256 токена.
+
+    Запись живет не дольше max_ttl и не дольше срока действия токена (exp).
+    """
+
+    def __init__(self, maxsize=10000, max_ttl=300):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self.digest(token)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, claims = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return dict(claims)
+
+    def put(self, token, claims):
+        expires_at = time.time() + self.max_ttl
+        if 'exp' in claims:
+            expires_at = min(expires_at, claims['exp'])
+        key = self.digest(token)
+        with self._lock:
+            self._data[key] = (expires_at, dict(claims))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager, который не проверяет подпись повторно для уже проверенных токенов."""
+
+    def __init__(self, app=None, cache_size=None, cache_ttl=None, **kwargs):
+        self.claims_cache = ClaimsCache(
+            maxsize=cache_size or int(os.getenv('JWT_CACHE_SIZE', 10000)),
+            max_ttl=cache_ttl or int(os.getenv('JWT_CACHE_TTL', 300)),
+        )
+        super().__init__(app, **kwargs)
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        # CSRF и просроченные токены всегда идут по полному пути проверки
+        if csrf_value is not None or allow_expired or self.claims_cache.maxsize <= 0:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        claims = self.claims_cache.get(encoded_token)
+        if claims is not None:
+            JWT_CACHE_REQUESTS.labels(result='hit').inc()
+            return claims
+        JWT_CACHE_REQUESTS.labels(result='miss').inc()
+
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        self.claims_cache.put(encoded_token, claims)
+        return claims
+
+
+def is_asymmetric(algorithm):
+    return algorithm.startswith(ASYMMETRIC_PREFIXES)
+
+
+def configure_verification_keys(app, jwt):
+    """Настраивает проверку подписи по открытому ключу или JWKS-файлу.
+
+    Ключи читаются с диска один раз при старте и держатся в памяти процесса.
+    """
+    algorithm = os.getenv('JWT_ALGORITHM', 'HS256')
+    app.config['JWT_ALGORITHM'] = algorithm
+    if not is_asymmetric(algorithm):
+        return
+
+    public_key_file = os.getenv('JWT_PUBLIC_KEY_FILE')
+    jwks_file = os.getenv('JWT_JWKS_FILE')
+    if public_key_file:
+        with open(public_key_file) as f:
+            app.config['JWT_PUBLIC_KEY'] = f.read()
+    elif jwks_file:
+        with open(jwks_file) as f:
+            keys = {key.key_id: key.key for key in PyJWKSet.from_json(f.read()).keys}
+
+        @jwt.decode_key_loader
+        def jwks_key_loader(jwt_header, jwt_data):
+            kid = jwt_header.get('kid')
+            if kid in keys:
+                return keys[kid]
+            if kid is None and len(keys) == 1:
+                return next(iter(keys.values()))
+            raise InvalidSignatureError("Неизвестный идентификатор ключа")
+    else:
+        raise RuntimeError("Для асимметричной подписи нужен JWT_PUBLIC_KEY_FILE или JWT_JWKS_FILE")